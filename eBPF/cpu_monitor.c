@@ -1,67 +1,201 @@
 #include <uapi/linux/ptrace.h>
 #include <linux/sched.h>
 
-// Hash maps to store CPU usage and timing information
-BPF_HASH(cpu_usage, u32, u64);          // PID -> total CPU time (ns)
-BPF_HASH(start_time, u32, u64);         // PID -> start time (ns)
-BPF_HASH(process_count, u32, u64);      // PID -> context switch count
+#ifndef MAX_CPUS
+#define MAX_CPUS 1024
+#endif
+
+// Width of a frequency bucket; bucket 0 means "frequency unknown"
+#define FREQ_BUCKET_MHZ 100
+
+// Per-thread scheduling state (scratch, not exported)
+struct thread_state_t {
+    u64 oncpu_ts;           // time scheduled in (ns)
+    u64 woken;              // woken since it last ran; counted when it is switched out
+};
+BPF_HASH(thread_state, u32, struct thread_state_t);    // TID -> state
+
+// Run-slice lengths per process, log2 buckets of microseconds. Many
+// wakeups with tiny slices keep cores out of deep idle states, which
+// costs far more than the CPU time alone suggests.
+struct slice_key_t {
+    u32 pid;
+    u32 slot;               // floor(log2(slice in us))
+};
+COUNTER_TABLE("hash", struct slice_key_t, u64, run_slices, 65536);
+
+// Current frequency of each CPU (kHz), seeded from sysfs by the loader and
+// kept up to date by the power:cpu_frequency tracepoint
+BPF_ARRAY(cpu_freq_khz, u32, MAX_CPUS);
+
+// CPU time per (process, CPU, frequency bucket)
+struct freq_key_t {
+    u32 pid;
+    u32 cpu;
+    u32 bucket;             // frequency / FREQ_BUCKET_MHZ
+};
+COUNTER_TABLE("hash", struct freq_key_t, u64, cpu_freq_time, 65536);
+
+// Charge a slice to the frequency the CPU is running at when it ends
+static inline void account_freq_time(u32 pid, u64 delta) {
+    struct freq_key_t key = {};
+    key.pid = pid;
+    key.cpu = bpf_get_smp_processor_id();
+    
+    u32 *khz = cpu_freq_khz.lookup(&key.cpu);
+    if (khz) {
+        key.bucket = *khz / (FREQ_BUCKET_MHZ * 1000);
+    }
+    
+    u64 zero = 0;
+    u64 *total = cpu_freq_time.lookup_or_try_init(&key, &zero);
+    if (total) {
+        __sync_fetch_and_add(total, delta);
+    }
+}
 
 // Tracepoint for scheduler context switches
 TRACEPOINT_PROBE(sched, sched_switch) {
-    u32 prev_pid = args->prev_pid;
-    u32 next_pid = args->next_pid;
+    u32 prev_tid = args->prev_pid;
+    u32 next_tid = args->next_pid;
     u64 ts = bpf_ktime_get_ns();
     
-    // Track time for the process being switched out (prev)
-    if (prev_pid != 0) {
-        u64 *start_ts = start_time.lookup(&prev_pid);
-        if (start_ts) {
-            // Calculate time delta since this process was scheduled
-            u64 delta = ts - *start_ts;
-            
-            // Add to total CPU time
-            u64 zero = 0;
-            u64 *total = cpu_usage.lookup_or_try_init(&prev_pid, &zero);
-            if (total) {
-                *total += delta;
+    // Track time for the thread being switched out (prev)
+    if (prev_tid != 0) {
+        // sched_switch runs in the context of prev, so this is prev's process
+        u32 prev_pid = bpf_get_current_pid_tgid() >> 32;
+        int pending;
+        struct task_stats_t *stats = task_stats_for(prev_pid, &pending);
+        
+        if (stats) {
+            struct thread_state_t *state = thread_state.lookup(&prev_tid);
+            if (state && state->oncpu_ts) {
+                u64 delta = ts - state->oncpu_ts;
+                // Threads of one process can be switched out on several CPUs at once
+                __sync_fetch_and_add(&stats->cpu_ns, delta);
+                // Processes below the activity threshold get no histogram
+                // entries either
+                if (!pending) {
+                    account_freq_time(prev_pid, delta);
+                    struct slice_key_t slice = {};
+                    slice.pid = prev_pid;
+                    // bpf_log2l() is floor(log2 v) + 1 (and 1 for v = 0), so
+                    // slot 0 also holds sub-microsecond slices
+                    slice.slot = bpf_log2l(delta / 1000) - 1;
+                    run_slices.increment(slice);
+                }
+            }
+            if (state && state->woken) {
+                // Charged here, in the woken process's own context, so the
+                // filter and threshold apply as for every other counter
+                __sync_fetch_and_add(&stats->wakeups, 1);
+                state->woken = 0;
             }
+            
+            // Increment context switch counter
+            __sync_fetch_and_add(&stats->ctx_switches, 1);
         }
-        
-        // Increment context switch counter
-        u64 zero_count = 0;
-        u64 *count = process_count.lookup_or_try_init(&prev_pid, &zero_count);
-        if (count) {
-            (*count)++;
+    }
+    
+    // Record start time for thread being switched in (next)
+    if (next_tid != 0) {
+        struct thread_state_t zero = {};
+        struct thread_state_t *state = thread_state.lookup_or_try_init(&next_tid, &zero);
+        if (state) {
+            state->oncpu_ts = ts;
         }
     }
     
-    // Record start time for process being switched in (next)
-    if (next_pid != 0) {
-        start_time.update(&next_pid, &ts);
+    return 0;
+}
+
+// A sleeping thread is made runnable. This runs in the waker's context,
+// so only flag the thread; sched_switch charges the wakeup to its process.
+TRACEPOINT_PROBE(sched, sched_wakeup) {
+    u32 tid = args->pid;
+    if (tid == 0) return 0;
+    
+    struct thread_state_t zero = {};
+    struct thread_state_t *state = thread_state.lookup_or_try_init(&tid, &zero);
+    if (state) {
+        state->woken = 1;
     }
     
     return 0;
 }
 
-// Optional: Track process creation for better tracking
+// Track frequency changes (P-state transitions)
+TRACEPOINT_PROBE(power, cpu_frequency) {
+    u32 cpu = args->cpu_id;
+    u32 khz = args->state;
+    
+    cpu_freq_khz.update(&cpu, &khz);
+    
+    return 0;
+}
+
+// Drop stale counters when a PID is reused by a new task
 TRACEPOINT_PROBE(sched, sched_process_fork) {
-    u32 parent_pid = args->parent_pid;
     u32 child_pid = args->child_pid;
     
-    // Initialize counters for new process
-    u64 zero = 0;
-    cpu_usage.update(&child_pid, &zero);
-    process_count.update(&child_pid, &zero);
+    // task_stats is keyed by live process IDs, so a freshly forked task
+    // can only match an entry left behind by an exited process
+    task_stats.delete(&child_pid);
+    task_pending.delete(&child_pid);
+    filter_verdicts.delete(&child_pid);
+    
+#ifdef TRACK_TREE
+    // Runs in the parent: children of tracked processes join the tree.
+    // New threads are added by TID too; those entries are never looked up
+    // and are removed again when the thread exits.
+    u32 parent_pid = bpf_get_current_pid_tgid() >> 32;
+    if (tracked.lookup(&parent_pid)) {
+        u8 one = 1;
+        tracked.update(&child_pid, &one);
+    }
+#endif
+    
+    return 0;
+}
+
+// Process starts, for recognising recurring jobs (pycode/job_profiles.py)
+struct exec_event_t {
+    u32 pid;
+    u64 start_ts;           // same clock as task_stats start_ts
+    char comm[TASK_COMM_LEN];
+};
+BPF_PERF_OUTPUT(exec_events);
+
+// Report each exec, when the process gets the command line it keeps
+TRACEPOINT_PROBE(sched, sched_process_exec) {
+    struct exec_event_t event = {};
+    struct task_struct *task = (struct task_struct *)bpf_get_current_task();
+    
+    event.pid = bpf_get_current_pid_tgid() >> 32;
+    event.start_ts = task->group_leader->start_boottime;
+    bpf_get_current_comm(&event.comm, sizeof(event.comm));
+    
+    exec_events.perf_submit(args, &event, sizeof(event));
+    
+    // The name changed: filter the process again on its next event
+    filter_verdicts.delete(&event.pid);
     
     return 0;
 }
 
-// Optional: Clean up on process exit
+// Clean up per-thread scratch state on exit
 TRACEPOINT_PROBE(sched, sched_process_exit) {
-    u32 pid = bpf_get_current_pid_tgid() >> 32;
+    u32 tid = bpf_get_current_pid_tgid();
+    
+    // Keep task_stats so Python can still see final stats
+    thread_state.delete(&tid);
     
-    // Don't delete, let Python handle cleanup
-    // This way we can still see final stats
+#ifdef TRACK_TREE
+    // Thread entries only; a process stays tracked so its last slices
+    // are still charged
+    if (tid != bpf_get_current_pid_tgid() >> 32)
+        tracked.delete(&tid);
+#endif
     
     return 0;
 }
@@ -0,0 +1,23 @@
+#include <uapi/linux/ptrace.h>
+#include <linux/blkdev.h>
+
+// Block I/O counters live in task_stats (see task_stats.h)
+
+// Track block requests when they are issued to the device driver.
+// Synchronous I/O is issued in the context of the process that asked for it;
+// writeback is issued by kworker/flush threads and is charged to them.
+// block_rq_complete runs in interrupt context, so it carries no owner and
+// is not needed for per-process accounting.
+TRACEPOINT_PROBE(block, block_rq_issue) {
+    u32 pid = bpf_get_current_pid_tgid() >> 32;
+    
+    if (pid == 0) return 0;  // Skip idle/swapper context
+    
+    struct task_stats_t *stats = current_task_stats(pid);
+    if (stats) {
+        __sync_fetch_and_add(&stats->io_requests, 1);
+        __sync_fetch_and_add(&stats->io_bytes, args->bytes);
+    }
+    
+    return 0;
+}
@@ -1,11 +1,17 @@
 #include <uapi/linux/ptrace.h>
 #include <net/sock.h>
+#include <linux/in6.h>
 #include <bcc/proto.h>
 
-// Hash maps for network activity tracking
-BPF_HASH(packet_count, u32, u64);       // PID -> total packet count
-BPF_HASH(bytes_sent, u32, u64);         // PID -> total bytes sent
-BPF_HASH(bytes_received, u32, u64);     // PID -> total bytes received
+// Network counters live in task_stats (see task_stats.h)
+//
+// Two attribution modes, picked at compile time by pycode/ebpf_loader.py:
+//   default             device tracepoints, one event per packet, charged
+//                       to whatever task is current (often softirq/ksoftirqd)
+//   SOCKET_ATTRIBUTION  socket-layer kprobes, one event per send/receive
+//                       call, always in the context of the owning process
+
+#ifndef SOCKET_ATTRIBUTION
 
 // Track incoming packets (receive)
 TRACEPOINT_PROBE(net, netif_receive_skb) {
@@ -13,18 +19,11 @@ TRACEPOINT_PROBE(net, netif_receive_skb) {
     
     if (pid == 0) return 0;  // Skip kernel threads
     
-    // Increment packet count
-    u64 zero = 0;
-    u64 *count = packet_count.lookup_or_try_init(&pid, &zero);
-    if (count) {
-        (*count)++;
-    }
-    
-    // Track bytes received (approximate)
-    u32 len = args->len;
-    u64 *bytes_rx = bytes_received.lookup_or_try_init(&pid, &zero);
-    if (bytes_rx) {
-        *bytes_rx += len;
+    struct task_stats_t *stats = current_task_stats(pid);
+    if (stats) {
+        __sync_fetch_and_add(&stats->rx_packets, 1);
+        // Track bytes received (approximate)
+        __sync_fetch_and_add(&stats->rx_bytes, args->len);
     }
     
     return 0;
@@ -36,23 +35,105 @@ TRACEPOINT_PROBE(net, net_dev_xmit) {
     
     if (pid == 0) return 0;  // Skip kernel threads
     
-    // Increment packet count
-    u64 zero = 0;
-    u64 *count = packet_count.lookup_or_try_init(&pid, &zero);
-    if (count) {
-        (*count)++;
+    struct task_stats_t *stats = current_task_stats(pid);
+    if (stats) {
+        __sync_fetch_and_add(&stats->tx_packets, 1);
+        // Track bytes sent (approximate)
+        __sync_fetch_and_add(&stats->tx_bytes, args->len);
     }
     
-    // Track bytes sent (approximate)
-    u32 len = args->len;
-    u64 *bytes_tx = bytes_sent.lookup_or_try_init(&pid, &zero);
-    if (bytes_tx) {
-        *bytes_tx += len;
+    return 0;
+}
+
+#else
+
+// Typical TCP payload per segment (1500 MTU - IP/TCP headers with timestamps),
+// used to turn bytes per call into an estimated packet count
+#define TCP_SEGMENT_BYTES 1448
+
+static inline void count_tx(u64 bytes, u64 packets) {
+    u32 pid = bpf_get_current_pid_tgid() >> 32;
+    if (pid == 0) return;
+    
+    struct task_stats_t *stats = current_task_stats(pid);
+    if (stats) {
+        __sync_fetch_and_add(&stats->tx_packets, packets);
+        __sync_fetch_and_add(&stats->tx_bytes, bytes);
     }
+}
+
+static inline void count_rx(u64 bytes, u64 packets) {
+    u32 pid = bpf_get_current_pid_tgid() >> 32;
+    if (pid == 0) return;
     
+    struct task_stats_t *stats = current_task_stats(pid);
+    if (stats) {
+        __sync_fetch_and_add(&stats->rx_packets, packets);
+        __sync_fetch_and_add(&stats->rx_bytes, bytes);
+    }
+}
+
+// TCP send: one call per write(), however many segments it becomes
+int kprobe__tcp_sendmsg(struct pt_regs *ctx, struct sock *sk,
+                        struct msghdr *msg, size_t size) {
+    if (size == 0) return 0;
+    count_tx(size, (size + TCP_SEGMENT_BYTES - 1) / TCP_SEGMENT_BYTES);
     return 0;
 }
 
+// TCP receive: called once per read() with the bytes copied to userspace
+int kprobe__tcp_cleanup_rbuf(struct pt_regs *ctx, struct sock *sk, int copied) {
+    if (copied <= 0) return 0;
+    count_rx(copied, (copied + TCP_SEGMENT_BYTES - 1) / TCP_SEGMENT_BYTES);
+    return 0;
+}
+
+// UDP send: one datagram per call
+int kprobe__udp_sendmsg(struct pt_regs *ctx, struct sock *sk,
+                        struct msghdr *msg, size_t len) {
+    count_tx(len, 1);
+    return 0;
+}
+
+// udpv6_sendmsg() hands datagrams for IPv4 peers (an AF_INET address or
+// a v4-mapped one, given or connected) on to udp_sendmsg(), which counts them
+static inline int sends_as_ipv4(struct sock *sk, struct msghdr *msg) {
+    struct sockaddr_in6 sin6 = {};
+    struct in6_addr daddr = {};
+    void *name = NULL;
+
+    bpf_probe_read_kernel(&name, sizeof(name), &msg->msg_name);
+    if (name) {
+        // msg_name is the kernel's sockaddr_storage copy, so reading a
+        // full sockaddr_in6 stays inside it
+        bpf_probe_read_kernel(&sin6, sizeof(sin6), name);
+        if (sin6.sin6_family == AF_INET) return 1;
+        daddr = sin6.sin6_addr;
+    } else {
+        bpf_probe_read_kernel(&daddr, sizeof(daddr), &sk->sk_v6_daddr);
+    }
+    return daddr.s6_addr32[0] == 0 && daddr.s6_addr32[1] == 0 &&
+           daddr.s6_addr32[2] == cpu_to_be32(0x0000ffff);
+}
+
+// UDP over IPv6 has its own send path (receive shares skb_consume_udp)
+int kprobe__udpv6_sendmsg(struct pt_regs *ctx, struct sock *sk,
+                          struct msghdr *msg, size_t len) {
+    if (sends_as_ipv4(sk, msg)) return 0;
+    count_tx(len, 1);
+    return 0;
+}
+
+// UDP receive: one datagram consumed per call
+int kprobe__skb_consume_udp(struct pt_regs *ctx, struct sock *sk,
+                            struct sk_buff *skb, int len) {
+    if (len < 0) return 0;
+    count_rx(len, 1);
+    return 0;
+}
+
+#endif
+
 // Optional: Track socket creation for better network monitoring
 TRACEPOINT_PROBE(sock, inet_sock_set_state) {
     u32 pid = bpf_get_current_pid_tgid() >> 32;
@@ -60,10 +141,7 @@ TRACEPOINT_PROBE(sock, inet_sock_set_state) {
     if (pid == 0) return 0;
     
     // Initialize counters for processes doing network I/O
-    u64 zero = 0;
-    packet_count.lookup_or_try_init(&pid, &zero);
-    bytes_sent.lookup_or_try_init(&pid, &zero);
-    bytes_received.lookup_or_try_init(&pid, &zero);
+    current_task_stats(pid);
     
     return 0;
 }
@@ -0,0 +1,54 @@
+#include <uapi/linux/ptrace.h>
+#include <uapi/linux/bpf_perf_event.h>
+#include <linux/sched.h>
+
+// On-CPU stack sampler, loaded on its own by pycode/profiler.py and
+// attached to a CPU-clock perf event on every CPU. Samples are counted per
+// unique (process, cgroup, user stack, kernel stack) in kernel, so
+// userspace only reads one entry per distinct stack however high the
+// sample rate.
+//
+// Optional cflags:
+//   -DTARGET_PID=<tgid>        only sample this process
+//   -DTARGET_CGROUP=<id>       only sample this cgroup (v2 cgroup ID)
+
+#ifndef STACK_ENTRIES
+#define STACK_ENTRIES 16384
+#endif
+
+struct stack_key_t {
+    u32 pid;
+    int user_stack_id;      // negative when the stack could not be read
+    int kernel_stack_id;
+    u64 cgroup_id;
+    char comm[TASK_COMM_LEN];
+};
+
+BPF_HASH(stack_counts, struct stack_key_t, u64, STACK_ENTRIES);
+BPF_STACK_TRACE(stack_traces, STACK_ENTRIES);
+
+int on_cpu_sample(struct bpf_perf_event_data *ctx) {
+    u32 pid = bpf_get_current_pid_tgid() >> 32;
+
+    // Idle task
+    if (pid == 0) return 0;
+
+#ifdef TARGET_PID
+    if (pid != TARGET_PID) return 0;
+#endif
+
+    struct stack_key_t key = {};
+    key.pid = pid;
+    key.cgroup_id = bpf_get_current_cgroup_id();
+#ifdef TARGET_CGROUP
+    if (key.cgroup_id != TARGET_CGROUP) return 0;
+#endif
+
+    bpf_get_current_comm(&key.comm, sizeof(key.comm));
+    key.user_stack_id = stack_traces.get_stackid(&ctx->regs, BPF_F_USER_STACK);
+    key.kernel_stack_id = stack_traces.get_stackid(&ctx->regs, 0);
+
+    stack_counts.increment(key);
+
+    return 0;
+}
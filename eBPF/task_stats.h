@@ -0,0 +1,185 @@
+#include <uapi/linux/ptrace.h>
+#include <linux/sched.h>
+
+// Shared by cpu_monitor.c, net_monitor.c and io_monitor.c, which pycode/ebpf_loader.py
+// compiles together into a single BPF object.
+
+// Maps that accumulate counters. With -DPIN_DIR="<dir>" (set by
+// pycode/ebpf_loader.py for --pin) each one is pinned as <dir>/<name> and
+// reused by the next load, so the counters outlive the monitor process.
+#ifdef PIN_DIR
+#define COUNTER_TABLE(_type, _key, _leaf, _name, _size) \
+    BPF_TABLE_PINNED(_type, _key, _leaf, _name, _size, PIN_DIR "/" #_name)
+#else
+#define COUNTER_TABLE(_type, _key, _leaf, _name, _size) \
+    BPF_TABLE(_type, _key, _leaf, _name, _size)
+#endif
+
+// Per-process counters. Every probe writes into the same entry so userspace
+// reads all metrics for all processes in one pass over task_stats.
+struct task_stats_t {
+    u64 cpu_ns;             // total CPU time (ns)
+    u64 ctx_switches;       // times a thread of the process was switched out
+    u64 wakeups;            // times a sleeping thread of the process was woken
+    u64 rx_packets;         // packets received
+    u64 tx_packets;         // packets sent
+    u64 rx_bytes;           // bytes received
+    u64 tx_bytes;           // bytes sent
+    u64 io_bytes;           // block I/O bytes issued
+    u64 io_requests;        // block I/O requests issued
+    u64 start_ts;           // process start time (ns since boot, CLOCK_BOOTTIME like /proc/<pid>/stat)
+};
+
+COUNTER_TABLE("hash", u32, struct task_stats_t, task_stats, 32768);   // PID (tgid) -> counters
+
+// Wall-clock time (ns) the counters started from zero: written by the
+// loader on a fresh load, kept across reloads when the maps are pinned
+COUNTER_TABLE("array", int, u64, counters_epoch, 1);
+
+#ifdef TRACK_TREE
+// Processes of the command tree being measured (pycode/measure.py). The
+// loader adds the root; sched_process_fork adds its descendants. Every
+// other task costs one failed lookup per event.
+BPF_HASH(tracked, u32, u8, 65536);      // PID (tgid) -> 1
+#endif
+
+// Task filter, written by pycode/ebpf_loader.py (apply_task_filter) and
+// changeable while the program runs. Each dimension has include and/or
+// exclude rules: an exclude rule always drops the task, and a dimension
+// with include rules drops every task that matches none of them. The
+// verdict is cached per process, so rules are only evaluated on a
+// process's first event after it starts, execs or the filter changes.
+#define FILTER_PID      1
+#define FILTER_CGROUP   2
+#define FILTER_UID      4
+#define FILTER_COMM     8
+
+#define FILTER_INCLUDE  1
+#define FILTER_EXCLUDE  2
+
+struct filter_config_t {
+    u32 generation;         // bumped on every change; older verdicts are stale
+    u32 include_mask;       // FILTER_* dimensions with include rules
+    u32 exclude_mask;       // FILTER_* dimensions with exclude rules
+    u32 pad;
+    u64 min_cpu_ns;         // CPU time before a process gets a task_stats entry
+};
+BPF_ARRAY(filter_config, struct filter_config_t, 1);
+
+struct comm_prefix_t {
+    u32 prefixlen;          // in bits, as for every LPM trie key
+    char comm[TASK_COMM_LEN];
+};
+
+BPF_HASH(filter_pids, u32, u8, 1024);                   // PID -> FILTER_INCLUDE/EXCLUDE
+BPF_HASH(filter_cgroups, u64, u8, 1024);                // cgroup v2 ID -> action
+BPF_HASH(filter_uids, u32, u8, 1024);                   // UID -> action
+BPF_LPM_TRIE(filter_comms, struct comm_prefix_t, u8, 1024);  // comm prefix -> action (longest wins)
+
+struct filter_verdict_t {
+    u32 generation;
+    u32 accept;
+};
+BPF_TABLE("lru_hash", u32, struct filter_verdict_t, filter_verdicts, 65536);
+
+// Counters of processes below min_cpu_ns. They move to task_stats once
+// the process crosses it, so short-lived and idle processes are never
+// copied to userspace; LRU eviction bounds the ones that never do.
+COUNTER_TABLE("lru_hash", u32, struct task_stats_t, task_pending, 32768);
+
+// One rule map's verdict for a dimension
+static inline int filter_rejects(struct filter_config_t *cfg, u32 dimension, u8 *action) {
+    if (action && *action == FILTER_EXCLUDE)
+        return 1;
+    return (cfg->include_mask & dimension) && !(action && *action == FILTER_INCLUDE);
+}
+
+static inline int filter_accepts(struct filter_config_t *cfg, u32 pid, struct task_struct *task) {
+    u32 rules = cfg->include_mask | cfg->exclude_mask;
+
+    if (rules & FILTER_PID) {
+        if (filter_rejects(cfg, FILTER_PID, filter_pids.lookup(&pid)))
+            return 0;
+    }
+    if (rules & FILTER_UID) {
+        u32 uid = bpf_get_current_uid_gid();
+        if (filter_rejects(cfg, FILTER_UID, filter_uids.lookup(&uid)))
+            return 0;
+    }
+    if (rules & FILTER_CGROUP) {
+        u64 cgroup = bpf_get_current_cgroup_id();
+        if (filter_rejects(cfg, FILTER_CGROUP, filter_cgroups.lookup(&cgroup)))
+            return 0;
+    }
+    if (rules & FILTER_COMM) {
+        // The process name, not the thread's (threads are often renamed)
+        struct comm_prefix_t key = {};
+        struct task_struct *leader = task->group_leader;
+        key.prefixlen = TASK_COMM_LEN * 8;
+        bpf_probe_read_kernel(&key.comm, sizeof(key.comm), leader->comm);
+        if (filter_rejects(cfg, FILTER_COMM, filter_comms.lookup(&key)))
+            return 0;
+    }
+    return 1;
+}
+
+// Look up the counters of the process, creating them on first use.
+// NULL for processes outside the measured tree when TRACK_TREE is set and
+// for filtered-out processes. *pending is set when the counters are still
+// in task_pending (below min_cpu_ns).
+static inline struct task_stats_t *task_stats_for(u32 pid, int *pending) {
+    *pending = 0;
+#ifdef TRACK_TREE
+    if (!tracked.lookup(&pid))
+        return NULL;
+#endif
+    int zero_index = 0;
+    struct filter_config_t *cfg = filter_config.lookup(&zero_index);
+    struct task_struct *task = (struct task_struct *)bpf_get_current_task();
+
+    if (cfg && (cfg->include_mask | cfg->exclude_mask)) {
+        struct filter_verdict_t *cached = filter_verdicts.lookup(&pid);
+        if (!cached || cached->generation != cfg->generation) {
+            struct filter_verdict_t verdict = {};
+            verdict.generation = cfg->generation;
+            verdict.accept = filter_accepts(cfg, pid, task);
+            filter_verdicts.update(&pid, &verdict);
+            if (!verdict.accept) {
+                // Newly filtered out: stop copying its counters too
+                task_stats.delete(&pid);
+                task_pending.delete(&pid);
+                return NULL;
+            }
+        } else if (!cached->accept) {
+            return NULL;
+        }
+    }
+
+    struct task_stats_t *stats = task_stats.lookup(&pid);
+    if (stats)
+        return stats;
+
+    struct task_stats_t zero = {};
+    zero.start_ts = task->group_leader->start_boottime;
+
+    if (cfg && cfg->min_cpu_ns) {
+        struct task_stats_t *early = task_pending.lookup_or_try_init(&pid, &zero);
+        if (!early)
+            return NULL;
+        if (early->cpu_ns < cfg->min_cpu_ns) {
+            *pending = 1;
+            return early;
+        }
+        // Crossed the threshold: move the counters so far. insert() keeps
+        // the first copy when another CPU promotes the process concurrently.
+        task_stats.insert(&pid, early);
+        task_pending.delete(&pid);
+        return task_stats.lookup(&pid);
+    }
+    return task_stats.lookup_or_try_init(&pid, &zero);
+}
+
+static inline struct task_stats_t *current_task_stats(u32 pid) {
+    int pending;
+    return task_stats_for(pid, &pending);
+}
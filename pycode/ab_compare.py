@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+A/B Energy Comparison
+Runs two commands alternately and tests whether B uses more energy than A
+
+    python3 pycode/carbon.py ab --a 'git -C old make test' --b 'git -C new make test' --runs 10
+
+Runs are interleaved in ABBA blocks, so slow drift (thermal state, other
+load, cache warm-up) affects both commands equally. Energy per run comes
+from the energy model via `carbon.py run` accounting (measure.py), or
+from the RAPL counters with --rapl. The difference of the means gets a
+bootstrap confidence interval; B fails when it is significantly more
+expensive than A by more than the threshold. The exit code is 0 for
+pass, 1 for a regression and 2 when a command fails, for use in CI.
+"""
+
+import json
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from comparison import RateChange, bootstrap_mean_delta, BOOTSTRAP_RESAMPLES, CONFIDENCE
+from measure import measure_command
+
+DEFAULT_THRESHOLD_PERCENT = 5.0
+
+
+def interleaved_order(runs: int) -> Iterator[str]:
+    """A B B A A B B A ...: each block of four cancels a linear drift"""
+    for i in range(runs):
+        yield from ('A', 'B') if i % 2 == 0 else ('B', 'A')
+
+
+def measure_run(command: str, source: str, rapl=None) -> dict:
+    """One run of a shell command; energy_j is replaced by RAPL energy when given"""
+    start = rapl.read_uj() if rapl is not None else None
+    report = measure_command(['sh', '-c', command], source)
+    if rapl is not None:
+        report['model_energy_j'] = report['energy_j']
+        report['energy_j'] = rapl.energy_since(start)
+    return report
+
+
+def run_ab(command_a: str, command_b: str, runs: int = 10, warmup: int = 1,
+           source: str = 'auto', rapl=None, verbose: bool = True) -> Dict[str, List[dict]]:
+    """
+    Measure both commands runs times each, interleaved
+    warmup: Unrecorded runs of each command first (caches, JIT, page cache)
+    Returns: {'A': [report, ...], 'B': [...]}
+    Raises: RuntimeError if a run exits non-zero
+    """
+    commands = {'A': command_a, 'B': command_b}
+    results = {'A': [], 'B': []}
+
+    for _ in range(warmup):
+        for label in ('A', 'B'):
+            measure_run(commands[label], source, rapl)
+
+    for i, label in enumerate(interleaved_order(runs), 1):
+        report = measure_run(commands[label], source, rapl)
+        if report['exit_code'] != 0:
+            raise RuntimeError(f"{label} exited with {report['exit_code']}: {commands[label]}")
+        results[label].append(report)
+        if verbose:
+            print(f"   [{i:3d}/{2 * runs}] {label}: {report['energy_j']:10.4f} J "
+                  f"in {report['duration_s']:.2f}s", file=sys.stderr)
+    return results
+
+
+def energy_change(results: Dict[str, List[dict]], resamples: int = BOOTSTRAP_RESAMPLES,
+                  confidence: float = CONFIDENCE, seed: Optional[int] = None) -> RateChange:
+    """Mean energy per run of A and B, and B - A with its confidence interval"""
+    a = np.array([[r['energy_j'] for r in results['A']]])
+    b = np.array([[r['energy_j'] for r in results['B']]])
+    delta, low, high = bootstrap_mean_delta(a, b, resamples, confidence, np.random.default_rng(seed))
+    return RateChange(float(a.mean()), float(b.mean()), float(delta[0]), float(low[0]), float(high[0]))
+
+
+def is_regression(change: RateChange, threshold_percent: float) -> bool:
+    """B is significantly more expensive, by more than the threshold"""
+    return change.low > 0 and change.percent > threshold_percent
+
+
+def display_ab(results: Dict[str, List[dict]], change: RateChange, threshold_percent: float,
+               commands: Tuple[str, str], metric: str):
+    """Summary table and verdict, in the style of EmissionComparison"""
+    from prettytable import PrettyTable
+
+    print("\n" + "="*80)
+    print(f"📊 A/B ENERGY COMPARISON ({metric})")
+    print("="*80)
+
+    table = PrettyTable()
+    table.field_names = ["", "Command", "Runs", "Energy (J)", "Std Dev (J)", "Carbon (g CO2)", "Time (s)"]
+    for label, command in zip(('A', 'B'), commands):
+        runs = results[label]
+        energy = np.array([r['energy_j'] for r in runs])
+        table.add_row([
+            label,
+            command[:30],
+            len(runs),
+            f"{energy.mean():.4f}",
+            f"{energy.std(ddof=1) if len(runs) > 1 else 0.0:.4f}",
+            f"{np.mean([r['carbon_g'] for r in runs]):.6f}",
+            f"{np.mean([r['duration_s'] for r in runs]):.2f}"
+        ])
+    print(table)
+
+    print(f"\n  ⚡ B - A: {change.delta:+.4f} J per run ({change.percent:+.2f}%), "
+          f"{CONFIDENCE:.0%} CI [{change.low:+.4f}, {change.high:+.4f}] J")
+    print(f"  📏 Threshold: +{threshold_percent:.1f}%")
+
+    if is_regression(change, threshold_percent):
+        print(f"\n  ❌ FAIL: B uses significantly more energy than A")
+    elif change.significant and change.delta < 0:
+        print(f"\n  ✅ PASS: B uses significantly less energy than A")
+    elif change.significant:
+        print(f"\n  ✅ PASS: B uses more energy, but within the threshold")
+    else:
+        print(f"\n  ✅ PASS: No significant difference")
+    print("="*80)
+
+
+def add_parser(subparsers):
+    """Register the `ab` subcommand"""
+    from energy_calc import add_model_arguments
+
+    parser = subparsers.add_parser('ab', help="compare the energy of two commands (A/B regression test)")
+    parser.add_argument('--a', required=True, metavar='CMD', help="baseline shell command")
+    parser.add_argument('--b', required=True, metavar='CMD', help="candidate shell command")
+    parser.add_argument('--runs', type=int, default=10,
+                        help="measured runs of each command (default: 10)")
+    parser.add_argument('--warmup', type=int, default=1,
+                        help="unmeasured runs of each command first (default: 1)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD_PERCENT,
+                        help=f"allowed energy increase of B in percent (default: {DEFAULT_THRESHOLD_PERCENT})")
+    parser.add_argument('--source', choices=('auto', 'ebpf', 'psutil'), default='auto',
+                        help="accounting backend (default: eBPF when root and BCC are available)")
+    parser.add_argument('--rapl', action='store_true',
+                        help="use measured RAPL energy instead of the model (whole package)")
+    parser.add_argument('--output', metavar='FILE',
+                        help="also write every run and the result as JSON")
+    add_model_arguments(parser)
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py ab`"""
+    from energy_calc import configure_from_args
+    configure_from_args(args)
+
+    rapl = None
+    if args.rapl:
+        from calibration import RaplReader
+        rapl = RaplReader()
+        if not rapl.available:
+            print("❌ No RAPL energy counters under /sys/class/powercap")
+            return 2
+
+    print(f"🔁 Running A and B {args.runs} times each (interleaved)...", file=sys.stderr)
+    try:
+        results = run_ab(args.a, args.b, args.runs, args.warmup, args.source, rapl)
+    except (RuntimeError, OSError) as e:
+        print(f"❌ {e}")
+        return 2
+
+    change = energy_change(results)
+    regression = is_regression(change, args.threshold)
+    display_ab(results, change, args.threshold, (args.a, args.b), 'RAPL' if rapl else 'energy model')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'a': args.a, 'b': args.b, 'runs': results,
+                'change': change._asdict(), 'percent': change.percent,
+                'threshold_percent': args.threshold, 'regression': regression,
+            }, f, indent=2)
+    return 1 if regression else 0
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Emission Anomaly Detector
+Streaming per-process statistics of the energy rate (W)
+
+The collectors report cumulative energy, so a long-running process keeps
+growing even when its behaviour never changes. The detector differences
+consecutive samples into a rate and keeps, per process, a handful of
+EWMA statistics (O(1) memory) to flag:
+
+    spike      - one sample far above the process's own baseline (z-score)
+    regression - several samples in a row well above a slow EWMA
+                 (the process got permanently more expensive)
+
+State of processes that disappear from a tick is evicted.
+"""
+
+import math
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+Metric = Tuple[int, int, int, float, float]   # (pid, cpu_time_ns, packets, energy, carbon)
+
+
+class Anomaly(NamedTuple):
+    pid: int
+    kind: str               # 'spike' or 'regression'
+    rate_watts: float       # current (spike) or recent average (regression) power
+    baseline_watts: float   # what the process normally draws
+    score: float            # z-score (spike) or fast/slow ratio (regression)
+    energy: float
+    carbon: float
+
+
+class _ProcessState:
+    """Per-process running statistics"""
+
+    __slots__ = ('last_energy', 'last_time', 'samples', 'mean', 'var',
+                 'fast', 'slow', 'above', 'flagged')
+
+    def __init__(self, energy: float, now: float):
+        self.last_energy = energy
+        self.last_time = now
+        self.samples = 0        # rate samples seen
+        self.mean = 0.0         # EWMA of the rate
+        self.var = 0.0          # EWMA of the squared deviation
+        self.fast = 0.0         # short-horizon EWMA (regression detection)
+        self.slow = 0.0         # long-horizon EWMA (regression detection)
+        self.above = 0          # consecutive samples well above slow
+        self.flagged = False    # regression already reported
+
+
+class AnomalyDetector:
+    """Flags abnormal energy rates per process from a stream of metrics"""
+
+    def __init__(self, alpha: float = 0.1, z_threshold: float = 4.0,
+                 fast_alpha: float = 0.3, slow_alpha: float = 0.02,
+                 regression_ratio: float = 1.5, sustain: int = 3,
+                 warmup: int = 5, min_watts: float = 0.5):
+        """
+        alpha: EWMA weight of the mean/variance used for spikes
+        z_threshold: Standard deviations above the mean that count as a spike
+        fast_alpha, slow_alpha: EWMA weights compared for regressions
+        regression_ratio: Rate/slow EWMA ratio that counts as a regression
+        sustain: Consecutive samples above the ratio before reporting
+        warmup: Rate samples needed before a process can be flagged
+        min_watts: Ignore deviations smaller than this (idle noise)
+        """
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.regression_ratio = regression_ratio
+        self.sustain = sustain
+        self.warmup = warmup
+        self.min_watts = min_watts
+        self._state: Dict[int, _ProcessState] = {}
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def update(self, metrics: Iterable[Metric], now: Optional[float] = None) -> List[Anomaly]:
+        """
+        Feed one tick of samples
+        metrics: Every process of the tick; absent PIDs are evicted
+        now: Sample time in seconds (default: time.monotonic())
+        Returns: Anomalies found in this tick, highest power first
+        """
+        if now is None:
+            now = time.monotonic()
+
+        anomalies = []
+        seen = set()
+        for pid, _, _, energy, carbon in metrics:
+            seen.add(pid)
+            anomaly = self._observe(pid, energy, carbon, now)
+            if anomaly is not None:
+                anomalies.append(anomaly)
+
+        for pid in [pid for pid in self._state if pid not in seen]:
+            del self._state[pid]
+
+        anomalies.sort(key=lambda a: a.rate_watts, reverse=True)
+        return anomalies
+
+    def _observe(self, pid: int, energy: float, carbon: float, now: float) -> Optional[Anomaly]:
+        state = self._state.get(pid)
+        if state is None or energy < state.last_energy:
+            # New process, or the PID was reused (counters went backwards)
+            self._state[pid] = _ProcessState(energy, now)
+            return None
+
+        dt = now - state.last_time
+        if dt <= 0:
+            return None
+        rate = (energy - state.last_energy) / dt
+        state.last_energy = energy
+        state.last_time = now
+
+        if state.samples == 0:
+            state.mean = state.fast = state.slow = rate
+            state.samples = 1
+            return None
+
+        anomaly = None
+        deviation = rate - state.mean
+        ready = state.samples >= self.warmup
+
+        # Spike: judged against the statistics before this sample
+        if ready and deviation > self.min_watts:
+            z = deviation / math.sqrt(state.var) if state.var > 0 else math.inf
+            if z > self.z_threshold:
+                anomaly = Anomaly(pid, 'spike', rate, state.mean, z, energy, carbon)
+
+        # West's incremental EWMA mean/variance
+        increment = self.alpha * deviation
+        state.mean += increment
+        state.var = (1 - self.alpha) * (state.var + deviation * increment)
+
+        # Regression: every recent sample well above the long-term level
+        # (a lone spike lifts the fast EWMA but not the samples after it)
+        state.fast += self.fast_alpha * (rate - state.fast)
+        state.slow += self.slow_alpha * (rate - state.slow)
+        if (rate > state.slow * self.regression_ratio
+                and rate - state.slow > self.min_watts):
+            state.above += 1
+        else:
+            state.above = 0
+            state.flagged = False
+
+        if ready and anomaly is None and state.above >= self.sustain and not state.flagged:
+            # Reported once per episode, not on every tick it lasts
+            state.flagged = True
+            ratio = state.fast / state.slow if state.slow > 0 else math.inf
+            anomaly = Anomaly(pid, 'regression', state.fast, state.slow, ratio, energy, carbon)
+
+        state.samples += 1
+        return anomaly
+
+
+def benchmark(num_processes: int = 10_000):
+    """Print the memory used per tracked process"""
+    import random
+    import tracemalloc
+
+    detector = AnomalyDetector()
+    metrics = [(pid, 0, 0, 0.0, 0.0) for pid in range(num_processes)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for tick in range(10):
+        metrics = [(pid, 0, 0, energy + random.random(), 0.0) for pid, _, _, energy, _ in metrics]
+        detector.update(metrics, now=float(tick))
+    del metrics
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    print(f"📏 {len(detector)} processes tracked: {total / 1024:.0f} KiB, "
+          f"{total / len(detector):.0f} bytes per process")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Energy Model Calibration
+Runs synthetic loads, measures them with RAPL and fits the model coefficients
+
+    python3 pycode/carbon.py calibrate                 # measure + fit
+    python3 pycode/carbon.py calibrate --from-samples samples.json
+"""
+
+import glob
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import psutil
+
+from energy_calc import DEFAULT_MODEL_FILE
+
+# Model features and the EnergyModel coefficient each one fits.
+# duration_s absorbs the static (idle) power, which is not charged to
+# processes but has to be in the fit for the other terms to be right.
+FEATURES = (
+    ('cpu_s', 'cpu_power_watts'),
+    ('packets', 'packet_energy_joules'),
+    ('io_bytes', 'io_energy_per_byte'),
+    ('io_requests', 'io_energy_per_request'),
+    ('duration_s', 'idle_watts'),
+)
+
+DISK_CHUNK_BYTES = 1024 * 1024
+
+
+class RaplReader:
+    """Reads cumulative energy from the powercap (RAPL) sysfs interface"""
+
+    def __init__(self, sysfs_root: str = '/sys'):
+        """
+        sysfs_root: Root of the sysfs tree (a fake tree can be passed for testing)
+        """
+        self.domains = []
+        pattern = os.path.join(sysfs_root, 'class/powercap/intel-rapl:*')
+        # Matches packages (intel-rapl:0) and their subdomains (intel-rapl:0:1)
+        for path in sorted(glob.glob(pattern)):
+            name = self._read(path, 'name', default='')
+            # Packages include the cores; DRAM is reported separately
+            if name.startswith('package') or name == 'dram':
+                max_range = int(self._read(path, 'max_energy_range_uj', default='0'))
+                self.domains.append((path, max_range))
+
+    @staticmethod
+    def _read(path: str, filename: str, default: str = None) -> str:
+        try:
+            with open(os.path.join(path, filename)) as f:
+                return f.read().strip()
+        except OSError:
+            if default is None:
+                raise
+            return default
+
+    @property
+    def available(self) -> bool:
+        return bool(self.domains)
+
+    def read_uj(self) -> List[int]:
+        """Current counter of every domain in microjoules"""
+        return [int(self._read(path, 'energy_uj')) for path, _ in self.domains]
+
+    def energy_since(self, start: List[int]) -> float:
+        """Joules consumed since start (handles counter wraparound)"""
+        total_uj = 0
+        for (_, max_range), before, after in zip(self.domains, start, self.read_uj()):
+            delta = after - before
+            if delta < 0 and max_range:
+                delta += max_range
+            total_uj += delta
+        return total_uj / 1_000_000
+
+
+def read_system_counters() -> Dict[str, float]:
+    """System-wide totals of the metrics the collectors charge per process"""
+    cpu = psutil.cpu_times()
+    busy_s = sum(cpu) - cpu.idle - getattr(cpu, 'iowait', 0.0)
+
+    net = psutil.net_io_counters()
+    disk = psutil.disk_io_counters()
+
+    return {
+        'cpu_s': busy_s,
+        'packets': net.packets_sent + net.packets_recv,
+        'io_bytes': (disk.read_bytes + disk.write_bytes) if disk else 0,
+        'io_requests': (disk.read_count + disk.write_count) if disk else 0,
+    }
+
+
+def _spin(deadline: float):
+    while time.time() < deadline:
+        pass
+
+
+def _udp_blast(deadline: float):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.setblocking(False)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = receiver.getsockname()
+    payload = b'x' * 64
+
+    while time.time() < deadline:
+        for _ in range(1000):
+            sender.sendto(payload, target)
+        # Drain so the socket buffer never fills up
+        try:
+            while True:
+                receiver.recv(2048)
+        except BlockingIOError:
+            pass
+
+
+def _disk_writes(deadline: float, directory: str):
+    chunk = os.urandom(DISK_CHUNK_BYTES)
+    with tempfile.NamedTemporaryFile(dir=directory) as f:
+        while time.time() < deadline:
+            f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+            if f.tell() > 256 * DISK_CHUNK_BYTES:
+                f.seek(0)
+
+
+def run_load(kind: str, level: int, duration_s: float, disk_dir: str = '.'):
+    """
+    Run a synthetic load in `level` worker processes for duration_s
+    kind: 'idle', 'cpu', 'net' or 'disk'
+    """
+    deadline = time.time() + duration_s
+
+    if kind == 'idle':
+        time.sleep(duration_s)
+        return
+
+    targets = {
+        'cpu': (_spin, (deadline,)),
+        'net': (_udp_blast, (deadline,)),
+        'disk': (_disk_writes, (deadline, disk_dir)),
+    }
+    target, target_args = targets[kind]
+
+    workers = [multiprocessing.Process(target=target, args=target_args) for _ in range(level)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def default_plan() -> List[Tuple[str, int]]:
+    """Loads to measure: idle plus each component at a few intensities"""
+    cpus = os.cpu_count() or 1
+    cpu_levels = sorted({1, max(1, cpus // 2), cpus})
+    return (
+        [('idle', 0)]
+        + [('cpu', n) for n in cpu_levels]
+        + [('net', 1), ('net', 2)]
+        + [('disk', 1), ('disk', 2)]
+    )
+
+
+def record_samples(rapl: RaplReader, duration_s: float, repeats: int = 2,
+                   disk_dir: str = '.') -> List[dict]:
+    """Run every load in the plan and record measured energy with the metrics"""
+    samples = []
+    for repeat in range(repeats):
+        for kind, level in default_plan():
+            print(f"   ▶ {kind} x{level} ({duration_s:.0f}s, round {repeat + 1}/{repeats})...")
+
+            counters_before = read_system_counters()
+            energy_before = rapl.read_uj()
+            start = time.perf_counter()
+
+            run_load(kind, level, duration_s, disk_dir)
+
+            elapsed = time.perf_counter() - start
+            energy = rapl.energy_since(energy_before)
+            counters_after = read_system_counters()
+
+            sample = {'load': kind, 'level': level, 'duration_s': elapsed, 'energy_j': energy}
+            for name in counters_before:
+                sample[name] = counters_after[name] - counters_before[name]
+            samples.append(sample)
+
+    return samples
+
+
+def fit_coefficients(samples: List[dict]) -> Tuple[Dict[str, float], dict]:
+    """
+    Least-squares fit of energy_j against the FEATURES columns.
+
+    Coefficients that come out negative are physically meaningless (usually
+    a component the loads did not excite); they are pinned to zero and the
+    rest refitted.
+
+    Returns: (coefficients by EnergyModel attribute name, fit report)
+    """
+    X = np.array([[s[feature] for feature, _ in FEATURES] for s in samples], dtype=np.float64)
+    y = np.array([s['energy_j'] for s in samples], dtype=np.float64)
+
+    # Columns span ~10 orders of magnitude (bytes vs seconds); scale them
+    scale = np.linalg.norm(X, axis=0)
+    scale[scale == 0] = 1.0
+    Xs = X / scale
+
+    active = np.ones(len(FEATURES), dtype=bool)
+    beta = np.zeros(len(FEATURES))
+    while active.any():
+        solution, *_ = np.linalg.lstsq(Xs[:, active], y, rcond=None)
+        beta[:] = 0
+        beta[active] = solution
+        if (beta >= 0).all():
+            break
+        active &= beta > 0
+
+    beta = beta / scale
+    predicted = X @ beta
+    residuals = y - predicted
+
+    ss_res = float(residuals @ residuals)
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = np.where(y > 0, np.abs(residuals) / y, 0.0)
+
+    report = {
+        'samples': len(samples),
+        'rmse_joules': float(np.sqrt(ss_res / len(y))) if len(y) else 0.0,
+        'r2': 1 - ss_res / ss_tot if ss_tot > 0 else 0.0,
+        'max_relative_error': float(relative.max()) if len(y) else 0.0,
+        'unfitted': [name for (_, name), used in zip(FEATURES, active) if not used],
+        'per_sample': [
+            {'load': s['load'], 'level': s['level'], 'measured_j': float(m), 'predicted_j': float(p)}
+            for s, m, p in zip(samples, y, predicted)
+        ],
+    }
+    coefficients = {name: float(value) for (_, name), value in zip(FEATURES, beta)}
+    return coefficients, report
+
+
+def write_model_file(path: str, coefficients: Dict[str, float], report: dict):
+    """Write the fitted coefficients in the format energy_calc.load_model_file reads"""
+    coefficients = dict(coefficients)
+    idle_watts = coefficients.pop('idle_watts')
+    # A coefficient the loads could not identify keeps the built-in default
+    for name in report['unfitted']:
+        coefficients.pop(name, None)
+
+    data = {
+        'coefficients': coefficients,
+        'idle_watts': idle_watts,
+        'fit': {k: report[k] for k in ('samples', 'rmse_joules', 'r2', 'max_relative_error')},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def display_fit(coefficients: Dict[str, float], report: dict):
+    """Print fitted coefficients and the fit error"""
+    from prettytable import PrettyTable
+
+    print("\n📐 Fitted coefficients:")
+    for name, value in coefficients.items():
+        note = "  (not identifiable, default kept)" if name in report['unfitted'] else ""
+        print(f"   {name:24s} {value:.6g}{note}")
+
+    table = PrettyTable()
+    table.field_names = ["Load", "Level", "Measured (J)", "Predicted (J)", "Error (%)"]
+    for row in report['per_sample']:
+        error = (row['predicted_j'] - row['measured_j']) / row['measured_j'] * 100 if row['measured_j'] else 0
+        table.add_row([row['load'], row['level'], f"{row['measured_j']:.2f}",
+                       f"{row['predicted_j']:.2f}", f"{error:+.1f}"])
+    print(table)
+
+    print(f"\n   RMSE: {report['rmse_joules']:.3f} J   R²: {report['r2']:.4f}   "
+          f"Max relative error: {report['max_relative_error'] * 100:.1f}%")
+
+
+def add_parser(subparsers):
+    """Register the `calibrate` subcommand"""
+    parser = subparsers.add_parser('calibrate', help="fit energy model coefficients from RAPL measurements")
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="seconds per synthetic load (default: 10)")
+    parser.add_argument('--repeats', type=int, default=2,
+                        help="rounds over all loads (default: 2)")
+    parser.add_argument('--sysfs-root', default='/sys',
+                        help="sysfs root to read RAPL counters from (default: /sys)")
+    parser.add_argument('--disk-dir', default='.',
+                        help="directory for the disk write load (must not be tmpfs)")
+    parser.add_argument('--samples-out', metavar='PATH',
+                        help="also save the raw samples as JSON")
+    parser.add_argument('--from-samples', metavar='PATH',
+                        help="fit previously saved samples instead of running loads")
+    parser.add_argument('--output', default=DEFAULT_MODEL_FILE,
+                        help=f"model file to write (default: {DEFAULT_MODEL_FILE})")
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py calibrate`"""
+    if args.from_samples:
+        with open(args.from_samples) as f:
+            samples = json.load(f)
+        print(f"📂 Loaded {len(samples)} samples from {args.from_samples}")
+    else:
+        rapl = RaplReader(args.sysfs_root)
+        if not rapl.available:
+            print(f"❌ No RAPL energy counters under {args.sysfs_root}/class/powercap")
+            print("   Calibration needs measured energy (Intel/AMD RAPL, usually root only)")
+            return 1
+
+        print(f"⚡ Calibrating against {len(rapl.domains)} RAPL domain(s)")
+        print("   Keep the machine otherwise idle while this runs.")
+        samples = record_samples(rapl, args.duration, args.repeats, args.disk_dir)
+
+        if args.samples_out:
+            with open(args.samples_out, 'w') as f:
+                json.dump(samples, f, indent=2)
+            print(f"\n💾 Samples saved to: {args.samples_out}")
+
+    if len(samples) < len(FEATURES):
+        print(f"❌ Need at least {len(FEATURES)} samples to fit, got {len(samples)}")
+        return 1
+
+    coefficients, report = fit_coefficients(samples)
+    display_fit(coefficients, report)
+
+    write_model_file(args.output, coefficients, report)
+    print(f"\n✅ Model written to: {args.output} (loaded automatically by the monitors)")
+    return 0
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+🌍 Carbon Monitor Command-Line Tools
+
+Usage:
+    python3 pycode/carbon.py calibrate [options]
+    python3 pycode/carbon.py jobs [options]
+    python3 pycode/carbon.py agent --connect HOST:PORT
+    python3 pycode/carbon.py aggregate [--listen ADDR] [--http PORT]
+    python3 pycode/carbon.py trends --history PATH [--output FILE]
+    python3 pycode/carbon.py replay TRACE [--speed N] [--chart FILE]
+    python3 pycode/carbon.py run [--output FILE] -- COMMAND [ARGS...]
+    python3 pycode/carbon.py ab --a CMD --b CMD [--runs N] [--threshold PCT]
+    sudo python3 pycode/carbon.py profile [--pid PID] [--output FILE]
+    sudo python3 pycode/carbon.py wakeups [--duration S] [--min-rate N]
+    python3 pycode/carbon.py top [--snapshot PATH] [--once]
+    sudo python3 pycode/carbon.py teardown [--dry-run]
+    python3 pycode/carbon.py policy [--policy PATH] [--strategy S] [--all]
+    python3 pycode/carbon.py scheduler [--forecast PATH] [--max-concurrent N]
+    python3 pycode/carbon.py submit [--deadline WHEN] [--duration D] -- COMMAND [ARGS...]
+    python3 pycode/carbon.py queue [--cancel ID] [--all]
+"""
+
+import sys
+sys.path.insert(0, '/usr/lib/python3/dist-packages')
+
+import argparse
+
+import ab_compare
+import calibration
+import ebpf_loader
+import fleet
+import job_profiles
+import job_queue
+import measure
+import policy
+import profiler
+import replay
+import snapshot
+import trends
+import wakeups
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='carbon', description="Carbon emission monitor tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    calibration.add_parser(subparsers)
+    job_profiles.add_parser(subparsers)
+    job_queue.add_parser(subparsers)
+    fleet.add_parser(subparsers)
+    trends.add_parser(subparsers)
+    replay.add_parser(subparsers)
+    measure.add_parser(subparsers)
+    ab_compare.add_parser(subparsers)
+    profiler.add_parser(subparsers)
+    wakeups.add_parser(subparsers)
+    snapshot.add_parser(subparsers)
+    ebpf_loader.add_parser(subparsers)
+    policy.add_parser(subparsers)
+
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,142 @@
 """
 Before/After Comparison Module
 Tracks and displays carbon emission changes
+
+Two snapshots of cumulative counters only say how much was used in total.
+When windows of samples are recorded on each side, every sampling
+interval gives one per-process rate, and the before/after rate change is
+reported with a bootstrap confidence interval, so a reduction can be told
+apart from noise.
 """
 
 import time
-from typing import List, Tuple
-from prettytable import PrettyTable
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import psutil
+
+from topk import TopKTracker, top_emitters
+
+Metric = Tuple[int, int, int, float, float]   # (pid, cpu_time_ns, packets, energy, carbon)
+Sample = Tuple[float, List[Metric]]           # (timestamp, metrics), e.g. monitor_core.Sample
+ProcessKey = Tuple[int, float]                # (pid, start_time)
+
+BOOTSTRAP_RESAMPLES = 2000
+CONFIDENCE = 0.95
+
+
+class RateChange(NamedTuple):
+    """Mean rate on each side and the change with its confidence interval"""
+    before: float
+    after: float
+    delta: float        # after - before (negative = reduction)
+    low: float
+    high: float
+
+    @property
+    def significant(self) -> bool:
+        """The interval excludes zero"""
+        return self.high < 0 or self.low > 0
+
+    @property
+    def percent(self) -> float:
+        return self.delta / self.before * 100 if self.before > 0 else 0.0
+
+
+class StartTimes:
+    """Create time of each PID, cached while the PID stays in the metrics"""
+
+    def __init__(self):
+        self._cache: Dict[int, float] = {}
+
+    def lookup(self, pids: List[int]) -> List[float]:
+        cache = {}
+        for pid in pids:
+            start = self._cache.get(pid)
+            if start is None:
+                try:
+                    start = psutil.Process(pid).create_time()
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    start = 0.0
+            cache[pid] = start
+        # Drop PIDs that left, so a reused PID gets its new create time
+        self._cache = cache
+        return [cache[pid] for pid in pids]
+
+
+def collect_window(collect: Callable[[], List[Metric]], duration: float,
+                   interval: float = 0.5) -> List[Sample]:
+    """
+    Sample a collector every interval seconds for duration seconds
+    Returns: List of (timestamp, metrics), one more than the intervals
+    """
+    samples = [(time.time(), collect())]
+    deadline = samples[0][0] + duration
+    while time.time() < deadline:
+        time.sleep(max(0.0, min(interval, deadline - time.time())))
+        samples.append((time.time(), collect()))
+    return samples
+
+
+def window_rates(samples: List[Sample], start_times=None) -> List[Dict[ProcessKey, Tuple[float, float]]]:
+    """
+    Per-interval rates of every process from consecutive samples of
+    cumulative counters
+    start_times: Object whose lookup(pids) returns their create times
+                 (default: StartTimes, reading the live system)
+    Returns: One {(pid, start_time): (watts, g CO2 per second)} per interval
+
+    Processes are matched by (pid, start_time), so a reused PID is a new
+    process. One that started inside an interval counts from zero; one
+    first seen later than its start (e.g. it crossed a collector's
+    activity threshold) has no baseline and waits for the next interval.
+    """
+    if start_times is None:
+        start_times = StartTimes()
+    previous = None
+    previous_time = 0.0
+    rates = []
+    for timestamp, metrics in samples:
+        starts = start_times.lookup([m[0] for m in metrics])
+        current = {(m[0], start): m for m, start in zip(metrics, starts)}
+        if previous is not None:
+            dt = timestamp - previous_time
+            interval = {}
+            for key, (_, _, _, energy, carbon) in current.items():
+                old = previous.get(key)
+                if old is not None and old[3] <= energy:
+                    energy -= old[3]
+                    carbon -= old[4]
+                elif key[1] <= previous_time:
+                    continue
+                if energy > 0 and dt > 0:
+                    interval[key] = (energy / dt, carbon / dt)
+            rates.append(interval)
+        previous, previous_time = current, timestamp
+    return rates
+
+
+def bootstrap_mean_delta(before: np.ndarray, after: np.ndarray,
+                         resamples: int = BOOTSTRAP_RESAMPLES, confidence: float = CONFIDENCE,
+                         rng: Optional[np.random.Generator] = None):
+    """
+    Bootstrap confidence interval of mean(after) - mean(before) for every row
+    before: (rows, intervals before), after: (rows, intervals after)
+    Returns: (delta, low, high), each of length rows
+
+    Each resample is a vector of draw counts per interval, so all rows and
+    resamples are one matrix product per side: (rows, n) @ (n, resamples).
+    """
+    rng = rng or np.random.default_rng()
+    n_before, n_after = before.shape[1], after.shape[1]
+    weights_before = rng.multinomial(n_before, np.full(n_before, 1 / n_before), resamples) / n_before
+    weights_after = rng.multinomial(n_after, np.full(n_after, 1 / n_after), resamples) / n_after
+
+    deltas = after @ weights_after.T - before @ weights_before.T
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(deltas, [tail, 100 - tail], axis=1)
+    return after.mean(axis=1) - before.mean(axis=1), low, high
+
 
 class EmissionComparison:
     """Track and compare emissions before and after reduction"""
@@ -14,29 +145,105 @@ class EmissionComparison:
     def __init__(self):
         self.before_metrics = []
         self.after_metrics = []
+        self.before_ranked = None
+        self.after_ranked = None
         self.before_total_energy = 0.0
         self.before_total_carbon = 0.0
         self.after_total_energy = 0.0
         self.after_total_carbon = 0.0
+        self.before_rates = []
+        self.after_rates = []
     
-    def record_before(self, metrics: List[Tuple[int, int, int, float, float]]):
+    def record_before(self, metrics: List[Tuple[int, int, int, float, float]],
+                      ranked: Optional[TopKTracker] = None):
         """
         Record baseline metrics before reduction
         metrics: List of (pid, cpu_time_ns, packets, energy, carbon)
+        ranked: Tracker already holding these metrics, reused for ranking
         """
         self.before_metrics = metrics.copy()
+        self.before_ranked = ranked
         self.before_total_energy = sum(m[3] for m in metrics)
         self.before_total_carbon = sum(m[4] for m in metrics)
     
-    def record_after(self, metrics: List[Tuple[int, int, int, float, float]]):
+    def record_after(self, metrics: List[Tuple[int, int, int, float, float]],
+                     ranked: Optional[TopKTracker] = None):
         """
         Record metrics after reduction
         metrics: List of (pid, cpu_time_ns, packets, energy, carbon)
+        ranked: Tracker already holding these metrics, reused for ranking
         """
         self.after_metrics = metrics.copy()
+        self.after_ranked = ranked
         self.after_total_energy = sum(m[3] for m in metrics)
         self.after_total_carbon = sum(m[4] for m in metrics)
     
+    def record_before_window(self, samples: List[Sample], ranked: Optional[TopKTracker] = None,
+                            metrics: Optional[List[Metric]] = None, start_times=None):
+        """
+        Record a window of samples before reduction; the last one is also
+        recorded as the baseline snapshot
+        samples: List of (timestamp, metrics) in time order
+        metrics: Snapshot to record instead of the last sample (e.g. the
+                 activity within the window)
+        start_times: Process create-time lookup, see window_rates()
+        """
+        self.record_before(samples[-1][1] if metrics is None else metrics, ranked=ranked)
+        self.before_rates = window_rates(samples, start_times)
+
+    def record_after_window(self, samples: List[Sample], ranked: Optional[TopKTracker] = None,
+                            metrics: Optional[List[Metric]] = None, start_times=None):
+        """
+        Record a window of samples after reduction; the last one is also
+        recorded as the after snapshot
+        samples: List of (timestamp, metrics) in time order
+        metrics: Snapshot to record instead of the last sample (e.g. the
+                 activity within the window)
+        start_times: Process create-time lookup, see window_rates()
+        """
+        self.record_after(samples[-1][1] if metrics is None else metrics, ranked=ranked)
+        self.after_rates = window_rates(samples, start_times)
+
+    def has_windows(self) -> bool:
+        """Enough intervals on both sides for confidence intervals"""
+        return len(self.before_rates) >= 2 and len(self.after_rates) >= 2
+
+    def calculate_rate_changes(self, resamples: int = BOOTSTRAP_RESAMPLES,
+                               confidence: float = CONFIDENCE, seed: Optional[int] = None) -> dict:
+        """
+        Rate changes between the recorded windows
+        Returns: {'energy': RateChange (W), 'carbon': RateChange (g CO2/s),
+                  'processes': [((pid, start_time), energy RateChange), ...]
+                  ordered by change, largest reduction first}
+        """
+        if not self.has_windows():
+            raise ValueError("record_before_window/record_after_window need 2+ intervals each")
+
+        keys = sorted(set().union(*self.before_rates, *self.after_rates))
+        index = {key: i for i, key in enumerate(keys)}
+
+        def matrices(rates):
+            # Rows: processes; columns: intervals. Absent means idle.
+            energy = np.zeros((len(keys), len(rates)))
+            carbon = np.zeros((len(keys), len(rates)))
+            for column, interval in enumerate(rates):
+                for key, (watts, carbon_rate) in interval.items():
+                    energy[index[key], column] = watts
+                    carbon[index[key], column] = carbon_rate
+            # Two extra rows for the totals, resampled together with the processes
+            return np.vstack([energy, energy.sum(axis=0), carbon.sum(axis=0)])
+
+        before = matrices(self.before_rates)
+        after = matrices(self.after_rates)
+        delta, low, high = bootstrap_mean_delta(before, after, resamples, confidence,
+                                                np.random.default_rng(seed))
+        mean_before, mean_after = before.mean(axis=1), after.mean(axis=1)
+        changes = [RateChange(mean_before[i], mean_after[i], delta[i], low[i], high[i])
+                   for i in range(len(delta))]
+
+        processes = sorted(zip(keys, changes[:len(keys)]), key=lambda item: item[1].delta)
+        return {'energy': changes[-2], 'carbon': changes[-1], 'processes': processes}
+
     def calculate_savings(self) -> dict:
         """Calculate energy and carbon savings"""
         energy_saved = self.before_total_energy - self.after_total_energy
@@ -54,6 +261,8 @@ class EmissionComparison:
     
     def display_comparison(self):
         """Display side-by-side comparison"""
+        from prettytable import PrettyTable
+        
         print("\n" + "="*80)
         print("📊 BEFORE vs AFTER COMPARISON")
         print("="*80)
@@ -64,7 +273,7 @@ class EmissionComparison:
         table_before = PrettyTable()
         table_before.field_names = ["PID", "CPU Time (ms)", "Packets", "Energy (J)", "Carbon (g CO2)"]
         
-        for pid, cpu_time_ns, packets, energy, carbon in sorted(self.before_metrics, key=lambda x: x[4], reverse=True)[:10]:
+        for pid, cpu_time_ns, packets, energy, carbon in top_emitters(self.before_metrics, 10, self.before_ranked):
             cpu_ms = cpu_time_ns / 1_000_000
             table_before.add_row([
                 pid,
@@ -85,7 +294,7 @@ class EmissionComparison:
         table_after = PrettyTable()
         table_after.field_names = ["PID", "CPU Time (ms)", "Packets", "Energy (J)", "Carbon (g CO2)"]
         
-        for pid, cpu_time_ns, packets, energy, carbon in sorted(self.after_metrics, key=lambda x: x[4], reverse=True)[:10]:
+        for pid, cpu_time_ns, packets, energy, carbon in top_emitters(self.after_metrics, 10, self.after_ranked):
             cpu_ms = cpu_time_ns / 1_000_000
             table_after.add_row([
                 pid,
@@ -109,12 +318,53 @@ class EmissionComparison:
         print(f"  🌱 Carbon Saved: {savings['carbon_saved']:.6f} g CO2 ({savings['carbon_reduction_percent']:.2f}% reduction)")
         print(f"  📉 Carbon Reduction: {savings['carbon_saved']/1000:.9f} kg CO2")
         
-        if savings['carbon_saved'] > 0:
+        if self.has_windows():
+            self.display_rate_changes()
+        elif savings['carbon_saved'] > 0:
             print(f"\n  ✅ Successfully reduced carbon emissions!")
         else:
             print(f"\n  ⚠️  No significant reduction detected (processes may have increased activity)")
         
         print("\n" + "="*80)
+
+    def display_rate_changes(self, top_n: int = 10):
+        """Rate changes with confidence intervals and the verdict"""
+        from prettytable import PrettyTable
+
+        changes = self.calculate_rate_changes()
+        energy, carbon = changes['energy'], changes['carbon']
+        level = f"{CONFIDENCE:.0%}"
+
+        print(f"\n  📐 Average rates ({len(self.before_rates)} intervals before, "
+              f"{len(self.after_rates)} after, {level} bootstrap CI):")
+        print(f"    Power:   {energy.before:.3f} W -> {energy.after:.3f} W, "
+              f"change {energy.delta:+.3f} W [{energy.low:+.3f}, {energy.high:+.3f}] ({energy.percent:+.1f}%)")
+        print(f"    Carbon:  {carbon.before * 3600:.4f} -> {carbon.after * 3600:.4f} g CO2/h, "
+              f"change {carbon.delta * 3600:+.4f} [{carbon.low * 3600:+.4f}, {carbon.high * 3600:+.4f}]")
+
+        significant = [(key, change) for key, change in changes['processes'] if change.significant]
+        if significant:
+            significant.sort(key=lambda item: -abs(item[1].delta))
+            table = PrettyTable()
+            table.field_names = ["PID", "Started", "Before (W)", "After (W)", "Change (W)", f"{level} CI (W)"]
+            for (pid, start_time), change in significant[:top_n]:
+                table.add_row([
+                    pid,
+                    time.strftime('%H:%M:%S', time.localtime(start_time)) if start_time else "-",
+                    f"{change.before:.3f}",
+                    f"{change.after:.3f}",
+                    f"{change.delta:+.3f}",
+                    f"[{change.low:+.3f}, {change.high:+.3f}]"
+                ])
+            print(f"\n  Processes with a significant change ({len(significant)}):")
+            print(table)
+
+        if energy.significant and energy.delta < 0:
+            print(f"\n  ✅ Significant reduction: {-energy.delta:.3f} W less on average")
+        elif energy.significant:
+            print(f"\n  ⚠️  Significant increase: {energy.delta:.3f} W more on average")
+        else:
+            print(f"\n  ⚠️  No significant change: the difference is within sampling noise")
     
     def display_compact_comparison(self):
         """Display compact comparison"""
@@ -135,21 +385,33 @@ class EmissionComparison:
         print(f"\n  SAVINGS:")
         print(f"    Energy:  -{savings['energy_saved']:.4f} J ({savings['energy_reduction_percent']:.1f}%)")
         print(f"    Carbon:  -{savings['carbon_saved']:.6f} g CO2 ({savings['carbon_reduction_percent']:.1f}%)")
+
+        if self.has_windows():
+            energy = self.calculate_rate_changes()['energy']
+            verdict = "significant" if energy.significant else "not significant"
+            print(f"\n  RATE ({CONFIDENCE:.0%} CI):")
+            print(f"    Power:   {energy.delta:+.3f} W [{energy.low:+.3f}, {energy.high:+.3f}], {verdict}")
         
         print("\n" + "="*60)
 
 
-def display_top_emitters(metrics: List[Tuple[int, int, int, float, float]], top_n: int = 10):
-    """Display top carbon emitters"""
+def display_top_emitters(metrics: List[Tuple[int, int, int, float, float]], top_n: int = 10,
+                         ranked: Optional[TopKTracker] = None):
+    """
+    Display top carbon emitters (ranked: tracker holding metrics, reused if given)
+    Returns: PID -> process name of the rows shown, for reuse in charts
+    """
     import psutil
+    from prettytable import PrettyTable
     
-    sorted_metrics = sorted(metrics, key=lambda x: x[4], reverse=True)[:top_n]
+    sorted_metrics = top_emitters(metrics, top_n, ranked)
     
     print(f"\n🔥 Top {top_n} Carbon Emitters:")
     print("-" * 80)
     
     table = PrettyTable()
     table.field_names = ["Rank", "PID", "Process Name", "Energy (J)", "Carbon (g CO2)"]
+    names = {}
     
     for rank, (pid, cpu_time_ns, packets, energy, carbon) in enumerate(sorted_metrics, 1):
         try:
@@ -157,6 +419,7 @@ def display_top_emitters(metrics: List[Tuple[int, int, int, float, float]], top_
             proc_name = proc.name()
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             proc_name = "Unknown"
+        names[pid] = proc_name
         
         table.add_row([
             rank,
@@ -167,3 +430,4 @@ def display_top_emitters(metrics: List[Tuple[int, int, int, float, float]], top_
         ])
     
     print(table)
+    return names
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+CPU Frequency Module
+Reads the current per-CPU frequency from sysfs
+"""
+
+import glob
+import os
+import re
+from typing import Dict
+
+
+def read_cpu_frequencies(sysfs_root: str = '/sys') -> Dict[int, int]:
+    """
+    Read scaling_cur_freq for every CPU
+    sysfs_root: Root of the sysfs tree (a fake tree can be passed for testing)
+    Returns: Dict of cpu id -> frequency in kHz (empty if cpufreq is unavailable)
+    """
+    pattern = os.path.join(sysfs_root, 'devices/system/cpu/cpu*/cpufreq/scaling_cur_freq')
+
+    frequencies = {}
+    for path in glob.glob(pattern):
+        match = re.search(r'/cpu(\d+)/cpufreq/', path)
+        if not match:
+            continue
+        try:
+            with open(path) as f:
+                frequencies[int(match.group(1))] = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+
+    return frequencies
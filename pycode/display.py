@@ -1,4 +1,3 @@
-from prettytable import PrettyTable
 import os
 
 def display_table(metrics):
@@ -8,6 +7,8 @@ def display_table(metrics):
     Args:
         metrics: List of tuples (pid, cpu_time_ns, packets, energy_j, carbon_g)
     """
+    from prettytable import PrettyTable
+    
     # Clear screen for better readability (optional)
     os.system('clear' if os.name != 'nt' else 'cls')
     
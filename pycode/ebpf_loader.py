@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+eBPF Program Loader
+Builds the CPU, network and block I/O probes into a single BPF object
+
+With pin=True the counter maps are pinned in bpffs under PIN_ROOT, in a
+directory named after a hash of the program text, compile flags and
+kernel release. The next load of the same program reuses them, so a
+restarted monitor continues counting where the last one stopped. BCC
+attaches tracepoints and kprobes through perf event file descriptors
+that cannot be pinned, so the programs are still compiled and attached
+on every load; `carbon.py teardown` removes the pinned maps.
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+import psutil
+
+from cpufreq import read_cpu_frequencies
+from energy_calc import estimate_energy, estimate_carbon, get_model
+from resident_memory import RssIntegrator, read_rss
+
+EBPF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'eBPF')
+
+# Compiled as one translation unit, in this order: the shared task_stats map
+# first, then the probes that write into it
+PROGRAM_SOURCES = ['task_stats.h', 'cpu_monitor.c', 'net_monitor.c', 'io_monitor.c']
+
+# How network traffic is attributed to processes (see net_monitor.c):
+#   device - per-packet device tracepoints (charged to the current task)
+#   socket - per-call socket kprobes (charged to the socket's owner)
+NET_ATTRIBUTION_MODES = ('device', 'socket')
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# Wall-clock time of boot, taken once so converted start times are identical
+# across ticks (they key the per-process RSS integration)
+BOOT_TIME = time.time() - time.clock_gettime(time.CLOCK_BOOTTIME)
+
+# Task filter dimensions: bit in filter_config masks and rule map (task_stats.h)
+FILTER_DIMENSIONS = {
+    'pid': (1, 'filter_pids'),
+    'cgroup': (2, 'filter_cgroups'),
+    'uid': (4, 'filter_uids'),
+    'comm': (8, 'filter_comms'),
+}
+FILTER_INCLUDE = 1
+FILTER_EXCLUDE = 2
+
+# bpffs directory holding one subdirectory of pinned maps per program build
+PIN_ROOT = '/sys/fs/bpf/carbon_monitor'
+
+# Longest comm the kernel keeps (TASK_COMM_LEN - 1)
+COMM_MAX = 15
+
+# Processes with less CPU time are not reported by the interactive monitors
+DEFAULT_MIN_CPU_NS = 50_000_000
+
+
+def build_program_text(sources: List[str] = PROGRAM_SOURCES) -> str:
+    """Concatenate the eBPF sources into one program"""
+    parts = []
+    for name in sources:
+        with open(os.path.join(EBPF_DIR, name)) as f:
+            parts.append(f"// ---- {name} ----\n{f.read()}")
+    return "\n".join(parts)
+
+
+def load_carbon_monitor(net_attribution: str = 'device', cflags: List[str] = None,
+                        task_filter: Optional['TaskFilter'] = None, pin: bool = False):
+    """
+    Compile and attach the unified carbon monitor program
+    net_attribution: 'device' or 'socket' (see NET_ATTRIBUTION_MODES)
+    task_filter: Processes to account in kernel (default: all)
+    pin: Keep the counter maps pinned in bpffs and reuse pinned ones
+         (see counters_started_at() for when they began)
+    Returns: bcc.BPF instance exposing the task_stats map
+    """
+    from bcc import BPF
+
+    if net_attribution not in NET_ATTRIBUTION_MODES:
+        raise ValueError(f"Unknown network attribution mode: {net_attribution}")
+
+    cflags = list(cflags or [])
+    if net_attribution == 'socket':
+        cflags.append('-DSOCKET_ATTRIBUTION')
+
+    text = build_program_text()
+    if pin:
+        directory = pin_directory(text, cflags)
+        os.makedirs(directory, exist_ok=True)
+        cflags.append(f'-DPIN_DIR="{directory}"')
+
+    bpf = BPF(text=text, cflags=cflags)
+    seed_cpu_frequencies(bpf)
+    epoch = bpf["counters_epoch"]
+    if epoch[epoch.Key(0)].value:
+        # Reattached to pinned maps
+        prune_exited(bpf)
+    counters_started_at(bpf)
+    if task_filter is not None:
+        apply_task_filter(bpf, task_filter)
+    return bpf
+
+
+def pin_directory(text: str, cflags: List[str], root: str = PIN_ROOT) -> str:
+    """
+    Pin directory of one program build: maps pinned by a different
+    program, flags or kernel may have another layout, so they are not reused
+    Raises: RuntimeError if bpffs is not mounted
+    """
+    bpffs = os.path.dirname(root)
+    if not os.path.ismount(bpffs):
+        raise RuntimeError(f"bpffs is not mounted at {bpffs} (mount -t bpf bpf {bpffs})")
+    digest = hashlib.sha256()
+    for part in [text, os.uname().release] + sorted(cflags):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return os.path.join(root, digest.hexdigest()[:16])
+
+
+def counters_started_at(bpf) -> float:
+    """
+    time.time() when the counters started from zero: the load time, or for
+    pinned maps the first load that created them
+    """
+    epoch = bpf["counters_epoch"]
+    key = epoch.Key(0)
+    ns = epoch[key].value
+    if ns == 0:
+        ns = time.time_ns()
+        epoch[key] = epoch.Leaf(ns)
+    return ns / 1_000_000_000
+
+
+def boot_start_ticks(pid: int) -> Optional[int]:
+    """Start time of a process in clock ticks since boot (/proc/<pid>/stat field 22)"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses
+    return int(stat[stat.rindex(b')') + 2:].split()[19])
+
+
+def prune_exited(bpf):
+    """
+    Drop pinned counters of processes that exited while no monitor was
+    attached, including those whose PID was reused since (the counters'
+    start_ts then differs from the live process's start time), since
+    sched_process_fork could not clear them
+    """
+    ns_per_tick = 1_000_000_000 / os.sysconf('SC_CLK_TCK')
+    stale = set()
+    for name in ('task_stats', 'task_pending'):
+        table = bpf[name]
+        for key, stats in list(table.items()):
+            ticks = boot_start_ticks(key.value)
+            # /proc rounds down to whole ticks
+            if ticks is None or abs(stats.start_ts // ns_per_tick - ticks) > 1:
+                stale.add(key.value)
+                del table[key]
+    live = set(psutil.pids())
+    for name in ('cpu_freq_time', 'run_slices'):
+        table = bpf[name]
+        for key in [k for k in table.keys() if k.pid in stale or k.pid not in live]:
+            del table[key]
+
+
+def teardown_pinned(root: str = PIN_ROOT, dry_run: bool = False) -> List[str]:
+    """
+    Unpin every pinned map directory under root. Running monitors keep
+    their maps until they exit.
+    Returns: The directories removed (or that would be)
+    """
+    if not os.path.isdir(root):
+        return []
+    directories = sorted(os.path.join(root, name) for name in os.listdir(root))
+    if not dry_run:
+        # Unlinking a pinned object only drops the pin; rmtree does that for each
+        shutil.rmtree(root)
+    return directories
+
+
+def seed_cpu_frequencies(bpf, sysfs_root: str = '/sys'):
+    """
+    Fill cpu_freq_khz from sysfs; the cpu_frequency tracepoint only fires
+    on the next P-state change
+    """
+    freq_map = bpf["cpu_freq_khz"]
+    for cpu, khz in read_cpu_frequencies(sysfs_root).items():
+        if cpu < len(freq_map):
+            freq_map[freq_map.Key(cpu)] = freq_map.Leaf(khz)
+
+
+def cgroup_id(path: str, root: str = CGROUP_ROOT) -> int:
+    """cgroup v2 ID of a cgroup directory (its inode number)"""
+    if not os.path.isabs(path):
+        path = os.path.join(root, path)
+    return os.stat(path).st_ino
+
+
+class TaskFilter(NamedTuple):
+    """
+    Which processes the kernel accounts (see task_stats.h)
+    include / exclude: Dimension ('pid', 'cgroup', 'uid', 'comm') -> values;
+                       cgroups are v2 IDs, comms are name prefixes
+    min_cpu_ns: CPU time before a process is copied to userspace at all
+    """
+    include: Dict[str, Set] = {}
+    exclude: Dict[str, Set] = {}
+    min_cpu_ns: int = 0
+
+
+def parse_filter_rules(rules: Iterable[str], cgroup_root: str = CGROUP_ROOT) -> Dict[str, Set]:
+    """
+    'pid:1234', 'uid:1000', 'comm:python', 'cgroup:system.slice/nginx.service'
+    -> {dimension: values}
+    Raises: ValueError for malformed rules or missing cgroups
+    """
+    parsed: Dict[str, Set] = {}
+    for rule in rules:
+        dimension, sep, value = rule.partition(':')
+        if not sep or dimension not in FILTER_DIMENSIONS or not value:
+            raise ValueError(f"Bad filter rule '{rule}' (expected pid:N, uid:N, cgroup:PATH or comm:PREFIX)")
+        if dimension == 'comm':
+            parsed.setdefault(dimension, set()).add(value[:COMM_MAX])
+        elif dimension == 'cgroup':
+            try:
+                parsed.setdefault(dimension, set()).add(cgroup_id(value, cgroup_root))
+            except OSError as e:
+                raise ValueError(f"Unknown cgroup '{value}': {e}") from None
+        else:
+            parsed.setdefault(dimension, set()).add(int(value))
+    return parsed
+
+
+def _rule_key(rule_map, dimension: str, value):
+    if dimension != 'comm':
+        return rule_map.Key(value)
+    key = rule_map.Key()
+    name = value.encode()
+    key.prefixlen = len(name) * 8
+    key.comm = name
+    return key
+
+
+def apply_task_filter(bpf, task_filter: TaskFilter):
+    """
+    Replace the in-kernel task filter of a running program. Processes
+    filtered out by the new rules lose their task_stats entries on their
+    next event; processes let back in start counting from zero.
+    """
+    include_mask = exclude_mask = 0
+    for dimension, (bit, map_name) in FILTER_DIMENSIONS.items():
+        rule_map = bpf[map_name]
+        wanted = {}     # key bytes -> (key, action); ctypes keys are not hashable
+        for action, rules in ((FILTER_INCLUDE, task_filter.include), (FILTER_EXCLUDE, task_filter.exclude)):
+            for value in rules.get(dimension, ()):
+                key = _rule_key(rule_map, dimension, value)
+                wanted[bytes(key)] = (key, action)
+                if action == FILTER_INCLUDE:
+                    include_mask |= bit
+                else:
+                    exclude_mask |= bit
+
+        # New rules first, then stale ones, so the rule set never passes
+        # through an empty state while the old generation is still live
+        for key, action in wanted.values():
+            rule_map[key] = rule_map.Leaf(action)
+        for key in list(rule_map.keys()):
+            if bytes(key) not in wanted:
+                del rule_map[key]
+
+    config_map = bpf["filter_config"]
+    config = config_map[config_map.Key(0)]
+    config.generation += 1
+    config.include_mask = include_mask
+    config.exclude_mask = exclude_mask
+    config.min_cpu_ns = int(task_filter.min_cpu_ns)
+    config_map[config_map.Key(0)] = config
+
+
+def add_filter_arguments(parser, min_cpu_ms: float = 0.0):
+    """Kernel-side task filter options"""
+    parser.add_argument('--include', action='append', default=[], metavar='RULE',
+                        help="only account matching processes: pid:N, uid:N, cgroup:PATH or comm:PREFIX "
+                             "(repeatable; a process must match one rule of each kind given)")
+    parser.add_argument('--exclude', action='append', default=[], metavar='RULE',
+                        help="never account matching processes (same rule syntax, repeatable)")
+    parser.add_argument('--min-cpu-ms', type=float, default=min_cpu_ms,
+                        help=f"CPU time before a process is reported (default: {min_cpu_ms:g})")
+
+
+def filter_from_args(args) -> TaskFilter:
+    """TaskFilter from add_filter_arguments() options; exits on bad rules"""
+    try:
+        return TaskFilter(parse_filter_rules(args.include), parse_filter_rules(args.exclude),
+                          int(args.min_cpu_ms * 1_000_000))
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+
+
+def read_task_stats(stats_map) -> List[Tuple[int, object]]:
+    """
+    Read every entry of task_stats in one pass
+    Returns: List of (pid, task_stats_t) pairs
+    """
+    try:
+        # One bpf() syscall per batch instead of two per entry (kernel >= 5.6)
+        return [(k.value, v) for k, v in stats_map.items_lookup_batch()]
+    except Exception:
+        return [(k.value, v) for k, v in stats_map.items()]
+
+
+def read_freq_histogram(freq_map) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read the (process, CPU, frequency bucket) -> ns histogram
+    Returns: (pids, cpus, buckets, ns) arrays
+    """
+    try:
+        items = list(freq_map.items_lookup_batch())
+    except Exception:
+        items = list(freq_map.items())
+
+    count = len(items)
+    pids = np.fromiter((k.pid for k, _ in items), dtype=np.int64, count=count)
+    cpus = np.fromiter((k.cpu for k, _ in items), dtype=np.int64, count=count)
+    buckets = np.fromiter((k.bucket for k, _ in items), dtype=np.int64, count=count)
+    ns = np.fromiter((v.value for _, v in items), dtype=np.int64, count=count)
+    return pids, cpus, buckets, ns
+
+
+def read_run_slices(slice_map) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read the (process, log2 slice length) -> count histogram
+    Returns: (pids, slots, counts) arrays; slot s covers [2^s, 2^(s+1)) us
+             (slot 0 also holds slices under 1 us)
+    """
+    try:
+        items = list(slice_map.items_lookup_batch())
+    except Exception:
+        items = list(slice_map.items())
+
+    count = len(items)
+    pids = np.fromiter((k.pid for k, _ in items), dtype=np.int64, count=count)
+    slots = np.fromiter((k.slot for k, _ in items), dtype=np.int64, count=count)
+    counts = np.fromiter((v.value for _, v in items), dtype=np.int64, count=count)
+    return pids, slots, counts
+
+
+# Raw task_stats counters of the active processes plus what userspace reads
+# alongside them; the energy model is applied to these rows
+# (rows_to_metrics), so recorded rows can be replayed through it
+TASK_ROW_DTYPE = np.dtype([
+    ('pid', '<i8'),
+    ('cpu_ns', '<i8'),
+    ('ctx_switches', '<i8'),
+    ('wakeups', '<i8'),
+    ('rx_packets', '<i8'),
+    ('tx_packets', '<i8'),
+    ('rx_bytes', '<i8'),
+    ('tx_bytes', '<i8'),
+    ('io_bytes', '<i8'),
+    ('io_requests', '<i8'),
+    ('rss_byte_seconds', '<f8'),    # RSS sampled from /proc and integrated, not tracked in kernel
+    ('start_time', '<f8'),          # process create time (seconds since epoch)
+])
+
+TASK_COUNTERS = ('cpu_ns', 'ctx_switches', 'wakeups', 'rx_packets', 'tx_packets',
+                 'rx_bytes', 'tx_bytes', 'io_bytes', 'io_requests')
+
+
+def task_stats_rows(entries: List[Tuple[int, object]], min_cpu_ns: int = 0,
+                    memory: Optional[RssIntegrator] = None) -> np.ndarray:
+    """
+    Counters of the active processes in task_stats entries
+
+    entries: Output of read_task_stats()
+    min_cpu_ns: Drop processes with no more CPU time than this
+                (0 keeps every process with any CPU, network or I/O activity)
+    memory: Integrator the RSS of this tick is added to, created once per
+            monitor with since=counters_started_at(); without one,
+            rss_byte_seconds is left at zero
+
+    Returns: TASK_ROW_DTYPE array
+    """
+    rows = np.zeros(len(entries), dtype=TASK_ROW_DTYPE)
+    if not entries:
+        return rows
+
+    rows['pid'] = np.fromiter((pid for pid, _ in entries), dtype=np.int64, count=len(entries))
+    for name in TASK_COUNTERS:
+        rows[name] = np.fromiter((getattr(s, name) for _, s in entries), dtype=np.int64, count=len(entries))
+    start_ts = np.fromiter((s.start_ts for _, s in entries), dtype=np.float64, count=len(entries))
+    rows['start_time'] = BOOT_TIME + start_ts / 1_000_000_000
+
+    active = rows['cpu_ns'] > min_cpu_ns
+    if min_cpu_ns == 0:
+        # Keep network- and I/O-only processes too
+        active |= (rows['rx_packets'] + rows['tx_packets'] > 0) | (rows['io_bytes'] > 0)
+    rows = rows[active]
+
+    # Resident memory is not tracked in kernel; sample it for the active
+    # processes only
+    if memory is not None:
+        rows['rss_byte_seconds'] = memory.update(rows['pid'], rows['start_time'], read_rss(rows['pid']))
+    return rows
+
+
+def rows_to_metrics(rows: np.ndarray, freq_histogram=None) -> List[Tuple[int, int, int, float, float]]:
+    """
+    Apply the energy model to task_stats_rows() output in one vectorized pass
+
+    freq_histogram: Output of read_freq_histogram(), used to weight CPU time
+                    by frequency when the model has a power curve
+
+    Returns: List of (pid, cpu_time_ns, packets, energy, carbon)
+    """
+    if len(rows) == 0:
+        return []
+
+    pids, cpu_time_ns = rows['pid'], rows['cpu_ns']
+    packets = rows['rx_packets'] + rows['tx_packets']
+
+    cpu_watts = None
+    model = get_model()
+    if freq_histogram is not None and model.cpu_power_curve is not None:
+        hist_pids, _, hist_buckets, hist_ns = freq_histogram
+        cpu_watts = model.effective_cpu_watts(pids, hist_pids, hist_buckets, hist_ns)
+
+    energy = estimate_energy(cpu_time_ns, packets, rows['io_bytes'], rows['io_requests'],
+                             rows['rss_byte_seconds'], cpu_watts, rows['wakeups'])
+    carbon = estimate_carbon(energy)
+
+    return list(zip(
+        pids.tolist(), cpu_time_ns.tolist(), packets.tolist(),
+        energy.tolist(), carbon.tolist()
+    ))
+
+
+def task_stats_to_metrics(entries: List[Tuple[int, object]], min_cpu_ns: int = 0,
+                          memory: Optional[RssIntegrator] = None,
+                          freq_histogram=None) -> List[Tuple[int, int, int, float, float]]:
+    """
+    Apply the energy model to task_stats entries
+    (task_stats_rows() followed by rows_to_metrics(), see those)
+
+    Returns: List of (pid, cpu_time_ns, packets, energy, carbon)
+    """
+    return rows_to_metrics(task_stats_rows(entries, min_cpu_ns, memory), freq_histogram)
+
+
+def add_parser(subparsers):
+    """Register the `teardown` subcommand"""
+    parser = subparsers.add_parser('teardown', help="remove the eBPF maps pinned with --pin")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only list what would be removed")
+    parser.set_defaults(func=run_teardown)
+
+
+def run_teardown(args) -> int:
+    """Entry point of `carbon.py teardown`"""
+    if os.geteuid() != 0:
+        print("❌ Error: removing pinned maps requires root privileges")
+        return 1
+
+    directories = teardown_pinned(dry_run=args.dry_run)
+    if not directories:
+        print(f"No pinned maps under {PIN_ROOT}")
+        return 0
+    for directory in directories:
+        maps = sorted(os.listdir(directory)) if args.dry_run else []
+        print(f"{'Would remove' if args.dry_run else '🗑️  Removed'} {directory}"
+              + (f" ({', '.join(maps)})" if maps else ""))
+    return 0
@@ -1,47 +1,293 @@
-def estimate_energy(cpu_time_ns, packets):
+import json
+import os
+
+import numpy as np
+
+# Storage energy per device class: transfer cost per byte plus a fixed cost
+# per block request (seek/command overhead). Rough figures from typical
+# active power and throughput (HDD ~7W @ 150MB/s, SATA SSD ~3W @ 500MB/s,
+# NVMe ~6W @ 3GB/s).
+STORAGE_CLASSES = {
+    'hdd':  {'joules_per_byte': 5e-8, 'joules_per_request': 0.01},
+    'ssd':  {'joules_per_byte': 6e-9, 'joules_per_request': 5e-5},
+    'nvme': {'joules_per_byte': 2e-9, 'joules_per_request': 2e-5},
+}
+
+# DRAM power per GB of resident memory
+MEMORY_CLASSES = {
+    'ddr4':   {'watts_per_gb': 0.375},
+    'ddr5':   {'watts_per_gb': 0.3},
+    'lpddr':  {'watts_per_gb': 0.15},
+}
+
+BYTES_PER_GB = 1024 ** 3
+
+# Must match FREQ_BUCKET_MHZ in eBPF/cpu_monitor.c
+FREQ_BUCKET_MHZ = 100
+
+# Written by `carbon.py calibrate` and loaded at startup when present
+DEFAULT_MODEL_FILE = 'energy_model.json'
+
+# EnergyModel attributes a model file may override
+MODEL_COEFFICIENTS = (
+    'cpu_power_watts',
+    'packet_energy_joules',
+    'io_energy_per_byte',
+    'io_energy_per_request',
+    'memory_watts_per_gb',
+    'wakeup_energy_joules',
+    'carbon_intensity',
+)
+
+
+class CpuPowerCurve:
+    """
+    Per-core power draw as a function of frequency.
+
+    Points come from a calibration file; power between points is
+    interpolated linearly and clamped at both ends.
+    """
+
+    def __init__(self, freq_mhz, watts):
+        order = np.argsort(freq_mhz)
+        self.freq_mhz = np.asarray(freq_mhz, dtype=np.float64)[order]
+        self.watts = np.asarray(watts, dtype=np.float64)[order]
+
+    def watts_at(self, freq_mhz):
+        """Power in W at the given frequency (scalar or array, MHz)"""
+        return np.interp(freq_mhz, self.freq_mhz, self.watts)
+
+
+def load_model_file(path):
+    """
+    Read an energy model calibration file (JSON).
+
+    Recognised keys:
+        "coefficients": {name: value} for any of MODEL_COEFFICIENTS
+        "cpu_power_curve": {"freq_mhz": [...], "watts": [...]}
+
+    Returns: Dict of EnergyModel keyword arguments
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    kwargs = {}
+    coefficients = data.get('coefficients')
+    if coefficients:
+        unknown = set(coefficients) - set(MODEL_COEFFICIENTS)
+        if unknown:
+            raise ValueError(f"Unknown coefficients in {path}: {', '.join(sorted(unknown))}")
+        kwargs['coefficients'] = coefficients
+
+    curve = data.get('cpu_power_curve')
+    if curve:
+        kwargs['cpu_power_curve'] = CpuPowerCurve(curve['freq_mhz'], curve['watts'])
+    return kwargs
+
+
+class EnergyModel:
+    """
+    Linear energy model: each component is a metric times a coefficient.
+
+    All estimate_* methods are plain arithmetic, so they accept scalars or
+    NumPy arrays (one element per process) alike.
+    """
+
+    def __init__(self, storage_class='ssd', memory_class='ddr4', cpu_power_curve=None,
+                 coefficients=None):
+        # Average CPU power consumption: ~15W per core (conservative estimate)
+        self.cpu_power_watts = 15
+
+        # Optional CpuPowerCurve; without one every CPU second costs cpu_power_watts
+        self.cpu_power_curve = cpu_power_curve
+
+        # Network packet energy: ~0.0001 Joules per packet (conservative)
+        self.packet_energy_joules = 0.0001
+
+        storage = STORAGE_CLASSES[storage_class]
+        self.storage_class = storage_class
+        self.io_energy_per_byte = storage['joules_per_byte']
+        self.io_energy_per_request = storage['joules_per_request']
+
+        memory = MEMORY_CLASSES[memory_class]
+        self.memory_class = memory_class
+        self.memory_watts_per_gb = memory['watts_per_gb']
+
+        # Wakeup energy: ~50 microjoules per wakeup for leaving a deep idle
+        # state, refilling caches and going back to sleep, none of which
+        # shows up as CPU time (rough figure; calibrate per machine)
+        self.wakeup_energy_joules = 0.00005
+
+        # Global average carbon intensity: ~475 grams CO2 per kWh
+        # (varies by region, this is a global average)
+        self.carbon_intensity = 475
+
+        # Calibrated values (see calibration.py) override the defaults above
+        for name, value in (coefficients or {}).items():
+            setattr(self, name, value)
+
+    def cpu_watts_at(self, freq_mhz):
+        """
+        Per-core power at the given frequencies (MHz, array).
+        Unknown frequencies (0) and models without a curve use cpu_power_watts.
+        """
+        freq_mhz = np.asarray(freq_mhz, dtype=np.float64)
+        if self.cpu_power_curve is None:
+            return np.full(freq_mhz.shape, float(self.cpu_power_watts))
+        return np.where(freq_mhz > 0, self.cpu_power_curve.watts_at(freq_mhz), self.cpu_power_watts)
+
+    def effective_cpu_watts(self, pids, hist_pids, hist_buckets, hist_ns):
+        """
+        Average per-core power of each process, weighted by the time it
+        spent in each frequency bucket.
+
+        Args:
+            pids: Processes to compute power for (array)
+            hist_pids, hist_buckets, hist_ns: (process, frequency bucket)
+                histogram rows, e.g. from the cpu_freq_time map
+
+        Returns:
+            Array of W, one per entry of pids (cpu_power_watts where the
+            histogram has no data)
+        """
+        pids = np.asarray(pids, dtype=np.int64)
+        result = np.full(len(pids), float(self.cpu_power_watts))
+        if self.cpu_power_curve is None or len(pids) == 0 or len(hist_pids) == 0:
+            return result
+
+        # Map every histogram row to the index of its process in pids
+        sorter = np.argsort(pids)
+        pos = np.searchsorted(pids, hist_pids, sorter=sorter).clip(max=len(pids) - 1)
+        index = sorter[pos]
+        known = pids[index] == hist_pids
+
+        hist_ns = np.asarray(hist_ns, dtype=np.float64)[known]
+        freq_mhz = np.asarray(hist_buckets, dtype=np.float64)[known] * FREQ_BUCKET_MHZ
+        # Bucket midpoint; bucket 0 stays 0 (unknown frequency)
+        freq_mhz = np.where(freq_mhz > 0, freq_mhz + FREQ_BUCKET_MHZ / 2, 0)
+        index = index[known]
+
+        watt_ns = np.bincount(index, weights=hist_ns * self.cpu_watts_at(freq_mhz), minlength=len(pids))
+        total_ns = np.bincount(index, weights=hist_ns, minlength=len(pids))
+
+        has_data = total_ns > 0
+        result[has_data] = watt_ns[has_data] / total_ns[has_data]
+        return result
+
+    def estimate_energy(self, cpu_time_ns, packets, io_bytes=0, io_requests=0, rss_byte_seconds=0,
+                        cpu_watts=None, wakeups=0):
+        """
+        Calculate energy consumption from process activity.
+
+        Args:
+            cpu_time_ns: CPU time in nanoseconds
+            packets: Number of network packets
+            io_bytes: Block I/O bytes read + written
+            io_requests: Block I/O requests issued
+            rss_byte_seconds: Resident memory integrated over time (bytes x s)
+            cpu_watts: Per-core power while running (default: cpu_power_watts),
+                e.g. from effective_cpu_watts()
+            wakeups: Times the process was woken from sleep
+
+        Returns:
+            Energy in Joules
+        """
+        if cpu_watts is None:
+            cpu_watts = self.cpu_power_watts
+
+        # Energy from CPU: Power (W) * Time (s) = Joules
+        cpu_energy = cpu_watts * (cpu_time_ns / 1_000_000_000)
+
+        packet_energy = self.packet_energy_joules * packets
+
+        io_energy = self.io_energy_per_byte * io_bytes + self.io_energy_per_request * io_requests
+
+        # DRAM: Power (W/GB) * GB * Time (s) = Joules
+        memory_energy = self.memory_watts_per_gb * (rss_byte_seconds / BYTES_PER_GB)
+
+        wakeup_energy = self.wakeup_energy_joules * wakeups
+
+        return cpu_energy + packet_energy + io_energy + memory_energy + wakeup_energy
+
+    def estimate_carbon(self, energy_joules):
+        """
+        Estimate carbon emissions from energy consumption.
+
+        Args:
+            energy_joules: Energy in Joules
+
+        Returns:
+            Carbon emissions in grams of CO2
+        """
+        # Convert Joules to kWh: 1 kWh = 3,600,000 J
+        energy_kwh = energy_joules / 3_600_000
+
+        return energy_kwh * self.carbon_intensity
+
+
+# Model used by the module-level helpers below
+_model = EnergyModel()
+
+
+def get_model():
+    """Return the energy model used by estimate_energy/estimate_carbon"""
+    return _model
+
+
+def set_model(model):
+    """Replace the energy model used by estimate_energy/estimate_carbon"""
+    global _model
+    _model = model
+
+
+def add_model_arguments(parser):
+    """Add energy model options to an argparse parser"""
+    parser.add_argument('--storage-class', choices=sorted(STORAGE_CLASSES), default='ssd',
+                        help="storage device class for block I/O energy (default: ssd)")
+    parser.add_argument('--memory-class', choices=sorted(MEMORY_CLASSES), default='ddr4',
+                        help="memory class for DRAM energy (default: ddr4)")
+    parser.add_argument('--model-file', metavar='PATH',
+                        help=f"calibrated model file (JSON, default: {DEFAULT_MODEL_FILE} if present)")
+
+
+def configure_from_args(args):
+    """Install the energy model selected on the command line"""
+    model_file = args.model_file
+    if model_file is None and os.path.exists(DEFAULT_MODEL_FILE):
+        model_file = DEFAULT_MODEL_FILE
+
+    kwargs = load_model_file(model_file) if model_file else {}
+    set_model(EnergyModel(storage_class=args.storage_class, memory_class=args.memory_class, **kwargs))
+
+
+def estimate_energy(cpu_time_ns, packets, io_bytes=0, io_requests=0, rss_byte_seconds=0,
+                    cpu_watts=None, wakeups=0):
     """
-    Calculate energy consumption based on CPU time and network packets.
-    
+    Calculate energy consumption based on process activity.
+
     Args:
         cpu_time_ns: CPU time in nanoseconds
         packets: Number of network packets
-    
+        io_bytes: Block I/O bytes read + written
+        io_requests: Block I/O requests issued
+        rss_byte_seconds: Resident memory integrated over time (bytes x s)
+        cpu_watts: Per-core power while running (default: model constant)
+        wakeups: Times the process was woken from sleep
+
     Returns:
         Energy in Joules
     """
-    # Convert nanoseconds to seconds
-    cpu_time_s = cpu_time_ns / 1_000_000_000
-    
-    # Average CPU power consumption: ~15W per core (conservative estimate)
-    cpu_power_watts = 15
-    
-    # Energy from CPU: Power (W) * Time (s) = Joules
-    cpu_energy = cpu_power_watts * cpu_time_s
-    
-    # Network packet energy: ~0.0001 Joules per packet (conservative)
-    packet_energy_per_packet = 0.0001
-    packet_energy = packet_energy_per_packet * packets
-    
-    total_energy = cpu_energy + packet_energy
-    return total_energy
+    return _model.estimate_energy(cpu_time_ns, packets, io_bytes, io_requests, rss_byte_seconds,
+                                  cpu_watts, wakeups)
 
 def estimate_carbon(energy_joules):
     """
     Estimate carbon emissions from energy consumption.
-    
+
     Args:
         energy_joules: Energy in Joules
-    
+
     Returns:
         Carbon emissions in grams of CO2
     """
-    # Convert Joules to kWh: 1 kWh = 3,600,000 J
-    energy_kwh = energy_joules / 3_600_000
-    
-    # Global average carbon intensity: ~475 grams CO2 per kWh
-    # (varies by region, this is a global average)
-    carbon_intensity = 475  # grams CO2 per kWh
-    
-    carbon_grams = energy_kwh * carbon_intensity
-    return carbon_grams
-
+    return _model.estimate_carbon(energy_joules)
@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""
+Fleet Aggregation
+Agents ship per-tick snapshots to a central aggregator for a fleet view
+
+    python3 pycode/carbon.py aggregate --listen 0.0.0.0:7070 --http 8080
+    python3 pycode/carbon.py agent --connect collector:7070
+
+Wire format: length-prefixed frames (u32, network order) of zlib-compressed
+payloads. A payload carries one host's pending snapshots:
+
+    header    magic 'CCF1', host name length (u16), snapshot count (u16)
+    host      UTF-8 host name
+    snapshot  timestamp (f64), row count (u32), rows (ROW_DTYPE, big endian)
+
+Memory is bounded on both ends: the agent keeps at most max_pending
+snapshots and drops the oldest when the aggregator cannot keep up; the
+aggregator caps hosts and rows per host, and stops reading connections
+while the frames waiting to be merged exceed a byte budget, which pushes
+back through TCP to the agents.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from comparison import StartTimes
+from topk import TopKTracker
+
+MAGIC = b'CCF1'
+LENGTH = struct.Struct('!I')
+HEADER = struct.Struct('!4sHH')
+SNAPSHOT = struct.Struct('!dI')
+
+ROW_DTYPE = np.dtype([
+    ('pid', '>u4'),
+    ('start_time', '>f8'),      # process create time, seconds since epoch
+    ('cpu_time_ns', '>u8'),
+    ('packets', '>u8'),
+    ('energy', '>f8'),
+    ('carbon', '>f8'),
+])
+
+# Reject frames larger than this, compressed and uncompressed
+MAX_FRAME_BYTES = 4 * 1024 * 1024
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024
+
+# Compressed frame bytes read but not yet merged, across all agents
+MAX_QUEUED_BYTES = 32 * 1024 * 1024
+
+DEFAULT_PORT = 7070
+
+
+def parse_address(address: str) -> Tuple[str, object]:
+    """
+    'unix:/path/to/socket' -> ('unix', path)
+    'host:port' or 'port'  -> ('tcp', (host, port))
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port or DEFAULT_PORT))
+
+
+def encode_frame(host: str, snapshots: List[Tuple[float, np.ndarray]], level: int = 6) -> bytes:
+    """
+    Build one frame from (timestamp, rows) snapshots of a host
+    rows: Array of ROW_DTYPE
+    """
+    host_bytes = host.encode()
+    parts = [HEADER.pack(MAGIC, len(host_bytes), len(snapshots)), host_bytes]
+    for timestamp, rows in snapshots:
+        parts.append(SNAPSHOT.pack(timestamp, len(rows)))
+        parts.append(rows.astype(ROW_DTYPE, copy=False).tobytes())
+
+    payload = zlib.compress(b''.join(parts), level)
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode_payload(payload: bytes) -> Tuple[str, List[Tuple[float, np.ndarray]]]:
+    """
+    Inverse of encode_frame (without the length prefix)
+    Raises ValueError on malformed or oversized payloads
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, MAX_PAYLOAD_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"corrupt frame: {e}")
+    if decompressor.unconsumed_tail:
+        raise ValueError("frame payload too large")
+
+    if len(data) < HEADER.size:
+        raise ValueError("truncated frame")
+    magic, host_len, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("bad frame magic")
+    offset = HEADER.size
+    host = data[offset:offset + host_len].decode(errors='replace')
+    offset += host_len
+
+    snapshots = []
+    for _ in range(count):
+        if offset + SNAPSHOT.size > len(data):
+            raise ValueError("truncated frame")
+        timestamp, num_rows = SNAPSHOT.unpack_from(data, offset)
+        offset += SNAPSHOT.size
+        end = offset + num_rows * ROW_DTYPE.itemsize
+        if end > len(data):
+            raise ValueError("truncated frame")
+        snapshots.append((timestamp, np.frombuffer(data, dtype=ROW_DTYPE, count=num_rows, offset=offset)))
+        offset = end
+    return host, snapshots
+
+
+def metrics_to_rows(metrics, start_times: List[float]) -> np.ndarray:
+    """(pid, cpu_time_ns, packets, energy, carbon) tuples -> ROW_DTYPE array"""
+    rows = np.empty(len(metrics), dtype=ROW_DTYPE)
+    if metrics:
+        pid, cpu_time_ns, packets, energy, carbon = zip(*metrics)
+        rows['pid'] = pid
+        rows['start_time'] = start_times
+        rows['cpu_time_ns'] = cpu_time_ns
+        rows['packets'] = packets
+        rows['energy'] = energy
+        rows['carbon'] = carbon
+    return rows
+
+
+def connect(address: str, timeout: float = 5.0) -> socket.socket:
+    kind, target = parse_address(address)
+    family = socket.AF_UNIX if kind == 'unix' else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(target)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class FleetAgent:
+    """
+    Ships snapshots to an aggregator from a background sender thread.
+
+    submit() never blocks the collection loop: snapshots wait in a bounded
+    queue, the sender packs everything pending into one frame, and when the
+    aggregator is slow or down the oldest snapshots are dropped.
+    """
+
+    def __init__(self, address: str, host: Optional[str] = None, batch_ticks: int = 1,
+                 max_pending: int = 64, level: int = 6):
+        """
+        address: Aggregator address (see parse_address)
+        host: Name reported for this machine (default: hostname)
+        batch_ticks: Snapshots to collect before sending a frame
+        max_pending: Snapshots kept while the aggregator is unreachable
+        level: zlib compression level
+        """
+        self.address = address
+        self.host = host or socket.gethostname()
+        self.batch_ticks = max(1, batch_ticks)
+        self.level = level
+        self.sent = 0
+        self.dropped = 0
+
+        self._pending = collections.deque(maxlen=max_pending)
+        self._start_times = StartTimes()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._sock = None
+        self._thread = threading.Thread(target=self._run, name='fleet-agent', daemon=True)
+        self._thread.start()
+
+    def submit(self, metrics, timestamp: Optional[float] = None):
+        """Queue one tick of (pid, cpu_time_ns, packets, energy, carbon)"""
+        pids = [m[0] for m in metrics]
+        rows = metrics_to_rows(metrics, self._start_times.lookup(pids))
+        with self._cond:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append((timestamp or time.time(), rows))
+            if len(self._pending) >= self.batch_ticks:
+                self._cond.notify()
+
+    def close(self, timeout: float = 5.0):
+        """Send what is pending (best effort) and stop"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            with self._cond:
+                while not self._closed and len(self._pending) < self.batch_ticks:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = list(self._pending)
+                self._pending.clear()
+
+            frame = encode_frame(self.host, batch, self.level)
+            try:
+                if self._sock is None:
+                    self._sock = connect(self.address)
+                    self._sock.settimeout(None)
+                # Blocks while the aggregator pushes back; submit() keeps queueing
+                self._sock.sendall(frame)
+                self.sent += len(batch)
+                backoff = 1.0
+            except OSError as e:
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+                with self._cond:
+                    # Put the batch back in front of newer snapshots (oldest
+                    # fall off if the queue is full)
+                    room = self._pending.maxlen - len(self._pending)
+                    self.dropped += max(0, len(batch) - room)
+                    self._pending.extendleft(reversed(batch[len(batch) - room:] if room else []))
+                    if self._closed:
+                        return
+                print(f"  ⚠️  Aggregator {self.address} unreachable ({e}), retrying in {backoff:.0f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+class FleetAggregator:
+    """Merges agent streams into a fleet-wide view of processes"""
+
+    def __init__(self, max_hosts: int = 1024, max_rows_per_host: int = 65536,
+                 stale_after: float = 30.0, queue_bytes: int = MAX_QUEUED_BYTES):
+        """
+        max_hosts: Hosts tracked at once; further hosts are ignored
+        max_rows_per_host: Keep only this many of a host's heaviest processes
+        stale_after: Forget hosts silent for this many seconds
+        queue_bytes: Frame bytes waiting to be merged before readers pause
+        """
+        self.max_hosts = max_hosts
+        self.max_rows_per_host = max_rows_per_host
+        self.stale_after = stale_after
+        self.queue_bytes = max(queue_bytes, MAX_FRAME_BYTES)
+
+        # Rows are keyed by (host, pid, start_time), so PIDs of different
+        # hosts never collide and a resent snapshot overwrites itself
+        self.tracker = TopKTracker()
+        self.hosts: Dict[str, dict] = {}
+        self.frames = 0
+        self.rejected = 0
+        self._queue = None
+        self._queued_bytes = 0
+        self._room = None
+
+    def merge(self, host: str, snapshots: List[Tuple[float, np.ndarray]]):
+        """Apply a host's snapshots"""
+        if not snapshots:
+            return
+        # Counters are cumulative and every snapshot lists all of the host's
+        # processes, so the newest snapshot supersedes the rest of the batch
+        timestamp, rows = max(snapshots, key=lambda s: s[0])
+
+        state = self.hosts.get(host)
+        if state is None:
+            if len(self.hosts) >= self.max_hosts:
+                self.rejected += 1
+                return
+            state = self.hosts[host] = {'timestamp': 0.0, 'keys': set(), 'received': 0.0}
+        state['received'] = time.time()
+        if timestamp <= state['timestamp']:
+            return  # duplicate or out of order
+        state['timestamp'] = timestamp
+
+        if len(rows) > self.max_rows_per_host:
+            keep = np.argpartition(rows['carbon'], -self.max_rows_per_host)[-self.max_rows_per_host:]
+            rows = rows[keep]
+
+        keys = set()
+        for pid, start_time, cpu_time_ns, packets, energy, carbon in rows.tolist():
+            key = (host, pid, start_time)
+            keys.add(key)
+            self.tracker.update((key, cpu_time_ns, packets, energy, carbon))
+        for key in state['keys'] - keys:
+            self.tracker.remove(key)
+        state['keys'] = keys
+
+    def expire(self, now: Optional[float] = None):
+        """Forget hosts that stopped reporting"""
+        now = now or time.time()
+        for host, state in list(self.hosts.items()):
+            if now - state['received'] > self.stale_after:
+                for key in state['keys']:
+                    self.tracker.remove(key)
+                del self.hosts[host]
+
+    def top(self, n: int) -> List[dict]:
+        """Fleet-wide top emitters, highest carbon first"""
+        return [
+            {'host': host, 'pid': pid, 'start_time': start_time, 'cpu_time_ns': cpu_time_ns,
+             'packets': packets, 'energy': energy, 'carbon': carbon}
+            for (host, pid, start_time), cpu_time_ns, packets, energy, carbon in self.tracker.top(n)
+        ]
+
+    def summary(self) -> dict:
+        return {
+            'hosts': len(self.hosts),
+            'processes': len(self.tracker),
+            'total_energy': self.tracker.total_energy,
+            'total_carbon': self.tracker.total_carbon,
+            'frames': self.frames,
+        }
+
+    # asyncio side
+
+    async def _handle_agent(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(LENGTH.size)
+                (size,) = LENGTH.unpack(header)
+                if size > MAX_FRAME_BYTES:
+                    print(f"  ⚠️  Dropping agent connection: {size}-byte frame")
+                    break
+                # Waits while the merge queue is full; the socket is not read
+                # meanwhile, so the agent's sends block (TCP backpressure)
+                await self._reserve(size)
+                try:
+                    payload = await reader.readexactly(size)
+                except BaseException:
+                    await self._release(size)
+                    raise
+                self._queue.put_nowait(payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _reserve(self, size: int):
+        async with self._room:
+            await self._room.wait_for(lambda: self._queued_bytes + size <= self.queue_bytes)
+            self._queued_bytes += size
+
+    async def _release(self, size: int):
+        async with self._room:
+            self._queued_bytes -= size
+            self._room.notify_all()
+
+    async def _merge_loop(self):
+        while True:
+            payload = await self._queue.get()
+            await self._release(len(payload))
+            try:
+                host, snapshots = decode_payload(payload)
+            except ValueError as e:
+                print(f"  ⚠️  Bad frame: {e}")
+                continue
+            self.frames += 1
+            self.merge(host, snapshots)
+
+    async def _expire_loop(self):
+        while True:
+            await asyncio.sleep(self.stale_after / 2)
+            self.expire()
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            # Headers are not needed; read them so the client sees a clean close
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode(errors='replace').split()
+            url = urlparse(parts[1] if len(parts) > 1 else '/')
+            query = parse_qs(url.query)
+
+            if url.path == '/top':
+                status, body = 200, self.top(int(query.get('n', ['20'])[0]))
+            elif url.path == '/hosts':
+                status, body = 200, {
+                    host: {'timestamp': s['timestamp'], 'processes': len(s['keys'])}
+                    for host, s in self.hosts.items()
+                }
+            elif url.path == '/summary':
+                status, body = 200, self.summary()
+            else:
+                status, body = 404, {'error': 'not found', 'paths': ['/top?n=20', '/hosts', '/summary']}
+
+            data = json.dumps(body).encode()
+            reason = 'OK' if status == 200 else 'Not Found'
+            writer.write(f"HTTP/1.0 {status} {reason}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+        except (ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str, http_port: Optional[int] = None, report_interval: float = 0):
+        """Accept agents on address (and queries on http_port) until cancelled"""
+        self._queue = asyncio.Queue()
+        self._queued_bytes = 0
+        self._room = asyncio.Condition()
+
+        kind, target = parse_address(address)
+        if kind == 'unix':
+            if os.path.exists(target):
+                os.unlink(target)
+            server = await asyncio.start_unix_server(self._handle_agent, path=target)
+        else:
+            server = await asyncio.start_server(self._handle_agent, *target)
+
+        tasks = [asyncio.ensure_future(self._merge_loop()), asyncio.ensure_future(self._expire_loop())]
+        servers = [server]
+        if http_port:
+            servers.append(await asyncio.start_server(self._handle_http, '0.0.0.0', http_port))
+        if report_interval:
+            tasks.append(asyncio.ensure_future(self._report_loop(report_interval)))
+
+        try:
+            await asyncio.gather(*(s.serve_forever() for s in servers))
+        finally:
+            for task in tasks:
+                task.cancel()
+            for s in servers:
+                s.close()
+
+    async def _report_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            display_fleet(self)
+
+
+def display_fleet(aggregator: FleetAggregator, top_n: int = 20):
+    """Print the fleet-wide top emitters"""
+    from prettytable import PrettyTable
+
+    summary = aggregator.summary()
+    print(f"\n🌐 Fleet: {summary['hosts']} hosts, {summary['processes']} processes, "
+          f"{summary['total_energy']:.2f} J, {summary['total_carbon']:.6f} g CO2")
+
+    table = PrettyTable()
+    table.field_names = ["Host", "PID", "CPU Time (ms)", "Packets", "Energy (J)", "Carbon (g CO2)"]
+    for row in aggregator.top(top_n):
+        table.add_row([row['host'], row['pid'], f"{row['cpu_time_ns'] / 1_000_000:.2f}",
+                       row['packets'], f"{row['energy']:.6f}", f"{row['carbon']:.6f}"])
+    print(table)
+
+
+def add_parser(subparsers):
+    """Register the `agent` and `aggregate` subcommands"""
+    parser = subparsers.add_parser('agent', help="ship this host's metrics to an aggregator")
+    parser.add_argument('--connect', required=True, metavar='ADDR',
+                        help="aggregator address: HOST:PORT or unix:PATH")
+    parser.add_argument('--source', choices=('psutil', 'ebpf'), default='psutil',
+                        help="collector to run (default: psutil)")
+    parser.add_argument('--host', help="name reported for this host (default: hostname)")
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help="seconds between snapshots (default: 2)")
+    parser.add_argument('--batch-ticks', type=int, default=1,
+                        help="snapshots per frame (default: 1)")
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help="snapshots kept while the aggregator is unreachable (default: 64)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for the psutil scan (default: 1)")
+    parser.add_argument('--pin', action='store_true',
+                        help="keep the eBPF counters pinned in /sys/fs/bpf across restarts")
+    from ebpf_loader import add_filter_arguments
+    from energy_calc import add_model_arguments
+    add_filter_arguments(parser)
+    add_model_arguments(parser)
+    parser.set_defaults(func=run_agent)
+
+    parser = subparsers.add_parser('aggregate', help="merge agent streams into a fleet view")
+    parser.add_argument('--listen', default=f"0.0.0.0:{DEFAULT_PORT}", metavar='ADDR',
+                        help=f"agent address: HOST:PORT or unix:PATH (default: 0.0.0.0:{DEFAULT_PORT})")
+    parser.add_argument('--http', type=int, metavar='PORT',
+                        help="serve /top, /hosts and /summary as JSON on this port")
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                        help="seconds between fleet tables, 0 = quiet (default: 5)")
+    parser.add_argument('--max-hosts', type=int, default=1024,
+                        help="hosts tracked at once (default: 1024)")
+    parser.add_argument('--stale-after', type=float, default=30.0,
+                        help="forget hosts silent for this many seconds (default: 30)")
+    parser.set_defaults(func=run_aggregator)
+
+
+def run_agent(args) -> int:
+    """Entry point of `carbon.py agent`"""
+    from energy_calc import configure_from_args, get_model
+    configure_from_args(args)
+
+    if args.source == 'ebpf':
+        from ebpf_loader import (load_carbon_monitor, read_task_stats, read_freq_histogram,
+                                 task_stats_to_metrics, filter_from_args, counters_started_at)
+        from resident_memory import RssIntegrator
+        task_filter = filter_from_args(args)
+        bpf = load_carbon_monitor(task_filter=task_filter, pin=args.pin)
+        memory = RssIntegrator(since=counters_started_at(bpf))
+
+        def collect():
+            freq_histogram = None
+            if get_model().cpu_power_curve is not None:
+                freq_histogram = read_freq_histogram(bpf["cpu_freq_time"])
+            return task_stats_to_metrics(read_task_stats(bpf["task_stats"]), min_cpu_ns=task_filter.min_cpu_ns,
+                                         memory=memory, freq_histogram=freq_histogram)
+        close = lambda: None
+    else:
+        from parallel_collector import ParallelCollector
+        collector = ParallelCollector(workers=args.workers)
+        collect, close = collector.collect, collector.close
+
+    agent = FleetAgent(args.connect, host=args.host, batch_ticks=args.batch_ticks,
+                       max_pending=args.max_pending)
+    print(f"📡 Agent {agent.host} → {args.connect} (Ctrl+C to stop)")
+    try:
+        while True:
+            agent.submit(collect())
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.close()
+        close()
+    print(f"\n✓ Sent {agent.sent} snapshots, dropped {agent.dropped}")
+    return 0
+
+
+def run_aggregator(args) -> int:
+    """Entry point of `carbon.py aggregate`"""
+    aggregator = FleetAggregator(max_hosts=args.max_hosts, stale_after=args.stale_after)
+    print(f"🌐 Aggregating on {args.listen}" + (f", HTTP on :{args.http}" if args.http else ""))
+    try:
+        asyncio.run(aggregator.serve(args.listen, args.http, args.report_interval))
+    except KeyboardInterrupt:
+        print("\n✓ Aggregator stopped")
+    return 0
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Job Profiles
+Persistent per-command history, to recognise recurring heavy jobs
+
+Each process is fingerprinted by its normalized command line (numbers,
+hashes, UUIDs and temporary paths replaced by placeholders, so the nightly
+build of a different commit is still the same job). Finished runs are
+accumulated into a profile stored in a dbm file: an on-disk hash index,
+so looking up a job when it starts is O(1) and does not load the store.
+"""
+
+import dbm
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import psutil
+
+DEFAULT_PROFILE_FILE = 'job_profiles.db'
+
+# Mean energy per run above which a job counts as heavy
+HEAVY_JOB_ENERGY_J = 100.0
+
+# Runs needed before a job is trusted to be recurring
+HEAVY_JOB_MIN_RUNS = 2
+
+# Most specific first: a UUID also matches the hex and number patterns
+_NORMALIZE_PATTERNS = (
+    (re.compile(r'(/tmp|/var/tmp|/dev/shm)/\S*'), '<tmp>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.I), '<uuid>'),
+    (re.compile(r'\b[0-9a-f]{7,}\b', re.I), '<hex>'),
+    (re.compile(r'\d+'), '#'),
+)
+
+
+def normalize_cmdline(cmdline: List[str]) -> str:
+    """Command line with run-specific parts replaced by placeholders"""
+    if not cmdline:
+        return ''
+    # Same job whether started as ./build.sh or /opt/ci/build.sh
+    args = [os.path.basename(cmdline[0])] + list(cmdline[1:])
+    command = ' '.join(args)
+    for pattern, placeholder in _NORMALIZE_PATTERNS:
+        command = pattern.sub(placeholder, command)
+    return command
+
+
+def profile_key(command: str) -> bytes:
+    """Store key of a normalized command"""
+    return hashlib.sha1(command.encode()).hexdigest()[:16].encode()
+
+
+def read_command(pid: int, fallback: str = '') -> Optional[str]:
+    """
+    Normalized command of a running process
+    fallback: Used when the command line is empty or unreadable (e.g. the
+              comm from an exec event, for processes that already exited)
+    """
+    try:
+        proc = psutil.Process(pid)
+        cmdline = proc.cmdline() or [f"[{proc.name()}]"]
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        cmdline = [f"[{fallback}]"] if fallback else []
+    return normalize_cmdline(cmdline) or None
+
+
+class JobProfile(NamedTuple):
+    command: str
+    runs: int
+    total_energy: float         # J over all runs
+    total_duration_s: float
+    peak_watts: float           # highest rate seen in any run
+    last_seen: float            # time.time() of the last finished run
+
+    @property
+    def mean_energy(self) -> float:
+        return self.total_energy / self.runs if self.runs else 0.0
+
+    @property
+    def mean_duration_s(self) -> float:
+        return self.total_duration_s / self.runs if self.runs else 0.0
+
+    def is_heavy(self, min_energy: float = HEAVY_JOB_ENERGY_J,
+                 min_runs: int = HEAVY_JOB_MIN_RUNS) -> bool:
+        return self.runs >= min_runs and self.mean_energy >= min_energy
+
+
+class ProfileStore:
+    """On-disk job profiles keyed by normalized command"""
+
+    def __init__(self, path: str = DEFAULT_PROFILE_FILE, flag: str = 'c'):
+        """
+        flag: dbm.open() flag; 'r' reads an existing store without creating one
+        Raises: dbm.error if the store cannot be opened
+        """
+        self.path = path
+        self._db = dbm.open(path, flag)
+
+    def get(self, command: str) -> Optional[JobProfile]:
+        """Profile of a normalized command, or None if never seen"""
+        raw = self._db.get(profile_key(command))
+        if raw is None:
+            return None
+        return JobProfile(**json.loads(raw))
+
+    def record_run(self, command: str, energy: float, duration_s: float,
+                   peak_watts: float) -> JobProfile:
+        """Add one finished run to the command's profile"""
+        profile = self.get(command)
+        if profile is None:
+            profile = JobProfile(command, 0, 0.0, 0.0, 0.0, 0.0)
+
+        profile = JobProfile(
+            command=command,
+            runs=profile.runs + 1,
+            total_energy=profile.total_energy + energy,
+            total_duration_s=profile.total_duration_s + duration_s,
+            peak_watts=max(profile.peak_watts, peak_watts),
+            last_seen=time.time(),
+        )
+        self._db[profile_key(command)] = json.dumps(profile._asdict())
+        return profile
+
+    def profiles(self) -> Iterator[JobProfile]:
+        """Every stored profile (full scan)"""
+        for key in self._db.keys():
+            yield JobProfile(**json.loads(self._db[key]))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _Run:
+    """A process being followed until it exits"""
+
+    __slots__ = ('command', 'create_time', 'energy', 'peak_watts', 'last_energy', 'last_time', 'sampled')
+
+    def __init__(self, command: str, create_time: float, now: float):
+        self.command = command
+        self.create_time = create_time
+        self.sampled = False
+        self.energy = 0.0
+        self.peak_watts = 0.0
+        self.last_energy = 0.0
+        self.last_time = now
+
+
+class RunTracker:
+    """
+    Follows processes from start to exit and records each run in a
+    ProfileStore.
+
+    Only processes seen starting (start()) are followed, so every recorded
+    run covers the whole process lifetime. Of those, only commands matching
+    one of the patterns or already profiled are followed, and runs that
+    never appeared in the metrics (too short for the collector) are not
+    recorded.
+    """
+
+    def __init__(self, store: ProfileStore, patterns: Iterable[str] = ()):
+        """patterns: Globs on the normalized command of the jobs to profile"""
+        self.store = store
+        self.patterns = list(patterns)
+        self._runs: Dict[int, _Run] = {}
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def start(self, pid: int, comm: str = '') -> Optional[JobProfile]:
+        """
+        Begin following a new process
+        comm: Process name to fall back on if the command line is gone
+        Returns: Profile of the job if it has run before, else None
+        """
+        command = read_command(pid, comm)
+        if command is None:
+            return None
+        profile = self.store.get(command)
+        if profile is None and not any(fnmatch.fnmatchcase(command, p) for p in self.patterns):
+            return None
+        try:
+            create_time = psutil.Process(pid).create_time()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            create_time = 0.0   # already gone; recorded on the next update()
+
+        self._runs[pid] = _Run(command, create_time, time.time())
+        return profile
+
+    def update(self, metrics, now: Optional[float] = None) -> List[Tuple[int, JobProfile]]:
+        """
+        Feed one tick of metrics; record the runs that finished
+        metrics: List of (pid, cpu_time_ns, packets, energy, carbon)
+        Returns: (pid, updated profile) for every finished run
+        """
+        if now is None:
+            now = time.time()
+
+        for pid, _, _, energy, _ in metrics:
+            run = self._runs.get(pid)
+            if run is None:
+                continue
+            dt = now - run.last_time
+            if dt > 0 and run.last_energy:
+                run.peak_watts = max(run.peak_watts, (energy - run.last_energy) / dt)
+            run.energy = run.last_energy = energy
+            run.last_time = now
+            run.sampled = True
+
+        finished = []
+        for pid, run in list(self._runs.items()):
+            if not self._alive(pid, run):
+                del self._runs[pid]
+                if not run.sampled:
+                    continue
+                duration_s = max(0.0, run.last_time - run.create_time) if run.create_time else 0.0
+                finished.append((pid, self.store.record_run(run.command, run.energy, duration_s,
+                                                            run.peak_watts)))
+        return finished
+
+    @staticmethod
+    def _alive(pid: int, run: _Run) -> bool:
+        try:
+            # A different create time means the PID was reused
+            return psutil.Process(pid).create_time() == run.create_time
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return False
+
+
+def open_profile_store(args) -> Optional[ProfileStore]:
+    """
+    Profile store a monitor records runs in: created when runs are to be
+    profiled or acted on (--profile-command, --proactive), otherwise used
+    only if it already exists, so a plain monitor run leaves no file behind
+    Returns: None when there is nothing to profile
+    """
+    if args.profile_command or args.proactive != 'none':
+        return ProfileStore(args.profiles)
+    if dbm.whichdb(args.profiles):
+        return ProfileStore(args.profiles, 'w')
+    return None
+
+
+def add_profile_arguments(parser):
+    """Add job profile options to an argparse parser"""
+    parser.add_argument('--profiles', metavar='PATH', default=DEFAULT_PROFILE_FILE,
+                        help=f"job profile store (default: {DEFAULT_PROFILE_FILE})")
+    parser.add_argument('--profile-command', metavar='GLOB', action='append', default=[],
+                        help="profile runs of commands matching this glob on the normalized command "
+                             "line (repeatable); commands with a profile are always followed")
+    parser.add_argument('--proactive', choices=('none', 'renice', 'limit'), default='none',
+                        help="strategy applied as soon as a known heavy job starts (default: none)")
+    parser.add_argument('--heavy-job-energy', type=float, default=HEAVY_JOB_ENERGY_J,
+                        help=f"mean J per run that makes a job heavy (default: {HEAVY_JOB_ENERGY_J:g})")
+
+
+def add_parser(subparsers):
+    """Register the `jobs` subcommand"""
+    parser = subparsers.add_parser('jobs', help="list recurring jobs from the profile store")
+    parser.add_argument('--profiles', metavar='PATH', default=DEFAULT_PROFILE_FILE,
+                        help=f"job profile store (default: {DEFAULT_PROFILE_FILE})")
+    parser.add_argument('--top', type=int, default=20,
+                        help="number of jobs to show (default: 20)")
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py jobs`"""
+    from prettytable import PrettyTable
+
+    try:
+        store = ProfileStore(args.profiles, 'r')
+    except dbm.error:
+        print(f"No job profile store at {args.profiles} (the monitors create it)")
+        return 0
+    with store:
+        profiles = sorted(store.profiles(), key=lambda p: p.mean_energy, reverse=True)[:args.top]
+
+    if not profiles:
+        print(f"No job profiles in {args.profiles} yet")
+        return 0
+
+    table = PrettyTable()
+    table.field_names = ["Command", "Runs", "Mean Energy (J)", "Mean Duration (s)", "Peak (W)", "Heavy"]
+    table.align["Command"] = "l"
+    for profile in profiles:
+        table.add_row([profile.command[:60], profile.runs, f"{profile.mean_energy:.2f}",
+                       f"{profile.mean_duration_s:.1f}", f"{profile.peak_watts:.2f}",
+                       "yes" if profile.is_heavy() else ""])
+    print(table)
+    return 0
@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+"""
+Carbon-Aware Job Queue
+Defers flexible commands to the lowest-carbon time before their deadline
+
+    python3 pycode/carbon.py scheduler --forecast intensity.csv --max-concurrent 2
+    python3 pycode/carbon.py submit --deadline 8h -- make -j8 release
+    python3 pycode/carbon.py queue
+
+The forecast is a CSV file of `timestamp,gCO2/kWh` rows (Unix seconds or
+ISO 8601), read onto a regular grid at its own step. A job's expected
+duration comes from its job profile (job_profiles.py) or --duration. For
+every start slot, the mean intensity over the job's duration is a
+difference of the series' prefix integral; the best start before the
+deadline is then the minimum of those costs over a window of slots,
+found with a monotonic deque (sliding_window_min). The minima are kept
+per (duration, window), so replanning every queued job on each tick is a
+lookup. Past the end of the forecast, its last value is assumed.
+
+Queue state is a JSON file shared by the scheduler and the submit/queue
+commands under an exclusive lock, and rewritten atomically on every
+change. Jobs run by the scheduler are measured with the monitors'
+energy model (measure.py) and recorded in the job profile store, so
+their next submission is planned with a measured duration.
+"""
+
+import dbm
+import fcntl
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from energy_calc import get_model
+from job_profiles import DEFAULT_PROFILE_FILE, JobProfile, ProfileStore, normalize_cmdline
+
+DEFAULT_QUEUE_FILE = 'job_queue.json'
+
+DEFAULT_FORECAST_FILE = 'intensity_forecast.csv'
+
+# Expected run time of a command without a job profile
+DEFAULT_DURATION_S = 3600.0
+
+# Seconds between scheduler ticks
+POLL_INTERVAL = 5.0
+
+JOULES_PER_KWH = 3_600_000
+
+# Durations whose start costs, and (duration, window) pairs whose minima, are kept
+PLAN_CACHE_SIZE = 256
+
+STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(text: str) -> float:
+    """'90', '90s', '30m', '8h' or '2d' -> seconds"""
+    unit = UNITS.get(text[-1:].lower())
+    return float(text[:-1]) * unit if unit else float(text)
+
+
+def parse_time(text: str, now: float) -> float:
+    """Relative ('8h', from now) or ISO 8601 absolute time -> Unix seconds"""
+    try:
+        return now + parse_duration(text)
+    except ValueError:
+        return datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp()
+
+
+def sliding_window_min(values: np.ndarray, width: int) -> np.ndarray:
+    """
+    Index of the minimum of values[i:i + width] for every i (windows are
+    cut short at the end), earliest index on ties. O(len(values)): each
+    index enters and leaves the deque once.
+    """
+    n = len(values)
+    best = np.empty(n, dtype=np.int64)
+    window = deque()
+    for j in range(n + width - 1):
+        if j < n:
+            while window and values[window[-1]] > values[j]:
+                window.pop()
+            window.append(j)
+        i = j - width + 1
+        if i >= 0:
+            while window[0] < i:
+                window.popleft()
+            best[i] = window[0]
+    return best
+
+
+class IntensitySeries:
+    """Carbon intensity on a regular grid (g CO2/kWh per step)"""
+
+    def __init__(self, start: float, step: float, values: np.ndarray):
+        self.start = start
+        self.step = step
+        self.values = np.asarray(values, dtype=np.float64)
+        # Integral of intensity x seconds from start to each grid point
+        self.cumulative = np.r_[0.0, np.cumsum(self.values) * step]
+        self._costs: Dict[float, np.ndarray] = {}
+        self._best: Dict[Tuple[float, int], np.ndarray] = {}
+
+    @classmethod
+    def from_file(cls, path: str) -> 'IntensitySeries':
+        """
+        Read `timestamp,intensity` rows; header and comment lines are skipped.
+        Irregular series are resampled to their median step (last value holds).
+        Raises: ValueError if fewer than two rows parse
+        """
+        times, values = [], []
+        with open(path) as f:
+            for line in f:
+                fields = line.split('#', 1)[0].split(',')
+                if len(fields) < 2:
+                    continue
+                try:
+                    value = float(fields[1])
+                    stamp = fields[0].strip()
+                    try:
+                        t = float(stamp)
+                    except ValueError:
+                        t = datetime.fromisoformat(stamp.replace('Z', '+00:00')).timestamp()
+                except ValueError:
+                    continue
+                times.append(t)
+                values.append(value)
+        if len(times) < 2:
+            raise ValueError(f"{path}: need at least two timestamp,intensity rows")
+
+        order = np.argsort(times, kind='stable')
+        times = np.asarray(times)[order]
+        values = np.asarray(values)[order]
+        step = float(np.median(np.diff(times)))
+        if step <= 0:
+            raise ValueError(f"{path}: timestamps must increase")
+        grid = np.arange(times[0], times[-1] + step / 2, step)
+        return cls(times[0], step, values[np.searchsorted(times, grid, side='right') - 1])
+
+    @property
+    def end(self) -> float:
+        return self.start + len(self.values) * self.step
+
+    def integral(self, t):
+        """Intensity x seconds from start to t (first/last value held outside the series)"""
+        t = np.asarray(t, dtype=np.float64)
+        offset = t - self.start
+        slot = np.clip(np.floor(offset / self.step).astype(np.int64), 0, len(self.values) - 1)
+        result = self.cumulative[slot] + (offset - slot * self.step) * self.values[slot]
+        return np.where(offset < 0, offset * self.values[0], result)
+
+    def mean(self, t0: float, t1: float) -> float:
+        """Mean intensity over [t0, t1]"""
+        if t1 <= t0:
+            return float(self.at(t0))
+        return float(self.integral(t1) - self.integral(t0)) / (t1 - t0)
+
+    def at(self, t: float) -> float:
+        slot = min(max(int((t - self.start) // self.step), 0), len(self.values) - 1)
+        return float(self.values[slot])
+
+    def slot(self, t: float) -> int:
+        """Grid slot containing t (negative before the series)"""
+        return int((t - self.start) // self.step)
+
+    def slot_time(self, slot: int) -> float:
+        return self.start + slot * self.step
+
+    def window_costs(self, duration: float) -> np.ndarray:
+        """Intensity integral of a job `duration` seconds long starting at each slot"""
+        costs = self._costs.get(duration)
+        if costs is None:
+            if len(self._costs) >= PLAN_CACHE_SIZE:
+                self._costs.clear()
+            starts = self.start + np.arange(len(self.values)) * self.step
+            costs = self.integral(starts + duration) - self.integral(starts)
+            self._costs[duration] = costs
+        return costs
+
+    def best_starts(self, duration: float, width: int) -> np.ndarray:
+        """For each slot, the best start slot among it and the next width - 1"""
+        key = (duration, width)
+        best = self._best.get(key)
+        if best is None:
+            if len(self._best) >= PLAN_CACHE_SIZE:
+                self._best.clear()
+            best = self._best[key] = sliding_window_min(self.window_costs(duration), width)
+        return best
+
+
+class Plan(NamedTuple):
+    start: float
+    intensity: float            # mean g CO2/kWh over the run if started then
+    intensity_now: float        # ... if started now
+
+
+def plan_start(series: Optional[IntensitySeries], now: float, duration: float, deadline: float) -> Plan:
+    """
+    Start time before deadline - duration with the lowest mean intensity
+    over the run. Starts are slot boundaries (or now); without a forecast,
+    or with no slack left, the answer is now (without a forecast, at the
+    model's constant intensity).
+    """
+    if series is None:
+        intensity = get_model().carbon_intensity
+        return Plan(now, intensity, intensity)
+    intensity_now = series.mean(now, now + duration)
+
+    # Candidate starts: now, and every later slot boundary that still
+    # finishes by the deadline
+    first = max(series.slot(now), 0)
+    if series.slot_time(first) <= now:
+        first += 1
+    latest = min(series.slot(deadline - duration), len(series.values) - 1)
+    if deadline - duration <= now or latest < first:
+        return Plan(now, intensity_now, intensity_now)
+
+    best = int(series.best_starts(duration, latest - first + 1)[first])
+    start = series.slot_time(best)
+    intensity = series.mean(start, start + duration)
+    # The current slot is partly over; starting right away can beat its boundary
+    if intensity_now <= intensity:
+        return Plan(now, intensity_now, intensity_now)
+    return Plan(start, intensity, intensity_now)
+
+
+class Job(NamedTuple):
+    id: int
+    command: List[str]
+    cwd: str
+    submitted: float
+    deadline: float
+    duration_s: float           # expected
+    energy_j: float             # expected until it ran, then measured
+    state: str = 'queued'
+    planned_start: float = 0.0
+    expected_carbon_g: float = 0.0
+    immediate_carbon_g: float = 0.0     # had it started at submission
+    started: float = 0.0
+    finished: float = 0.0
+    exit_code: Optional[int] = None
+    carbon_g: float = 0.0
+    attempts: int = 0
+    error: str = ''              # why it could not be run or measured
+
+
+def _carbon(energy_j: float, intensity: float) -> float:
+    return energy_j / JOULES_PER_KWH * intensity
+
+
+def replan(job: Job, series: Optional[IntensitySeries], now: float) -> Job:
+    """Job with its planned start and expected carbon brought up to date"""
+    plan = plan_start(series, now, job.duration_s, job.deadline)
+    job = job._replace(planned_start=plan.start, expected_carbon_g=_carbon(job.energy_j, plan.intensity))
+    if series is not None:
+        immediate = series.mean(job.submitted, job.submitted + job.duration_s)
+        job = job._replace(immediate_carbon_g=_carbon(job.energy_j, immediate))
+    return job
+
+
+def load_forecast(path: Optional[str]) -> Optional[IntensitySeries]:
+    """Forecast at path, or None (with a warning) when it is missing or unusable"""
+    if not path:
+        return None
+    try:
+        return IntensitySeries.from_file(path)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  No usable forecast ({e}); jobs start as soon as a slot is free", file=sys.stderr)
+        return None
+
+
+def expected_run(command: List[str], profiles: str, duration: Optional[float]) -> Tuple[float, float]:
+    """
+    (duration s, energy J) expected for command: from its job profile when
+    it has one, otherwise duration (default DEFAULT_DURATION_S) on one busy core
+    """
+    profile: Optional[JobProfile] = None
+    try:
+        with ProfileStore(profiles, 'r') as store:
+            profile = store.get(normalize_cmdline(command))
+    except dbm.error:
+        pass
+    if profile is not None and profile.runs and duration is None:
+        return profile.mean_duration_s, profile.mean_energy
+    if duration is None:
+        duration = DEFAULT_DURATION_S
+    return duration, duration * get_model().cpu_power_watts
+
+
+class QueueStore:
+    """Queue state file, read and rewritten under an exclusive lock"""
+
+    def __init__(self, path: str = DEFAULT_QUEUE_FILE):
+        self.path = path
+
+    @contextmanager
+    def update(self) -> Iterator[dict]:
+        """
+        Locked read-modify-write of {'next_id': int, 'jobs': [Job]}; the
+        state is saved when the block exits without an exception
+        """
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self._read()
+            yield state
+            self._write(state)
+
+    def jobs(self) -> List[Job]:
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            return self._read()['jobs']
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return {'next_id': 1, 'jobs': []}
+        return {'next_id': raw['next_id'], 'jobs': [Job(**job) for job in raw['jobs']]}
+
+    def _write(self, state: dict):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'next_id': state['next_id'], 'jobs': [job._asdict() for job in state['jobs']]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class Scheduler:
+    """Starts queued jobs at their planned time, at most max_concurrent at once"""
+
+    def __init__(self, store: QueueStore, forecast: Optional[str], max_concurrent: int = 1,
+                 source: str = 'auto', profiles: str = DEFAULT_PROFILE_FILE):
+        self.store = store
+        self.forecast = forecast
+        self.max_concurrent = max_concurrent
+        self.source = source
+        self.profiles = profiles
+        self.series: Optional[IntensitySeries] = None
+        self._forecast_mtime = None
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrent)
+        self.running = {}           # job id -> Future of its measure report
+
+        # One scheduler per queue file
+        self._owner = open(store.path + '.run', 'a')
+        try:
+            fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._owner.close()
+            raise RuntimeError(f"another scheduler is running on {store.path}") from None
+
+        # Jobs left running by a previous scheduler died with it
+        with self.store.update() as state:
+            for i, job in enumerate(state['jobs']):
+                if job.state == 'running':
+                    print(f"🔁 Job {job.id} was interrupted; queued again")
+                    state['jobs'][i] = job._replace(state='queued')
+
+    def _reload_forecast(self):
+        try:
+            mtime = os.stat(self.forecast).st_mtime if self.forecast else None
+        except OSError:
+            mtime = None
+        if mtime != self._forecast_mtime:
+            self._forecast_mtime = mtime
+            self.series = load_forecast(self.forecast)
+
+    def _run(self, job: Job) -> dict:
+        """Measure report of the job; never raises, so one bad job cannot stop the scheduler"""
+        from measure import measure_command
+        try:
+            return measure_command(job.command, self.source, cwd=job.cwd)
+        except (FileNotFoundError, PermissionError, NotADirectoryError) as e:
+            error, exit_code = f"cannot run {job.command[0]}: {e}", 127
+        except Exception as e:
+            # e.g. the eBPF program failing to compile
+            error, exit_code = f"measurement failed: {e}", None
+        return {'exit_code': exit_code, 'duration_s': 0.0, 'energy_j': 0.0, 'error': error}
+
+    def _finish(self, job: Job, report: dict) -> Job:
+        started = job.started
+        finished = started + report['duration_s']
+        energy = report['energy_j']
+        if self.series is not None:
+            intensity = self.series.mean(started, finished)
+            immediate = self.series.mean(job.submitted, job.submitted + report['duration_s'])
+        else:
+            intensity = immediate = get_model().carbon_intensity
+        job = job._replace(
+            state='done' if report['exit_code'] == 0 else 'failed',
+            finished=finished, exit_code=report['exit_code'], energy_j=energy,
+            duration_s=report['duration_s'], carbon_g=_carbon(energy, intensity),
+            immediate_carbon_g=_carbon(energy, immediate), error=report.get('error', ''),
+        )
+        if report['duration_s'] > 0:
+            try:
+                with ProfileStore(self.profiles) as profiles:
+                    profiles.record_run(normalize_cmdline(job.command), energy, report['duration_s'],
+                                        energy / report['duration_s'])
+            except dbm.error:
+                pass
+        if job.error:
+            print(f"❌ Job {job.id} failed: {job.error}")
+            return job
+        icon = "✅" if job.state == 'done' else "❌"
+        print(f"{icon} Job {job.id} finished (exit {job.exit_code}): {energy:.2f} J, "
+              f"{job.carbon_g:.4f} g CO2 ({job.immediate_carbon_g - job.carbon_g:.4f} g less than at submission)")
+        return job
+
+    def tick(self, now: float):
+        """Collect finished jobs, replan the queue and start what is due"""
+        self._reload_forecast()
+        with self.store.update() as state:
+            jobs = state['jobs']
+            for i, job in enumerate(jobs):
+                future = self.running.get(job.id)
+                if job.state == 'running' and future is not None and future.done():
+                    del self.running[job.id]
+                    jobs[i] = self._finish(job, future.result())
+                elif job.state == 'queued':
+                    jobs[i] = replan(job, self.series, now)
+
+            # Due jobs, least slack first, into the free slots
+            due = [i for i, job in enumerate(jobs) if job.state == 'queued' and job.planned_start <= now]
+            due.sort(key=lambda i: jobs[i].deadline - jobs[i].duration_s)
+            for i in due[:self.max_concurrent - len(self.running)]:
+                job = jobs[i]._replace(state='running', started=now, attempts=jobs[i].attempts + 1)
+                late = " (late)" if now > job.deadline - job.duration_s else ""
+                print(f"▶️  Job {job.id}{late}: {' '.join(job.command)[:60]}")
+                self.running[job.id] = self.pool.submit(self._run, job)
+                jobs[i] = job
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self._owner.close()
+
+
+def add_parser(subparsers):
+    """Register the `scheduler`, `submit` and `queue` subcommands"""
+    from energy_calc import add_model_arguments
+
+    def add_queue_argument(parser):
+        parser.add_argument('--queue', metavar='PATH', default=DEFAULT_QUEUE_FILE,
+                            help=f"queue state file (default: {DEFAULT_QUEUE_FILE})")
+
+    def add_forecast_argument(parser):
+        parser.add_argument('--forecast', metavar='PATH', default=DEFAULT_FORECAST_FILE,
+                            help=f"carbon intensity series, CSV timestamp,gCO2/kWh "
+                                 f"(default: {DEFAULT_FORECAST_FILE})")
+
+    parser = subparsers.add_parser('scheduler', help="run queued jobs at their lowest-carbon time")
+    add_queue_argument(parser)
+    add_forecast_argument(parser)
+    parser.add_argument('--max-concurrent', type=int, default=1,
+                        help="jobs running at once (default: 1)")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                        help=f"seconds between queue checks (default: {POLL_INTERVAL:g})")
+    parser.add_argument('--source', choices=('auto', 'ebpf', 'psutil'), default='auto',
+                        help="accounting backend for jobs (default: eBPF when root and BCC are available)")
+    parser.add_argument('--profiles', metavar='PATH', default=DEFAULT_PROFILE_FILE,
+                        help=f"job profile store (default: {DEFAULT_PROFILE_FILE})")
+    add_model_arguments(parser)
+    parser.set_defaults(func=run_scheduler)
+
+    parser = subparsers.add_parser('submit', help="queue a command to run before a deadline")
+    add_queue_argument(parser)
+    add_forecast_argument(parser)
+    parser.add_argument('--deadline', default='24h',
+                        help="latest finish: relative (90m, 8h, 2d) or ISO 8601 (default: 24h)")
+    parser.add_argument('--duration',
+                        help="expected run time, e.g. 45m (default: from its job profile, else 1h)")
+    parser.add_argument('--profiles', metavar='PATH', default=DEFAULT_PROFILE_FILE,
+                        help=f"job profile store (default: {DEFAULT_PROFILE_FILE})")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="show the plan without queuing the job")
+    add_model_arguments(parser)
+    parser.add_argument('command', nargs='+', metavar='-- COMMAND',
+                        help="command to run, after --")
+    parser.set_defaults(func=run_submit)
+
+    parser = subparsers.add_parser('queue', help="list or cancel deferred jobs")
+    add_queue_argument(parser)
+    parser.add_argument('--cancel', type=int, metavar='ID', action='append', default=[],
+                        help="cancel a queued job (repeatable)")
+    parser.add_argument('--all', action='store_true',
+                        help="also list finished and cancelled jobs")
+    parser.set_defaults(func=run_queue)
+
+
+def _when(t: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(t)) if t else '-'
+
+
+def _span(seconds: float) -> str:
+    return f"{seconds / 60:.0f} min" if seconds >= 60 else f"{seconds:.0f} s"
+
+
+def run_submit(args) -> int:
+    """Entry point of `carbon.py submit`"""
+    from energy_calc import configure_from_args
+    configure_from_args(args)
+
+    command = args.command[1:] if args.command[0] == '--' else args.command
+    now = time.time()
+    try:
+        deadline = parse_time(args.deadline, now)
+        duration = parse_duration(args.duration) if args.duration else None
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    duration, energy = expected_run(command, args.profiles, duration)
+    if deadline - duration < now:
+        print(f"⚠️  Expected run time ({_span(duration)}) does not fit before the deadline; "
+              f"it will start as soon as possible")
+
+    series = load_forecast(args.forecast)
+    plan = plan_start(series, now, duration, deadline)
+    job = Job(0, command, os.getcwd(), now, deadline, duration, energy,
+              planned_start=plan.start, expected_carbon_g=_carbon(energy, plan.intensity),
+              immediate_carbon_g=_carbon(energy, plan.intensity_now))
+
+    if not args.dry_run:
+        with QueueStore(args.queue).update() as state:
+            job = job._replace(id=state['next_id'])
+            state['next_id'] += 1
+            state['jobs'].append(job)
+
+    print(f"🗓️  {'Plan' if args.dry_run else f'Queued job {job.id}'}: {' '.join(command)[:60]}")
+    print(f"    Start {_when(plan.start)}, deadline {_when(deadline)}, "
+          f"expected {_span(duration)} / {energy:.1f} J")
+    if series is not None:
+        saved = job.immediate_carbon_g - job.expected_carbon_g
+        print(f"    {plan.intensity:.0f} g/kWh vs {plan.intensity_now:.0f} now: "
+              f"{job.expected_carbon_g:.4f} g CO2, {saved:.4f} g less than starting now")
+    return 0
+
+
+def run_queue(args) -> int:
+    """Entry point of `carbon.py queue`"""
+    from prettytable import PrettyTable
+
+    store = QueueStore(args.queue)
+    if args.cancel:
+        with store.update() as state:
+            for i, job in enumerate(state['jobs']):
+                if job.id not in args.cancel:
+                    continue
+                if job.state == 'queued':
+                    state['jobs'][i] = job._replace(state='cancelled')
+                    print(f"🚫 Cancelled job {job.id}")
+                else:
+                    print(f"⚠️  Job {job.id} is {job.state}; only queued jobs can be cancelled")
+        return 0
+
+    jobs = [job for job in store.jobs() if args.all or job.state in ('queued', 'running')]
+    if not jobs:
+        print(f"No {'' if args.all else 'pending '}jobs in {args.queue}")
+        return 0
+
+    table = PrettyTable()
+    table.field_names = ["ID", "Command", "State", "Start", "Deadline", "Energy (J)",
+                         "Carbon (g CO2)", "Saved (g CO2)"]
+    table.align["Command"] = "l"
+    for job in jobs:
+        done = job.state in ('done', 'failed')
+        carbon = job.carbon_g if done else job.expected_carbon_g
+        table.add_row([job.id, ' '.join(job.command)[:40], job.state,
+                       _when(job.started or job.planned_start), _when(job.deadline),
+                       f"{job.energy_j:.1f}", f"{carbon:.4f}", f"{job.immediate_carbon_g - carbon:.4f}"])
+    print(table)
+    return 0
+
+
+def run_scheduler(args) -> int:
+    """Entry point of `carbon.py scheduler`"""
+    from energy_calc import configure_from_args
+    configure_from_args(args)
+
+    try:
+        scheduler = Scheduler(QueueStore(args.queue), args.forecast, args.max_concurrent,
+                              args.source, args.profiles)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"🗓️  Scheduling {args.queue} with up to {args.max_concurrent} jobs at once (Ctrl+C to stop)")
+    try:
+        while True:
+            scheduler.tick(time.time())
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        if scheduler.running:
+            print(f"\n⚠️  {len(scheduler.running)} running jobs are queued again at the next start")
+    finally:
+        scheduler.close()
+    return 0
+
+
+def benchmark():
+    """Planning 10k jobs over a week of 5-minute forecasts"""
+    rng = np.random.default_rng(0)
+    step, slots = 300.0, 7 * 288
+    hours = np.arange(slots) * step / 3600
+    values = 400 + 150 * np.sin(hours / 24 * 2 * np.pi) + rng.normal(0, 20, slots)
+    series = IntensitySeries(0.0, step, values)
+
+    # Profiled durations repeat per command and are rarely whole slots
+    durations = rng.uniform(60, 4 * 3600, 50).round()
+    jobs = [(float(rng.uniform(0, slots * step / 2)),
+             float(rng.choice(durations)),
+             float(rng.choice([3600, 6 * 3600, 12 * 3600, 24 * 3600])))
+            for _ in range(10_000)]
+
+    start = time.perf_counter()
+    plans = [plan_start(series, now, duration, now + slack) for now, duration, slack in jobs]
+    elapsed = time.perf_counter() - start
+
+    # Same as scanning now and every slot boundary that finishes in time
+    for (now, duration, slack), plan in list(zip(jobs, plans))[:500]:
+        candidates = [now] + [t for t in np.arange(0.0, now + slack, step) if now < t <= now + slack - duration]
+        expected = min(series.mean(t, t + duration) for t in candidates)
+        assert abs(plan.intensity - expected) < 1e-9, (now, duration, slack)
+        assert now <= plan.start <= now + slack - duration or plan.start == now
+
+    saved = np.mean([1 - p.intensity / p.intensity_now for p in plans])
+    print(f"plan_start: {len(jobs)} jobs in {elapsed * 1000:.1f} ms, "
+          f"{saved * 100:.1f}% lower mean intensity than starting at once")
+
+
+if __name__ == "__main__":
+    benchmark()
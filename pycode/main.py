@@ -3,13 +3,45 @@ import sys
 # Add system BCC path
 sys.path.insert(0, '/usr/lib/python3/dist-packages')
 
-from bcc import BPF
-from energy_calc import estimate_energy, estimate_carbon
+from ebpf_loader import (
+    load_carbon_monitor, read_task_stats, read_freq_histogram, task_stats_rows, rows_to_metrics,
+    add_filter_arguments, filter_from_args, counters_started_at, NET_ATTRIBUTION_MODES
+)
+from energy_calc import add_model_arguments, configure_from_args, get_model
+from resident_memory import RssIntegrator
 from display import display_table
 from mitigation import apply_mitigation
+from job_profiles import RunTracker, add_profile_arguments, open_profile_store
+from policy import add_policy_arguments, configure_policy_from_args
+from reduction_strategies import CarbonReducer, apply_strategy_to_known_job
+from topk import TopKTracker
+from trends import HistoryWriter
+from replay import TraceWriter
+from snapshot import SnapshotPublisher, DEFAULT_SNAPSHOT_PATH
+import argparse
 import time
 import os
 
+parser = argparse.ArgumentParser(description="Carbon emission monitor (eBPF)")
+parser.add_argument('--net-attribution', choices=NET_ATTRIBUTION_MODES, default='device',
+                    help="count traffic per packet at the device (default) or per call at the socket layer")
+parser.add_argument('--history', metavar='PATH',
+                    help="append per-process emission rates to a history file (see carbon.py trends)")
+parser.add_argument('--record', metavar='PATH',
+                    help="record the raw map contents to a trace file (see carbon.py replay)")
+parser.add_argument('--publish', nargs='?', const=DEFAULT_SNAPSHOT_PATH, metavar='PATH',
+                    help=f"share every tick with local readers (see carbon.py top; default path: {DEFAULT_SNAPSHOT_PATH})")
+parser.add_argument('--pin', action='store_true',
+                    help="keep the counters pinned in /sys/fs/bpf across restarts (see carbon.py teardown)")
+add_model_arguments(parser)
+add_policy_arguments(parser)
+add_profile_arguments(parser)
+add_filter_arguments(parser)
+args = parser.parse_args()
+configure_from_args(args)
+configure_policy_from_args(args)
+task_filter = filter_from_args(args)
+
 # Check if running with sudo
 if os.geteuid() != 0:
     print("Error: This script must be run with sudo/root privileges")
@@ -18,51 +50,82 @@ if os.geteuid() != 0:
 
 print("Loading eBPF programs...")
 
-# Load eBPF programs
-bpf_cpu = BPF(src_file="eBPF/cpu_monitor.c")
-print("✓ CPU monitor loaded")
-
-bpf_net = BPF(src_file="eBPF/net_monitor.c")
-print("✓ Network monitor loaded")
+# Load eBPF programs (CPU and network probes in one BPF object)
+bpf = load_carbon_monitor(net_attribution=args.net_attribution, task_filter=task_filter, pin=args.pin)
+print("✓ CPU + Network monitor loaded")
 
-cpu_map = bpf_cpu["cpu_usage"]
-net_map = bpf_net["packet_count"]
+stats_map = bpf["task_stats"]
+# Memory energy is charged from when the counters started
+memory = RssIntegrator(since=counters_started_at(bpf))
 
 print("\nMonitoring carbon emissions (Press Ctrl+C to stop)...\n")
 
+# Ranking kept up to date across ticks instead of re-sorting every sample
+tracker = TopKTracker()
+
+# Follow the profiled jobs started from now on and remember their runs
+store = open_profile_store(args)
+runs = RunTracker(store, args.profile_command) if store is not None else None
+reducer = CarbonReducer()
+history = HistoryWriter(args.history) if args.history else None
+publisher = SnapshotPublisher(args.publish) if args.publish else None
+recorder = TraceWriter(args.record) if args.record else None
+
+def on_exec(cpu, data, size):
+    if runs is None:
+        return
+    event = bpf["exec_events"].event(data)
+    profile = runs.start(event.pid, event.comm.decode(errors='replace'))
+    apply_strategy_to_known_job(reducer, event.pid, profile, args.proactive, args.heavy_job_energy)
+
+bpf["exec_events"].open_perf_buffer(on_exec)
+
 try:
     while True:
-        metrics = []
-        for k, v in cpu_map.items():
-            pid = k.value
-            cpu_time_ns = v.value
-            
-            # Get packet count for this PID
-            packets_key = net_map.Key(pid)
-            try:
-                packets = net_map[packets_key].value
-            except KeyError:
-                packets = 0
-            
-            # Calculate energy and carbon
-            energy = estimate_energy(cpu_time_ns, packets)
-            carbon = estimate_carbon(energy)
-            
-            # Only show processes with significant activity
-            if cpu_time_ns > 0 or packets > 0:
-                metrics.append((pid, cpu_time_ns, packets, energy, carbon))
+        # Frequency-weighted CPU power needs a calibrated power curve; a
+        # trace keeps the histogram for replays under another model
+        freq_histogram = None
+        if get_model().cpu_power_curve is not None or recorder is not None:
+            freq_histogram = read_freq_histogram(bpf["cpu_freq_time"])
         
-        # Sort by carbon emissions (highest first)
-        metrics.sort(key=lambda x: x[4], reverse=True)
+        # Every process the kernel-side filter let through with any CPU,
+        # network or I/O activity
+        rows = task_stats_rows(read_task_stats(stats_map), memory=memory)
+        if recorder is not None:
+            recorder.write_ebpf(rows, freq_histogram)
+        metrics = rows_to_metrics(rows, freq_histogram)
         
-        # Display top 20 processes
+        tracker.update_many(metrics)
+        if runs is not None:
+            runs.update(metrics)
+        if history is not None:
+            history.append(metrics)
+        if publisher is not None:
+            publisher.publish(metrics)
+        
+        # Display top 20 processes (highest carbon first)
         if metrics:
-            display_table(metrics[:20])
+            display_table(tracker.top(20))
             apply_mitigation(metrics)
         
-        time.sleep(2)
+        # Wait for the next sample, handling process starts as they arrive
+        deadline = time.time() + 2
+        while time.time() < deadline:
+            bpf.perf_buffer_poll(timeout=max(1, int((deadline - time.time()) * 1000)))
         
 except KeyboardInterrupt:
     print("\n\nStopping monitoring...")
     print("Cleaning up...")
 
+finally:
+    # Undo what --proactive did to processes that outlive the monitor
+    reducer.restore_all()
+    if store is not None:
+        store.close()
+    if history is not None:
+        history.close()
+    if recorder is not None:
+        recorder.close()
+    if publisher is not None:
+        publisher.close()
+
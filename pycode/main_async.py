@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+🌍 Carbon Emission Monitor - Concurrent Edition
+Interactive reduction with sampling that never stops
+
+Same steps as main_interactive.py, but collection, anomaly alerts, fleet
+export, the menu and the reduction action all run as asyncio tasks
+(see monitor_core.py). The before/after comparison uses equal windows of
+the continuous sample stream just before and just after the action.
+"""
+
+import sys
+sys.path.insert(0, '/usr/lib/python3/dist-packages')
+
+import argparse
+import asyncio
+import os
+import time
+
+from comparison import EmissionComparison, display_top_emitters
+from policy import add_policy_arguments, configure_policy_from_args
+from reduction_strategies import apply_strategy_to_top_emitters, cleanup_strategy
+from visualization import ChartWorker, comparison_data, MATPLOTLIB_AVAILABLE
+from monitor_core import (
+    MonitorCore, window_delta, mitigation_task, exporter_task, history_task, publish_task, ainput
+)
+from topk import TopKTracker
+from energy_calc import add_model_arguments, configure_from_args
+
+STRATEGIES = {
+    '1': ('pause', "PAUSE Processes"),
+    '2': ('renice', "LOWER PRIORITY"),
+    '3': ('limit', "LIMIT CPU"),
+    '4': ('kill', "TERMINATE Processes"),
+}
+
+
+def build_collector(args):
+    """
+    Collector selected on the command line
+    Returns: (collect function, cleanup function) or None if it cannot start
+    """
+    recorder = None
+    if args.record:
+        from replay import TraceWriter
+        recorder = TraceWriter(args.record)
+
+    def closing(cleanup):
+        def close():
+            cleanup()
+            if recorder is not None:
+                recorder.close()
+        return close
+
+    if args.source == 'ebpf':
+        if os.geteuid() != 0:
+            print("\n❌ Error: eBPF requires root privileges")
+            return None
+        from main_ebpf_interactive import eBPFCarbonMonitor
+        from ebpf_loader import filter_from_args
+        monitor = eBPFCarbonMonitor(net_attribution=args.net_attribution, recorder=recorder,
+                                    task_filter=filter_from_args(args), pin=args.pin)
+        if not monitor.load_ebpf_programs():
+            return None
+        return monitor.collect_metrics, closing(monitor.cleanup)
+
+    from parallel_collector import ParallelCollector
+    collector = ParallelCollector(workers=args.workers, recorder=recorder)
+    return collector.collect, closing(collector.close)
+
+
+def print_alerts(anomalies):
+    """One line per anomaly, so alerts do not bury the menu"""
+    for anomaly in anomalies:
+        kind = "spike" if anomaly.kind == 'spike' else "sustained"
+        print(f"\n   🚨 PID {anomaly.pid}: {kind} {anomaly.rate_watts:.2f} W "
+              f"(baseline {anomaly.baseline_watts:.2f} W)")
+
+
+async def choose_strategy():
+    """Menu loop; returns (strategy, name), (None, None) to just monitor, or None to exit"""
+    from main_interactive import display_menu
+
+    while True:
+        display_menu()
+        choice = (await ainput("\nEnter your choice (0-5): ")).strip()
+
+        if choice == '0':
+            return None
+        if choice == '5':
+            print("\n📊 Skipping reduction strategy. Monitoring only.")
+            return None, None
+        if choice not in STRATEGIES:
+            print("\n❌ Invalid choice. Please try again.")
+            continue
+
+        strategy, name = STRATEGIES[choice]
+        if strategy == 'kill':
+            print("\n⚠️  WARNING: This will kill processes!")
+            if (await ainput("   Are you sure? (yes/no): ")).strip().lower() != 'yes':
+                print("   Cancelled.")
+                continue
+        return strategy, name
+
+
+async def interactive(core: MonitorCore, args, charts: ChartWorker):
+    """Baseline, strategy, concurrent before/after windows, comparison"""
+    window = args.window
+
+    print(f"\n📊 Step 1: Collecting baseline metrics ({window:.0f}s window)...")
+    first, last = await core.window(time.time(), window)
+    baseline = window_delta(first, last, window)
+    if not baseline:
+        print("\n⚠️  No significant process activity detected.")
+        return
+
+    baseline_ranked = TopKTracker(baseline)
+    names = display_top_emitters(baseline, top_n=10, ranked=baseline_ranked)
+    print(f"\n📊 Energy in window: {baseline_ranked.total_energy:.6f} J")
+    print(f"🌍 Carbon in window: {baseline_ranked.total_carbon:.6f} g CO2")
+
+    chosen = await choose_strategy()
+    if chosen is None:
+        print("\n👋 Goodbye!")
+        return
+    strategy, strategy_name = chosen
+
+    # Targets are ranked on the most recent window, since sampling went on
+    # while the menu was open
+    action_start = time.time()
+    before_samples = await core.window_samples(action_start - window, window)
+    before_metrics = window_delta(before_samples[0], before_samples[-1], window)
+    before_ranked = TopKTracker(before_metrics)
+
+    affected_pids = []
+    try:
+        if strategy:
+            try:
+                answer = await ainput("\n   How many top processes to target? (1-10): ")
+                num_targets = max(1, min(10, int(answer.strip())))
+            except ValueError:
+                num_targets = 5
+                print(f"   Using default: {num_targets}")
+
+            print(f"\n🎯 Step 2: Applying '{strategy_name}' strategy (sampling continues)...")
+            affected_pids = await core.run_blocking(
+                apply_strategy_to_top_emitters, before_metrics, strategy, num_targets, before_ranked)
+            if not affected_pids:
+                print("\n⚠️  No processes were affected.")
+                return
+            print(f"\n✅ Successfully affected {len(affected_pids)} processes")
+
+        # Same-length window starting when the action took effect
+        print(f"\n📊 Step 3: Measuring the {window:.0f}s after the action...")
+        after_samples = await core.window_samples(time.time(), window)
+        after_metrics = window_delta(after_samples[0], after_samples[-1], window)
+
+        # Snapshots are the window deltas; the rate statistics come from
+        # every sampling interval inside each window
+        comparison = EmissionComparison()
+        comparison.record_before_window(before_samples, ranked=before_ranked, metrics=before_metrics)
+        comparison.record_after_window(after_samples, ranked=TopKTracker(after_metrics),
+                                       metrics=after_metrics)
+        comparison.display_comparison()
+
+        # Rendered by the chart worker process; PNG needs matplotlib,
+        # the HTML/SVG report does not
+        output_file = 'carbon_comparison.png' if MATPLOTLIB_AVAILABLE else 'carbon_comparison.html'
+        print("\n📈 Step 4: Generating visualization in the background...")
+        charts.submit(comparison_data(before_metrics, after_metrics, 10, before_ranked, names),
+                      output_file, callback=lambda path: print(f"\n📈 Chart saved to: {path}"))
+    finally:
+        # Also on Ctrl+C: never leave processes stopped
+        if strategy == 'pause' and affected_pids:
+            print("\n🔄 Cleanup...")
+            cleanup_strategy(strategy, affected_pids)
+
+
+async def run(args) -> int:
+    # Forked before the collector starts any threads
+    charts = ChartWorker()
+    collector = build_collector(args)
+    if collector is None:
+        charts.close()
+        return 1
+    collect, cleanup = collector
+
+    agent = None
+    history = None
+    publisher = None
+    try:
+        async with MonitorCore(collect, interval=args.interval) as core:
+            background = [asyncio.ensure_future(mitigation_task(core, on_anomalies=print_alerts))]
+            if args.connect:
+                from fleet import FleetAgent
+                agent = FleetAgent(args.connect)
+                background.append(asyncio.ensure_future(exporter_task(core, agent)))
+            if args.history:
+                from trends import HistoryWriter
+                history = HistoryWriter(args.history)
+                background.append(asyncio.ensure_future(history_task(core, history)))
+            if args.publish:
+                from snapshot import SnapshotPublisher
+                publisher = SnapshotPublisher(args.publish)
+                background.append(asyncio.ensure_future(publish_task(core, publisher)))
+
+            try:
+                await interactive(core, args, charts)
+            finally:
+                for task in background:
+                    task.cancel()
+    finally:
+        if agent is not None:
+            agent.close()
+        if history is not None:
+            history.close()
+        if publisher is not None:
+            publisher.close()
+        cleanup()
+        # Waits for a chart still being drawn
+        charts.close()
+    return 0
+
+
+def main():
+    from ebpf_loader import NET_ATTRIBUTION_MODES, DEFAULT_MIN_CPU_NS, add_filter_arguments
+    from snapshot import DEFAULT_SNAPSHOT_PATH
+
+    parser = argparse.ArgumentParser(description="Interactive carbon emission monitor (concurrent)")
+    parser.add_argument('--source', choices=('psutil', 'ebpf'), default='psutil',
+                        help="collector to run (default: psutil)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for the psutil scan (default: 1, sequential)")
+    parser.add_argument('--net-attribution', choices=NET_ATTRIBUTION_MODES, default='device',
+                        help="eBPF network attribution (default: device)")
+    parser.add_argument('--pin', action='store_true',
+                        help="keep the eBPF counters pinned in /sys/fs/bpf across restarts (see carbon.py teardown)")
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="seconds between samples (default: 1)")
+    parser.add_argument('--window', type=float, default=5.0,
+                        help="length of the before/after windows in seconds (default: 5)")
+    parser.add_argument('--connect', metavar='ADDR',
+                        help="also ship samples to a fleet aggregator (HOST:PORT or unix:PATH)")
+    parser.add_argument('--history', metavar='PATH',
+                        help="append per-process emission rates to a history file (see carbon.py trends)")
+    parser.add_argument('--record', metavar='PATH',
+                        help="record the raw collector input to a trace file (see carbon.py replay)")
+    parser.add_argument('--publish', nargs='?', const=DEFAULT_SNAPSHOT_PATH, metavar='PATH',
+                        help=f"share every tick with local readers (see carbon.py top; default path: {DEFAULT_SNAPSHOT_PATH})")
+    add_model_arguments(parser)
+    add_policy_arguments(parser)
+    add_filter_arguments(parser, min_cpu_ms=DEFAULT_MIN_CPU_NS / 1_000_000)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_policy_from_args(args)
+
+    print("\n" + "="*70)
+    print("🌍 CARBON EMISSION MONITOR (Concurrent Edition)")
+    print("="*70)
+    print("\nPress Ctrl+C at any time to exit safely.")
+
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Interrupted by user")
+        return 0
+    except EOFError:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
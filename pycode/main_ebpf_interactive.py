@@ -9,52 +9,71 @@ REQUIRES: Native Linux with eBPF support and kernel headers
 import sys
 sys.path.insert(0, '/usr/lib/python3/dist-packages')
 
+import argparse
 import os
 import time
 import signal
 from typing import List, Tuple
 
 try:
-    from bcc import BPF
+    import bcc  # Programs are compiled by ebpf_loader
 except ImportError:
     print("❌ Error: BCC not available")
     print("Install with: sudo apt-get install python3-bpfcc bpfcc-tools")
     sys.exit(1)
 
-from energy_calc import estimate_energy, estimate_carbon
-from comparison import EmissionComparison, display_top_emitters
+from energy_calc import add_model_arguments, configure_from_args, get_model
+from ebpf_loader import (
+    load_carbon_monitor, read_task_stats, read_freq_histogram, task_stats_rows, rows_to_metrics,
+    apply_task_filter, add_filter_arguments, filter_from_args, counters_started_at, TaskFilter,
+    DEFAULT_MIN_CPU_NS,
+    NET_ATTRIBUTION_MODES
+)
+from resident_memory import RssIntegrator
+from comparison import EmissionComparison, collect_window, display_top_emitters
+from policy import add_policy_arguments, configure_policy_from_args
 from reduction_strategies import apply_strategy_to_top_emitters, cleanup_strategy
 from visualization import create_comparison_chart, MATPLOTLIB_AVAILABLE
+from topk import TopKTracker
 import psutil
 
 
 class eBPFCarbonMonitor:
     """eBPF-based carbon emission monitor"""
     
-    def __init__(self):
-        self.bpf_cpu = None
-        self.bpf_net = None
-        self.cpu_map = None
-        self.net_map = None
+    def __init__(self, net_attribution: str = 'device', recorder=None,
+                 task_filter: TaskFilter = TaskFilter(min_cpu_ns=DEFAULT_MIN_CPU_NS), pin: bool = False):
+        """
+        recorder: replay.TraceWriter receiving the raw rows of every collection
+        task_filter: Processes accounted in kernel (default: those above 50ms of CPU)
+        pin: Keep the counters pinned across restarts
+        """
+        self.net_attribution = net_attribution
+        self.recorder = recorder
+        self.task_filter = task_filter
+        self.pin = pin
+        self.bpf = None
+        self.stats_map = None
+        self.memory = RssIntegrator()
         
     def load_ebpf_programs(self):
         """Load and attach eBPF programs"""
         print("\n📡 Loading eBPF programs...")
+        load_start = time.perf_counter()
         
         try:
-            # Load CPU monitor
-            print("   Loading CPU monitor (eBPF/cpu_monitor.c)...")
-            self.bpf_cpu = BPF(src_file="eBPF/cpu_monitor.c")
-            self.cpu_map = self.bpf_cpu["cpu_usage"]
-            print("   ✅ CPU monitor loaded")
+            # CPU and network probes share one BPF object and one map
+            print("   Compiling CPU + Network monitor (eBPF/cpu_monitor.c, eBPF/net_monitor.c)...")
+            print(f"   Network attribution: {self.net_attribution}")
+            self.bpf = load_carbon_monitor(net_attribution=self.net_attribution,
+                                           task_filter=self.task_filter, pin=self.pin)
+            self.stats_map = self.bpf["task_stats"]
+            # Memory energy is charged from when the counters started
+            self.memory = RssIntegrator(since=counters_started_at(self.bpf))
+            print("   ✅ CPU + Network monitor loaded")
             
-            # Load Network monitor
-            print("   Loading Network monitor (eBPF/net_monitor.c)...")
-            self.bpf_net = BPF(src_file="eBPF/net_monitor.c")
-            self.net_map = self.bpf_net["packet_count"]
-            print("   ✅ Network monitor loaded")
-            
-            print("\n✅ All eBPF programs loaded successfully!")
+            load_time = time.perf_counter() - load_start
+            print(f"\n✅ All eBPF programs loaded successfully! ({load_time:.2f}s)")
             return True
             
         except Exception as e:
@@ -71,35 +90,34 @@ class eBPFCarbonMonitor:
         Collect metrics from eBPF maps
         Returns: List of (pid, cpu_time_ns, packets, energy, carbon)
         """
-        metrics = []
-        
-        # Iterate through CPU usage map
-        for k, v in self.cpu_map.items():
-            pid = k.value
-            cpu_time_ns = v.value
-            
-            # Get packet count for this PID
-            try:
-                packets_key = self.net_map.Key(pid)
-                packets = self.net_map[packets_key].value
-            except KeyError:
-                packets = 0
-            
-            # Only include processes with significant activity
-            if cpu_time_ns > 50_000_000:  # > 50ms
-                energy = estimate_energy(cpu_time_ns, packets)
-                carbon = estimate_carbon(energy)
-                
-                metrics.append((pid, cpu_time_ns, packets, energy, carbon))
-        
-        return metrics
+        # Every counter for a process is in its task_stats entry; processes
+        # below the threshold have none yet, as the kernel holds them back
+        rows = task_stats_rows(
+            read_task_stats(self.stats_map),
+            min_cpu_ns=self.task_filter.min_cpu_ns,
+            memory=self.memory
+        )
+        freq_histogram = self.read_freq_histogram()
+        if self.recorder is not None:
+            self.recorder.write_ebpf(rows, freq_histogram)
+        return rows_to_metrics(rows, freq_histogram)
+    
+    def set_filter(self, task_filter: TaskFilter):
+        """Change which processes are accounted, without reloading the program"""
+        self.task_filter = task_filter
+        if self.bpf:
+            apply_task_filter(self.bpf, task_filter)
+    
+    def read_freq_histogram(self):
+        """Frequency histogram, only read when the model (or a trace) can use it"""
+        if get_model().cpu_power_curve is None and self.recorder is None:
+            return None
+        return read_freq_histogram(self.bpf["cpu_freq_time"])
     
     def cleanup(self):
         """Cleanup eBPF resources"""
-        if self.bpf_cpu:
-            self.bpf_cpu.cleanup()
-        if self.bpf_net:
-            self.bpf_net.cleanup()
+        if self.bpf:
+            self.bpf.cleanup()
 
 
 def display_menu():
@@ -129,6 +147,19 @@ def display_menu():
 def main():
     """Main eBPF interactive program"""
     
+    parser = argparse.ArgumentParser(description="Interactive carbon emission monitor (eBPF)")
+    parser.add_argument('--net-attribution', choices=NET_ATTRIBUTION_MODES, default='device',
+                        help="count traffic per packet at the device (default) or per call at the socket layer")
+    parser.add_argument('--pin', action='store_true',
+                        help="keep the counters pinned in /sys/fs/bpf across restarts (see carbon.py teardown)")
+    add_model_arguments(parser)
+    add_policy_arguments(parser)
+    add_filter_arguments(parser, min_cpu_ms=DEFAULT_MIN_CPU_NS / 1_000_000)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_policy_from_args(args)
+    task_filter = filter_from_args(args)
+    
     # Check if running as root
     if os.geteuid() != 0:
         print("\n❌ Error: eBPF requires root privileges")
@@ -144,7 +175,7 @@ def main():
     print("="*70)
     
     # Initialize monitor
-    monitor = eBPFCarbonMonitor()
+    monitor = eBPFCarbonMonitor(net_attribution=args.net_attribution, task_filter=task_filter, pin=args.pin)
     
     try:
         # Load eBPF programs
@@ -155,10 +186,10 @@ def main():
         print("\n📊 Step 1: Collecting baseline metrics...")
         print("   (Monitoring with eBPF for 5 seconds...)")
         
-        # Let eBPF collect some data
-        time.sleep(5)
-        
-        before_metrics = monitor.collect_metrics()
+        # Let eBPF collect some data, reading the maps at intervals so the
+        # comparison gets confidence intervals
+        before_samples = collect_window(monitor.collect_metrics, 5)
+        before_metrics = before_samples[-1][1]
         
         if not before_metrics:
             print("\n⚠️  No significant process activity detected.")
@@ -168,12 +199,15 @@ def main():
         
         print(f"   ✅ Collected metrics for {len(before_metrics)} processes via eBPF")
         
+        # Rank once; display, strategy targeting and the chart reuse it
+        before_ranked = TopKTracker(before_metrics)
+        
         # Display top emitters
-        display_top_emitters(before_metrics, top_n=10)
+        names = display_top_emitters(before_metrics, top_n=10, ranked=before_ranked)
         
         # Calculate total emissions
-        total_energy_before = sum(m[3] for m in before_metrics)
-        total_carbon_before = sum(m[4] for m in before_metrics)
+        total_energy_before = before_ranked.total_energy
+        total_carbon_before = before_ranked.total_carbon
         
         print(f"\n📊 Total Energy (Before): {total_energy_before:.6f} J")
         print(f"🌍 Total Carbon (Before): {total_carbon_before:.6f} g CO2")
@@ -248,7 +282,8 @@ def main():
                 num_targets = 5
                 print(f"   Using default: {num_targets}")
             
-            affected_pids = apply_strategy_to_top_emitters(before_metrics, strategy, num_targets)
+            affected_pids = apply_strategy_to_top_emitters(before_metrics, strategy, num_targets,
+                                                           ranked=before_ranked)
             
             if not affected_pids:
                 print("\n⚠️  No processes were affected. Exiting.")
@@ -266,24 +301,28 @@ def main():
         # Step 4: Collect AFTER metrics
         print("\n📊 Step 3: Collecting metrics after reduction...")
         print("   (eBPF monitoring for 5 more seconds...)")
-        time.sleep(5)
         
-        after_metrics = monitor.collect_metrics()
+        after_samples = collect_window(monitor.collect_metrics, 5)
+        after_metrics = after_samples[-1][1]
         print(f"   ✅ Collected metrics for {len(after_metrics)} processes via eBPF")
         
         # Step 5: Compare and display results
         comparison = EmissionComparison()
-        comparison.record_before(before_metrics)
-        comparison.record_after(after_metrics)
+        comparison.record_before_window(before_samples, ranked=before_ranked)
+        comparison.record_after_window(after_samples, ranked=TopKTracker(after_metrics))
         
         comparison.display_comparison()
         
         # Step 6: Create visualization (optional)
+        print("\n📈 Step 4: Generating visualization...")
         if MATPLOTLIB_AVAILABLE:
-            print("\n📈 Step 4: Generating visualization...")
-            create_comparison_chart(before_metrics, after_metrics, 'carbon_comparison_ebpf.png')
+            create_comparison_chart(before_metrics, after_metrics, 'carbon_comparison_ebpf.png',
+                                    ranked_before=before_ranked, names=names)
         else:
-            print("\n💡 Tip: Install matplotlib for visual charts:")
+            # Plain HTML/SVG report needs no matplotlib
+            create_comparison_chart(before_metrics, after_metrics, 'carbon_comparison_ebpf.html',
+                                    ranked_before=before_ranked, names=names)
+            print("\n💡 Tip: Install matplotlib for PNG charts:")
             print("   sudo apt-get install python3-matplotlib")
         
         # Step 7: Cleanup
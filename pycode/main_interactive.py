@@ -9,54 +9,30 @@ This program monitors carbon emissions and applies REAL reduction strategies.
 import sys
 sys.path.insert(0, '/usr/lib/python3/dist-packages')
 
-import psutil
+import argparse
 import time
 import os
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-from energy_calc import estimate_energy, estimate_carbon
-from comparison import EmissionComparison, display_top_emitters
+from comparison import EmissionComparison, collect_window, display_top_emitters
+from policy import add_policy_arguments, configure_policy_from_args
 from reduction_strategies import apply_strategy_to_top_emitters, cleanup_strategy
 from visualization import create_comparison_chart, MATPLOTLIB_AVAILABLE
+from parallel_collector import ParallelCollector
+from topk import TopKTracker
+from energy_calc import add_model_arguments, configure_from_args
 
 
-def collect_metrics() -> List[Tuple[int, int, int, float, float]]:
+def collect_metrics(collector: Optional[ParallelCollector] = None) -> List[Tuple[int, int, int, float, float]]:
     """
     Collect current system metrics
+    collector: Parallel collector to scan with (sequential scan if None)
     Returns: List of (pid, cpu_time_ns, packets_estimate, energy, carbon)
     """
-    metrics = []
+    if collector is None:
+        collector = ParallelCollector(workers=1)
     
-    for proc in psutil.process_iter(['pid', 'name', 'cpu_times', 'num_ctx_switches']):
-        try:
-            pid = proc.info['pid']
-            cpu_times = proc.info['cpu_times']
-            
-            if cpu_times is None:
-                continue
-            
-            # Calculate CPU time in nanoseconds
-            cpu_time_s = cpu_times.user + cpu_times.system
-            cpu_time_ns = int(cpu_time_s * 1_000_000_000)
-            
-            # Estimate network activity
-            ctx_switches = proc.info['num_ctx_switches']
-            if ctx_switches:
-                packets_estimate = ctx_switches.voluntary + ctx_switches.involuntary
-            else:
-                packets_estimate = 0
-            
-            # Only track processes with significant activity
-            if cpu_time_ns > 50_000_000:  # > 50ms
-                energy = estimate_energy(cpu_time_ns, packets_estimate)
-                carbon = estimate_carbon(energy)
-                
-                metrics.append((pid, cpu_time_ns, packets_estimate, energy, carbon))
-        
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            continue
-    
-    return metrics
+    return collector.collect()
 
 
 def display_menu():
@@ -86,6 +62,17 @@ def display_menu():
 def main():
     """Main interactive program"""
     
+    parser = argparse.ArgumentParser(description="Interactive carbon emission monitor (psutil)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for the /proc scan (default: 1, sequential)")
+    add_model_arguments(parser)
+    add_policy_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_policy_from_args(args)
+    
+    collector = ParallelCollector(workers=args.workers)
+    
     print("\n" + "="*70)
     print("🌍 CARBON EMISSION MONITOR & REDUCTION SYSTEM")
     print("="*70)
@@ -98,9 +85,10 @@ def main():
         # Step 1: Collect BEFORE metrics
         print("\n📊 Step 1: Collecting baseline metrics...")
         print("   (Monitoring system for 3 seconds...)")
-        time.sleep(3)
         
-        before_metrics = collect_metrics()
+        # Interval samples give the comparison its confidence intervals
+        before_samples = collect_window(lambda: collect_metrics(collector), 3)
+        before_metrics = before_samples[-1][1]
         
         if not before_metrics:
             print("\n⚠️  No significant process activity detected.")
@@ -109,12 +97,15 @@ def main():
         
         print(f"   ✅ Collected metrics for {len(before_metrics)} processes")
         
+        # Rank once; display, strategy targeting and the chart reuse it
+        before_ranked = TopKTracker(before_metrics)
+        
         # Display top emitters
-        display_top_emitters(before_metrics, top_n=10)
+        names = display_top_emitters(before_metrics, top_n=10, ranked=before_ranked)
         
         # Calculate total emissions
-        total_energy_before = sum(m[3] for m in before_metrics)
-        total_carbon_before = sum(m[4] for m in before_metrics)
+        total_energy_before = before_ranked.total_energy
+        total_carbon_before = before_ranked.total_carbon
         
         print(f"\n📊 Total Energy (Before): {total_energy_before:.6f} J")
         print(f"🌍 Total Carbon (Before): {total_carbon_before:.6f} g CO2")
@@ -187,7 +178,8 @@ def main():
                 num_targets = 5
                 print(f"   Using default: {num_targets}")
             
-            affected_pids = apply_strategy_to_top_emitters(before_metrics, strategy, num_targets)
+            affected_pids = apply_strategy_to_top_emitters(before_metrics, strategy, num_targets,
+                                                           ranked=before_ranked)
             
             if not affected_pids:
                 print("\n⚠️  No processes were affected. Exiting.")
@@ -203,24 +195,28 @@ def main():
         # Step 4: Collect AFTER metrics
         print("\n📊 Step 3: Collecting metrics after reduction...")
         print("   (Monitoring system for 3 seconds...)")
-        time.sleep(3)
         
-        after_metrics = collect_metrics()
+        after_samples = collect_window(lambda: collect_metrics(collector), 3)
+        after_metrics = after_samples[-1][1]
         print(f"   ✅ Collected metrics for {len(after_metrics)} processes")
         
         # Step 5: Compare and display results
         comparison = EmissionComparison()
-        comparison.record_before(before_metrics)
-        comparison.record_after(after_metrics)
+        comparison.record_before_window(before_samples, ranked=before_ranked)
+        comparison.record_after_window(after_samples, ranked=TopKTracker(after_metrics))
         
         comparison.display_comparison()
         
         # Step 6: Create visualization (optional)
+        print("\n📈 Step 4: Generating visualization...")
         if MATPLOTLIB_AVAILABLE:
-            print("\n📈 Step 4: Generating visualization...")
-            create_comparison_chart(before_metrics, after_metrics, 'carbon_comparison.png')
+            create_comparison_chart(before_metrics, after_metrics, 'carbon_comparison.png',
+                                    ranked_before=before_ranked, names=names)
         else:
-            print("\n💡 Tip: Install matplotlib for visual charts:")
+            # Plain HTML/SVG report needs no matplotlib
+            create_comparison_chart(before_metrics, after_metrics, 'carbon_comparison.html',
+                                    ranked_before=before_ranked, names=names)
+            print("\n💡 Tip: Install matplotlib for PNG charts:")
             print("   sudo apt-get install python3-matplotlib")
         
         # Step 7: Cleanup
@@ -251,6 +247,9 @@ def main():
         print(f"\n❌ Error: {e}")
         import traceback
         traceback.print_exc()
+    
+    finally:
+        collector.close()
 
 
 if __name__ == "__main__":
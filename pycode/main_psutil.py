@@ -7,62 +7,82 @@ Uses psutil instead of eBPF for WSL2 compatibility
 import sys
 sys.path.insert(0, '/usr/lib/python3/dist-packages')
 
-import psutil
+import argparse
 import time
-from energy_calc import estimate_energy, estimate_carbon
+import psutil
 from display import display_table
 from mitigation import apply_mitigation
+from parallel_collector import ParallelCollector
+from topk import TopKTracker
+from job_profiles import RunTracker, add_profile_arguments, open_profile_store
+from policy import add_policy_arguments, configure_policy_from_args
+from reduction_strategies import CarbonReducer, apply_strategy_to_known_job
+from energy_calc import add_model_arguments, configure_from_args
+from trends import HistoryWriter
+from replay import TraceWriter
+from snapshot import SnapshotPublisher, DEFAULT_SNAPSHOT_PATH
+
+parser = argparse.ArgumentParser(description="Carbon emission monitor (psutil)")
+parser.add_argument('--workers', type=int, default=1,
+                    help="worker processes for the /proc scan (default: 1, sequential)")
+parser.add_argument('--history', metavar='PATH',
+                    help="append per-process emission rates to a history file (see carbon.py trends)")
+parser.add_argument('--record', metavar='PATH',
+                    help="record the raw /proc readings to a trace file (see carbon.py replay)")
+parser.add_argument('--publish', nargs='?', const=DEFAULT_SNAPSHOT_PATH, metavar='PATH',
+                    help=f"share every tick with local readers (see carbon.py top; default path: {DEFAULT_SNAPSHOT_PATH})")
+add_model_arguments(parser)
+add_policy_arguments(parser)
+add_profile_arguments(parser)
+args = parser.parse_args()
+configure_from_args(args)
+configure_policy_from_args(args)
 
 print("🌍 Carbon Emission Monitor (WSL2-Compatible)")
 print("=" * 50)
 print("Monitoring system processes for carbon emissions...")
 print("Press Ctrl+C to stop\n")
 
-# Track cumulative CPU time
-process_data = {}
+# Only track processes with significant activity (> 100ms)
+recorder = TraceWriter(args.record) if args.record else None
+collector = ParallelCollector(workers=args.workers, min_cpu_ns=100_000_000, recorder=recorder)
+
+# Ranking kept up to date across ticks instead of re-sorting every sample
+tracker = TopKTracker()
+
+# Follow the profiled jobs started from now on and remember their runs. Without
+# exec events, new processes are found by diffing the PID list each tick.
+store = open_profile_store(args)
+runs = RunTracker(store, args.profile_command) if store is not None else None
+reducer = CarbonReducer()
+known_pids = set(psutil.pids())
+history = HistoryWriter(args.history) if args.history else None
+publisher = SnapshotPublisher(args.publish) if args.publish else None
 
 try:
     while True:
-        metrics = []
+        if runs is not None:
+            pids = set(psutil.pids())
+            for pid in pids - known_pids:
+                profile = runs.start(pid)
+                apply_strategy_to_known_job(reducer, pid, profile, args.proactive, args.heavy_job_energy)
+            known_pids = pids
         
-        # Get all running processes
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_times', 'num_ctx_switches']):
-            try:
-                pid = proc.info['pid']
-                cpu_times = proc.info['cpu_times']
-                
-                if cpu_times is None:
-                    continue
-                
-                # Calculate CPU time in nanoseconds (user + system time)
-                cpu_time_s = cpu_times.user + cpu_times.system
-                cpu_time_ns = int(cpu_time_s * 1_000_000_000)
-                
-                # Estimate network activity from context switches (rough approximation)
-                # More context switches often correlate with I/O operations
-                ctx_switches = proc.info['num_ctx_switches']
-                if ctx_switches:
-                    packets_estimate = ctx_switches.voluntary + ctx_switches.involuntary
-                else:
-                    packets_estimate = 0
-                
-                # Only track processes with significant activity
-                if cpu_time_ns > 100_000_000:  # > 100ms
-                    energy = estimate_energy(cpu_time_ns, packets_estimate)
-                    carbon = estimate_carbon(energy)
-                    
-                    metrics.append((pid, cpu_time_ns, packets_estimate, energy, carbon))
-            
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                continue
+        metrics = collector.collect()
         
-        # Sort by carbon emissions (highest first)
-        metrics.sort(key=lambda x: x[4], reverse=True)
+        tracker.update_many(metrics)
+        if runs is not None:
+            runs.update(metrics)
+        if history is not None:
+            history.append(metrics)
+        if publisher is not None:
+            publisher.publish(metrics)
         
-        # Display top 20 processes
+        # Display top 20 processes (highest carbon first)
         if metrics:
-            display_table(metrics[:20])
-            apply_mitigation(metrics[:20])
+            display_table(tracker.top(20))
+            # Needs every process to keep per-process rate statistics
+            apply_mitigation(metrics)
         else:
             print("No significant process activity detected...")
         
@@ -71,3 +91,16 @@ try:
 except KeyboardInterrupt:
     print("\n\n✓ Monitoring stopped")
     print("Session complete.")
+
+finally:
+    # Undo what --proactive did to processes that outlive the monitor
+    reducer.restore_all()
+    collector.close()
+    if store is not None:
+        store.close()
+    if history is not None:
+        history.close()
+    if recorder is not None:
+        recorder.close()
+    if publisher is not None:
+        publisher.close()
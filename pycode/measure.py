@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Command Energy Measurement
+Energy and carbon of one command and every process it starts
+
+    python3 pycode/carbon.py run -- make -j8
+    sudo python3 pycode/carbon.py run --output build.json -- ./run_tests.sh
+
+With eBPF (root, BCC), the program is compiled with TRACK_TREE: the
+command's PID is put in the `tracked` map before it is allowed to exec,
+sched_process_fork adds every descendant, and only tracked processes get
+task_stats entries. Without eBPF, the command's resource usage comes from
+wait4() (which includes every descendant it waited for) and resident
+memory is sampled from the process tree while it runs.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import psutil
+
+from energy_calc import estimate_energy, estimate_carbon
+
+# Seconds between resident-memory samples of the running tree
+POLL_INTERVAL = 0.2
+
+# Unit of ru_inblock/ru_oublock
+RUSAGE_BLOCK_BYTES = 512
+
+# Same assumption as the psutil collector (parallel_collector.py)
+AVG_IO_REQUEST_BYTES = 64 * 1024
+
+
+def _tree_rss(root: int) -> Dict[int, int]:
+    """Resident memory of root and its live descendants"""
+    try:
+        parent = psutil.Process(root)
+        processes = [parent] + parent.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return {}
+    rss = {}
+    for proc in processes:
+        try:
+            rss[proc.pid] = proc.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+    return rss
+
+
+def _report(command: List[str], source: str, exit_code: int, duration_s: float, processes: int,
+            cpu_time_ns: int, packets: int, io_bytes: int, io_requests: int,
+            rss_byte_seconds: float, wakeups: int = 0) -> dict:
+    energy = float(estimate_energy(cpu_time_ns, packets, io_bytes, io_requests, rss_byte_seconds,
+                                   wakeups=wakeups))
+    return {
+        'command': command,
+        'source': source,
+        'exit_code': exit_code,
+        'duration_s': round(duration_s, 3),
+        'processes': processes,
+        'cpu_time_ns': int(cpu_time_ns),
+        'packets': int(packets),
+        'io_bytes': int(io_bytes),
+        'wakeups': int(wakeups),
+        'energy_j': energy,
+        'carbon_g': float(estimate_carbon(energy)),
+    }
+
+
+def measure_psutil(command: List[str], interval: float = POLL_INTERVAL, cwd: Optional[str] = None) -> dict:
+    """
+    Run command and measure it from wait4() resource usage plus sampled RSS.
+    Context switches stand in for packets, as in the psutil collector.
+    """
+    started = time.time()
+    proc = subprocess.Popen(command, cwd=cwd)
+
+    # wait4 blocks in a thread, so the end time is exact while this thread
+    # samples memory
+    waited = {}
+
+    def wait():
+        waited['result'] = os.wait4(proc.pid, 0)
+        waited['end'] = time.time()
+
+    waiter = threading.Thread(target=wait, daemon=True)
+    waiter.start()
+
+    seen = set()
+    rss_byte_seconds = 0.0
+    last_poll = started
+    while waiter.is_alive():
+        rss = _tree_rss(proc.pid)
+        now = time.time()
+        seen.update(rss)
+        rss_byte_seconds += sum(rss.values()) * (now - last_poll)
+        last_poll = now
+        waiter.join(interval)
+
+    _, status, usage = waited['result']
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    io_bytes = (usage.ru_inblock + usage.ru_oublock) * RUSAGE_BLOCK_BYTES
+    return _report(
+        command, 'psutil', proc.returncode, waited['end'] - started, len(seen) or 1,
+        cpu_time_ns=int((usage.ru_utime + usage.ru_stime) * 1_000_000_000),
+        packets=usage.ru_nvcsw + usage.ru_nivcsw,
+        io_bytes=io_bytes,
+        io_requests=-(-io_bytes // AVG_IO_REQUEST_BYTES),
+        rss_byte_seconds=rss_byte_seconds,
+    )
+
+
+def measure_ebpf(command: List[str], interval: float = POLL_INTERVAL,
+                 net_attribution: str = 'device', cwd: Optional[str] = None) -> dict:
+    """Run command with in-kernel accounting of exactly its process tree"""
+    from ebpf_loader import load_carbon_monitor, read_task_stats, task_stats_rows
+    from resident_memory import RssIntegrator
+
+    bpf = load_carbon_monitor(net_attribution=net_attribution, cflags=['-DTRACK_TREE'])
+    stats_map = bpf["task_stats"]
+    tracked = bpf["tracked"]
+
+    # The child waits on the gate until its PID is tracked, so not even its
+    # first fork can escape. Popen() only returns once the child has
+    # exec'd, so the child sends its PID and a thread tracks and releases it.
+    ready_read, ready_write = os.pipe()
+    gate_read, gate_write = os.pipe()
+
+    def release():
+        pid = os.read(ready_read, 32)
+        if pid:
+            tracked[tracked.Key(int(pid))] = tracked.Leaf(1)
+        os.write(gate_write, b'x')
+
+    def wait_for_release():
+        os.write(ready_write, str(os.getpid()).encode())
+        os.read(gate_read, 1)
+
+    releaser = threading.Thread(target=release, daemon=True)
+    releaser.start()
+    started = time.time()
+    try:
+        proc = subprocess.Popen(command, cwd=cwd, preexec_fn=wait_for_release)
+    finally:
+        # Unblocks the releaser if the fork itself failed
+        os.close(ready_write)
+        releaser.join()
+        for fd in (ready_read, gate_read, gate_write):
+            os.close(fd)
+
+    # Memory is not tracked in kernel: keep the last RSS integral seen for
+    # each process, since exited processes can no longer be read
+    memory = RssIntegrator(since=started)
+    rss_byte_seconds: Dict[int, float] = {}
+    try:
+        while True:
+            try:
+                proc.wait(timeout=interval)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            for row in task_stats_rows(read_task_stats(stats_map), memory=memory):
+                rss_byte_seconds[int(row['pid'])] = max(rss_byte_seconds.get(int(row['pid']), 0.0),
+                                                        float(row['rss_byte_seconds']))
+        duration = time.time() - started
+        rows = task_stats_rows(read_task_stats(stats_map), memory=memory)
+    finally:
+        bpf.cleanup()
+
+    for row in rows:
+        rss_byte_seconds[int(row['pid'])] = max(rss_byte_seconds.get(int(row['pid']), 0.0),
+                                                float(row['rss_byte_seconds']))
+    return _report(
+        command, 'ebpf', proc.returncode, duration, len(rows),
+        cpu_time_ns=int(rows['cpu_ns'].sum()),
+        packets=int((rows['rx_packets'] + rows['tx_packets']).sum()),
+        io_bytes=int(rows['io_bytes'].sum()),
+        io_requests=int(rows['io_requests'].sum()),
+        rss_byte_seconds=sum(rss_byte_seconds.values()),
+        wakeups=int(rows['wakeups'].sum()),
+    )
+
+
+def ebpf_available() -> bool:
+    if os.geteuid() != 0:
+        return False
+    try:
+        import bcc  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def measure_command(command: List[str], source: str = 'auto', interval: float = POLL_INTERVAL,
+                    net_attribution: str = 'device', cwd: Optional[str] = None) -> dict:
+    """
+    Run command to completion and measure its whole process tree
+    source: 'ebpf', 'psutil' or 'auto' (eBPF when running as root with BCC)
+    cwd: Directory to run it in (default: the current one)
+    Returns: Report dict (command, source, exit_code, duration_s, processes,
+             cpu_time_ns, packets, io_bytes, wakeups, energy_j, carbon_g)
+    """
+    if source == 'auto':
+        source = 'ebpf' if ebpf_available() else 'psutil'
+    if source == 'ebpf':
+        return measure_ebpf(command, interval, net_attribution, cwd)
+    return measure_psutil(command, interval, cwd)
+
+
+def add_parser(subparsers):
+    """Register the `run` subcommand"""
+    from ebpf_loader import NET_ATTRIBUTION_MODES
+    from energy_calc import add_model_arguments
+
+    parser = subparsers.add_parser('run', help="measure the energy of a command and its children")
+    parser.add_argument('--source', choices=('auto', 'ebpf', 'psutil'), default='auto',
+                        help="accounting backend (default: eBPF when root and BCC are available)")
+    parser.add_argument('--net-attribution', choices=NET_ATTRIBUTION_MODES, default='device',
+                        help="eBPF network attribution (default: device)")
+    parser.add_argument('--output', metavar='FILE',
+                        help="write the JSON report here instead of stderr")
+    add_model_arguments(parser)
+    parser.add_argument('command', nargs='+', metavar='-- COMMAND',
+                        help="command to run, after --")
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py run`; exits with the command's exit code"""
+    from energy_calc import configure_from_args
+    configure_from_args(args)
+
+    command = args.command[1:] if args.command[0] == '--' else args.command
+    try:
+        report = measure_command(command, args.source, net_attribution=args.net_attribution)
+    except FileNotFoundError as e:
+        print(f"❌ Cannot run {command[0]}: {e}", file=sys.stderr)
+        return 127
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        # stdout belongs to the command
+        print(text, file=sys.stderr)
+    return report['exit_code'] if report['exit_code'] >= 0 else 128 - report['exit_code']
@@ -1,34 +1,52 @@
 import os
 import psutil
 
-def apply_mitigation(metrics):
+from anomaly import AnomalyDetector
+
+# Detector used when the caller does not pass one; keeps per-process state
+# between calls, so feed it every tick
+_detector = AnomalyDetector()
+
+
+def apply_mitigation(metrics, detector=None, report=True, now=None):
     """
-    Apply mitigation strategies for high-emission processes.
-    
+    Apply mitigation strategies for processes whose emission rate is abnormal.
+
     Args:
         metrics: List of tuples (pid, cpu_time_ns, packets, energy_j, carbon_g)
+                 for every process of this tick (absent PIDs are forgotten)
+        detector: AnomalyDetector to use (default: module-level detector)
+        report: Print the anomalies and suggestions
+        now: Sample time (default: time.monotonic()), e.g. from a replayed trace
+
+    Returns:
+        List of Anomaly found in this tick
     """
-    # Energy threshold in Joules (e.g., 1 Joule)
-    energy_threshold = 1.0
-    
-    high_emission_processes = []
-    
-    for pid, cpu_time_ns, packets, energy, carbon in metrics:
-        if energy > energy_threshold:
-            high_emission_processes.append((pid, energy, carbon))
-    
-    if high_emission_processes:
-        print("\n⚠️  High Emission Processes Detected:")
-        for pid, energy, carbon in high_emission_processes:
+    if detector is None:
+        detector = _detector
+
+    # Only statistical outliers, not every process with high cumulative energy
+    anomalies = detector.update(metrics, now=now)
+
+    if anomalies and report:
+        print("\n⚠️  Abnormal Emission Rates Detected:")
+        for anomaly in anomalies:
+            if anomaly.kind == 'spike':
+                detail = f"spike {anomaly.rate_watts:.2f} W (usually {anomaly.baseline_watts:.2f} W)"
+            else:
+                detail = f"sustained {anomaly.rate_watts:.2f} W (was {anomaly.baseline_watts:.2f} W)"
             try:
-                process = psutil.Process(pid)
+                process = psutil.Process(anomaly.pid)
                 proc_name = process.name()
-                print(f"   PID {pid} ({proc_name}): {energy:.4f} J, {carbon:.6f} g CO2")
+                print(f"   PID {anomaly.pid} ({proc_name}): {detail}, "
+                      f"{anomaly.energy:.4f} J, {anomaly.carbon:.6f} g CO2")
             except (psutil.NoSuchProcess, psutil.AccessDenied):
-                print(f"   PID {pid}: {energy:.4f} J, {carbon:.6f} g CO2 (process info unavailable)")
-        
+                print(f"   PID {anomaly.pid}: {detail}, "
+                      f"{anomaly.energy:.4f} J, {anomaly.carbon:.6f} g CO2 (process info unavailable)")
+
         print("\n💡 Mitigation Suggestions:")
         print("   • Consider closing unnecessary high-emission processes")
         print("   • Use 'nice' command to lower CPU priority: sudo renice +10 -p <PID>")
         print("   • Monitor and optimize resource-intensive applications")
 
+    return anomalies
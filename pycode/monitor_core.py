@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Asyncio Monitor Core
+Runs collection, mitigation, exporters and the UI as concurrent tasks
+
+Sampling never stops: the collector runs in an executor on a fixed
+schedule while reduction actions (which shell out to renice/cpulimit)
+run in the executor too, and every consumer reads samples from its own
+bounded queue. Before/after comparisons are taken from the sample
+history on either side of an action instead of pausing around it.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from mitigation import apply_mitigation
+from topk import TopKTracker
+
+Metric = Tuple[int, int, int, float, float]   # (pid, cpu_time_ns, packets, energy, carbon)
+
+
+class Sample(NamedTuple):
+    timestamp: float        # time.time() when the collection finished
+    metrics: List[Metric]
+
+
+def window_delta(start: Sample, end: Sample, duration: Optional[float] = None) -> List[Metric]:
+    """
+    Per-process activity between two samples of cumulative counters.
+    Processes that appeared after start are counted from zero; processes
+    with no activity in the window are left out.
+
+    duration: Scale the result to this many seconds, so windows whose
+              bracketing samples are not exactly the same distance apart
+              can be compared
+    """
+    scale = 1.0
+    elapsed = end.timestamp - start.timestamp
+    if duration is not None and elapsed > 0:
+        scale = duration / elapsed
+
+    before: Dict[int, Metric] = {m[0]: m for m in start.metrics}
+    delta = []
+    for pid, cpu_time_ns, packets, energy, carbon in end.metrics:
+        old = before.get(pid)
+        if old is not None and old[3] <= energy:
+            cpu_time_ns -= old[1]
+            packets -= old[2]
+            energy -= old[3]
+            carbon -= old[4]
+        if energy > 0:
+            delta.append((pid, int(cpu_time_ns * scale), int(packets * scale),
+                          energy * scale, carbon * scale))
+    return delta
+
+
+class MonitorCore:
+    """Samples a collector on a fixed schedule and fans samples out to tasks"""
+
+    def __init__(self, collect: Callable[[], List[Metric]], interval: float = 2.0,
+                 history: int = 300, workers: int = 4):
+        """
+        collect: Blocking function returning one tick of metrics
+        interval: Seconds between samples
+        history: Samples kept for windowed comparisons
+        workers: Executor threads shared by collection and actions
+        """
+        self.collect = collect
+        self.interval = interval
+        self.samples = collections.deque(maxlen=history)
+        self.tracker = TopKTracker()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        self._subscribers: List[asyncio.Queue] = []
+        self._new_sample = None
+        self._task = None
+
+    @property
+    def latest(self) -> Optional[Sample]:
+        return self.samples[-1] if self.samples else None
+
+    async def start(self):
+        self._new_sample = asyncio.Condition()
+        self._task = asyncio.ensure_future(self._sample_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def subscribe(self, maxsize: int = 4) -> asyncio.Queue:
+        """
+        Queue receiving every new Sample. A consumer that falls behind
+        loses its oldest samples rather than holding up the sampler.
+        """
+        queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking call (collection, strategy, chart) without stalling sampling"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def wait_until(self, timestamp: float) -> Sample:
+        """First sample taken at or after timestamp"""
+        async with self._new_sample:
+            while True:
+                for sample in self.samples:
+                    if sample.timestamp >= timestamp:
+                        return sample
+                await self._new_sample.wait()
+
+    def sample_before(self, timestamp: float) -> Optional[Sample]:
+        """Last sample taken at or before timestamp"""
+        found = None
+        for sample in self.samples:
+            if sample.timestamp > timestamp:
+                break
+            found = sample
+        return found
+
+    async def window(self, start: float, duration: float) -> Tuple[Sample, Sample]:
+        """
+        Samples bracketing [start, start + duration], waiting for the end
+        sample if it has not been taken yet
+        """
+        first = self.sample_before(start) or await self.wait_until(start)
+        last = await self.wait_until(start + duration)
+        return first, last
+
+    async def window_samples(self, start: float, duration: float) -> List[Sample]:
+        """Every sample from the one bracketing start to the one bracketing start + duration"""
+        first, last = await self.window(start, duration)
+        return [s for s in self.samples if first.timestamp <= s.timestamp <= last.timestamp]
+
+    async def _sample_loop(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            metrics = await self.run_blocking(self.collect)
+            sample = Sample(time.time(), metrics)
+            self.samples.append(sample)
+            self.tracker.update_many(metrics)
+
+            for queue in self._subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(sample)
+            async with self._new_sample:
+                self._new_sample.notify_all()
+
+            # Fixed schedule: a slow collection shortens the next wait
+            next_tick += self.interval
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+
+async def mitigation_task(core: MonitorCore, on_anomalies: Optional[Callable] = None):
+    """
+    Feed every sample to the anomaly-based mitigation path
+    on_anomalies: Called with each tick's anomalies instead of printing the
+                  full mitigation report (e.g. one-line alerts under a menu)
+    """
+    queue = core.subscribe()
+    try:
+        while True:
+            sample = await queue.get()
+            anomalies = apply_mitigation(sample.metrics, report=on_anomalies is None)
+            if anomalies and on_anomalies is not None:
+                on_anomalies(anomalies)
+    finally:
+        core.unsubscribe(queue)
+
+
+async def exporter_task(core: MonitorCore, agent):
+    """Ship every sample to a fleet aggregator (fleet.FleetAgent)"""
+    queue = core.subscribe()
+    try:
+        while True:
+            sample = await queue.get()
+            agent.submit(sample.metrics, sample.timestamp)
+    finally:
+        core.unsubscribe(queue)
+
+
+async def history_task(core: MonitorCore, writer):
+    """Append every sample to an emission history file (trends.HistoryWriter)"""
+    queue = core.subscribe()
+    try:
+        while True:
+            sample = await queue.get()
+            writer.append(sample.metrics, sample.timestamp)
+    finally:
+        core.unsubscribe(queue)
+
+
+async def publish_task(core: MonitorCore, publisher):
+    """Share every sample with local readers (snapshot.SnapshotPublisher)"""
+    queue = core.subscribe()
+    try:
+        while True:
+            sample = await queue.get()
+            publisher.publish(sample.metrics, sample.timestamp)
+    finally:
+        core.unsubscribe(queue)
+
+
+async def ainput(prompt: str = '') -> str:
+    """input() that lets other tasks run while waiting for the line"""
+    loop = asyncio.get_running_loop()
+    print(prompt, end='', flush=True)
+
+    future = loop.create_future()
+
+    def on_readable():
+        if not future.done():
+            future.set_result(sys.stdin.readline())
+
+    loop.add_reader(sys.stdin.fileno(), on_readable)
+    try:
+        line = await future
+    finally:
+        loop.remove_reader(sys.stdin.fileno())
+    if not line:
+        raise EOFError
+    return line.rstrip('\n')
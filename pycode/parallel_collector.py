@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Parallel Metrics Collector
+Shards the /proc PID listing across a pool of persistent worker processes
+
+Each worker scans a contiguous PID range with psutil and returns compact
+arrays (array.array, pickled as raw bytes) instead of per-process tuples.
+The parent merges the arrays and applies the energy model to all
+processes at once with NumPy.
+"""
+
+import os
+import signal
+import time
+from array import array
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psutil
+
+from cpufreq import read_cpu_frequencies
+from energy_calc import estimate_energy, estimate_carbon, get_model
+from resident_memory import RssIntegrator
+
+# Shards handed out per worker; more shards than workers evens out the load
+# when some PID ranges contain heavier processes than others.
+SHARDS_PER_WORKER = 4
+
+# Columns returned by a PID range scan: (name, array typecode)
+SCAN_COLUMNS = (
+    ('pid', 'q'),
+    ('cpu_time_ns', 'q'),
+    ('ctx_switches', 'q'),
+    ('io_bytes', 'q'),
+    ('rss', 'q'),
+    ('rss_byte_seconds', 'd'),      # filled in by the parent (ParallelCollector.collect)
+    ('cpu_num', 'q'),
+    ('start_time', 'd'),
+)
+
+# /proc/<pid>/io counts bytes but not block requests; assume one request
+# per this many bytes when charging per-request storage energy
+AVG_IO_REQUEST_BYTES = 64 * 1024
+
+
+def shard_pids(pids: List[int], num_shards: int) -> List[List[int]]:
+    """
+    Split a sorted PID list into contiguous ranges of roughly equal size
+    """
+    num_shards = max(1, min(num_shards, len(pids)))
+    size, extra = divmod(len(pids), num_shards)
+
+    shards = []
+    start = 0
+    for i in range(num_shards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(pids[start:end])
+        start = end
+    return shards
+
+
+def _init_worker():
+    """Leave Ctrl+C handling to the parent process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def scan_pid_range(pids: List[int], min_cpu_ns: int) -> Dict[str, array]:
+    """
+    Read CPU, I/O and memory usage for a range of PIDs
+
+    Runs inside a worker process (or inline for the sequential path).
+    Returns: Dict of column name -> array, see SCAN_COLUMNS
+    """
+    columns = {name: array(typecode) for name, typecode in SCAN_COLUMNS}
+
+    for pid in pids:
+        try:
+            proc = psutil.Process(pid)
+            with proc.oneshot():
+                cpu_times = proc.cpu_times()
+                cpu_time_ns = int((cpu_times.user + cpu_times.system) * 1_000_000_000)
+
+                # Only ship processes with significant activity back to the parent
+                if cpu_time_ns <= min_cpu_ns:
+                    continue
+
+                ctx_switches = proc.num_ctx_switches()
+                rss = proc.memory_info().rss
+                cpu_num = proc.cpu_num()
+                start_time = proc.create_time()
+
+                try:
+                    io = proc.io_counters()
+                    io_bytes = io.read_bytes + io.write_bytes
+                except psutil.AccessDenied:
+                    # /proc/<pid>/io is only readable by the owner and root
+                    io_bytes = 0
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+
+        columns['pid'].append(pid)
+        columns['cpu_time_ns'].append(cpu_time_ns)
+        columns['ctx_switches'].append(ctx_switches.voluntary + ctx_switches.involuntary)
+        columns['io_bytes'].append(io_bytes)
+        columns['rss'].append(rss)
+        # Integrated across scans by the parent, which keeps the samples
+        columns['rss_byte_seconds'].append(0.0)
+        columns['cpu_num'].append(cpu_num)
+        columns['start_time'].append(start_time)
+
+    return columns
+
+
+def columns_to_metrics(columns: Dict[str, array],
+                       frequencies: Optional[Dict[int, int]] = None) -> List[Tuple[int, int, int, float, float]]:
+    """
+    Apply the energy model to scanned columns in one vectorized pass
+    columns: Column name -> array (or NumPy array), see SCAN_COLUMNS
+    frequencies: CPU -> kHz, from read_cpu_frequencies()
+    Returns: List of (pid, cpu_time_ns, packets_estimate, energy, carbon)
+    """
+    pids = np.asarray(columns['pid'], dtype=np.int64)
+    cpu_time_ns = np.asarray(columns['cpu_time_ns'], dtype=np.int64)
+    # Context switches stand in for network activity (rough approximation)
+    packets_estimate = np.asarray(columns['ctx_switches'], dtype=np.int64)
+    io_bytes = np.asarray(columns['io_bytes'], dtype=np.int64)
+    io_requests = np.ceil(io_bytes / AVG_IO_REQUEST_BYTES)
+    rss_byte_seconds = np.asarray(columns['rss_byte_seconds'], dtype=np.float64)
+
+    cpu_watts = cpu_watts_at(np.asarray(columns['cpu_num'], dtype=np.int64), frequencies)
+
+    # One vectorized pass over all processes
+    energy = estimate_energy(cpu_time_ns, packets_estimate, io_bytes, io_requests, rss_byte_seconds,
+                             cpu_watts)
+    carbon = estimate_carbon(energy)
+
+    return list(zip(
+        pids.tolist(), cpu_time_ns.tolist(), packets_estimate.tolist(),
+        energy.tolist(), carbon.tolist()
+    ))
+
+
+def cpu_watts_at(cpu_nums: np.ndarray, frequencies: Optional[Dict[int, int]]):
+    """
+    Per-core power for each process from the current frequency of the
+    CPU it last ran on. /proc has no per-CPU runtime breakdown, so this
+    is a point-in-time approximation of the eBPF frequency histogram.
+    Returns None (constant power) when the model has no power curve.
+    """
+    model = get_model()
+    if model.cpu_power_curve is None or not frequencies:
+        return None
+
+    freq_mhz_by_cpu = np.zeros(max(max(frequencies), int(cpu_nums.max(initial=0))) + 1)
+    for cpu, khz in frequencies.items():
+        freq_mhz_by_cpu[cpu] = khz / 1000
+    return model.cpu_watts_at(freq_mhz_by_cpu[cpu_nums])
+
+
+class ParallelCollector:
+    """psutil collector that scans /proc with a persistent worker pool"""
+
+    def __init__(self, workers: int = 1, min_cpu_ns: int = 50_000_000, recorder=None):
+        """
+        workers: Number of worker processes (1 = sequential, no pool)
+        min_cpu_ns: Skip processes with less CPU time than this
+        recorder: replay.TraceWriter receiving the raw columns of every scan
+        """
+        self.workers = max(1, workers)
+        self.min_cpu_ns = min_cpu_ns
+        self.recorder = recorder
+        self.pool = None
+        # RSS x time per process across scans
+        self.memory = RssIntegrator()
+
+        if self.workers > 1:
+            try:
+                # fork keeps script-style entry points (main_psutil.py) from being
+                # re-executed in the workers
+                context = multiprocessing.get_context('fork')
+                self.pool = context.Pool(processes=self.workers, initializer=_init_worker)
+            except (OSError, ImportError) as e:
+                # e.g. no /dev/shm for the pool's semaphores
+                print(f"  ⚠️  Cannot start worker pool ({e}), collecting sequentially")
+                self.workers = 1
+
+    def scan(self) -> Dict[str, array]:
+        """
+        Scan all PIDs and return the merged columns (see SCAN_COLUMNS)
+        """
+        pids = psutil.pids()
+
+        if self.pool is None:
+            return scan_pid_range(pids, self.min_cpu_ns)
+
+        shards = shard_pids(pids, self.workers * SHARDS_PER_WORKER)
+        results = self.pool.starmap(
+            scan_pid_range,
+            [(shard, self.min_cpu_ns) for shard in shards]
+        )
+
+        merged = {name: array(typecode) for name, typecode in SCAN_COLUMNS}
+        for columns in results:
+            for name, values in columns.items():
+                merged[name].extend(values)
+
+        return merged
+
+    def collect(self) -> List[Tuple[int, int, int, float, float]]:
+        """
+        Collect current system metrics
+        Returns: List of (pid, cpu_time_ns, packets_estimate, energy, carbon)
+        """
+        columns = self.scan()
+        columns['rss_byte_seconds'] = self.memory.update(
+            np.asarray(columns['pid'], dtype=np.int64),
+            np.asarray(columns['start_time'], dtype=np.float64),
+            np.asarray(columns['rss'], dtype=np.int64))
+
+        # CPU frequencies only matter with a power curve, but a trace keeps
+        # them so it can be replayed under a calibrated model later
+        frequencies = None
+        if self.recorder is not None or get_model().cpu_power_curve is not None:
+            frequencies = read_cpu_frequencies()
+        if self.recorder is not None:
+            self.recorder.write_psutil(columns, frequencies)
+
+        return columns_to_metrics(columns, frequencies)
+
+    def close(self):
+        """Shut down the worker pool"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def benchmark(worker_counts=(1, 2, 4, 8), rounds: int = 5):
+    """Print the mean scan time for each worker count"""
+    print(f"📏 Collector scaling ({len(psutil.pids())} PIDs, {os.cpu_count()} CPUs, {rounds} rounds)")
+
+    for workers in worker_counts:
+        with ParallelCollector(workers=workers, min_cpu_ns=0) as collector:
+            collector.scan()  # warm up the pool
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                collector.scan()
+            elapsed = (time.perf_counter() - start) / rounds
+
+        print(f"   {workers} worker(s): {elapsed * 1000:8.1f} ms per scan")
+
+
+if __name__ == "__main__":
+    benchmark()
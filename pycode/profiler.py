@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Energy-Weighted Stack Profiler
+Shows where in the code CPU energy and carbon are spent
+
+    sudo python3 pycode/carbon.py profile --duration 30 --output carbon_flame.svg
+    sudo python3 pycode/carbon.py profile --pid 1234 --output stacks.folded
+
+eBPF/profile.c samples user and kernel stacks on every CPU from a
+CPU-clock perf event and counts them per unique stack in kernel. Each
+sample stands for 1/frequency seconds of CPU time, which is turned into
+energy and carbon by the same model as the monitors. The result is
+written as folded stacks (flamegraph.pl input, weights in microjoules)
+or as a flame graph SVG, with one root per process, per cgroup or for
+the whole machine.
+"""
+
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from energy_calc import estimate_energy, estimate_carbon
+from ebpf_loader import EBPF_DIR, CGROUP_ROOT, cgroup_id
+
+# Off-beat with the common 50/100/1000 Hz timers, so periodic work is not
+# always or never caught
+DEFAULT_FREQUENCY = 49
+
+GROUPINGS = ('pid', 'cgroup', 'none')
+
+
+def cgroup_paths(root: str = CGROUP_ROOT) -> Dict[int, str]:
+    """cgroup v2 ID -> path relative to the cgroup root"""
+    paths = {}
+    for directory, _, _ in os.walk(root):
+        try:
+            paths[os.stat(directory).st_ino] = '/' + os.path.relpath(directory, root).lstrip('.')
+        except OSError:
+            continue
+    return paths
+
+
+def load_profiler(frequency: int = DEFAULT_FREQUENCY, pid: Optional[int] = None,
+                  cgroup: Optional[str] = None):
+    """
+    Compile eBPF/profile.c and attach it to a CPU-clock perf event on every CPU
+    pid / cgroup: Only sample this process / cgroup (path under /sys/fs/cgroup)
+    Returns: bcc.BPF instance exposing stack_counts and stack_traces
+    """
+    from bcc import BPF, PerfType, PerfSWConfig
+
+    cflags = []
+    if pid is not None:
+        cflags.append(f'-DTARGET_PID={pid}')
+    if cgroup is not None:
+        cflags.append(f'-DTARGET_CGROUP={cgroup_id(cgroup)}ULL')
+
+    with open(os.path.join(EBPF_DIR, 'profile.c')) as f:
+        bpf = BPF(text=f.read(), cflags=cflags)
+    bpf.attach_perf_event(ev_type=PerfType.SOFTWARE, ev_config=PerfSWConfig.CPU_CLOCK,
+                          fn_name='on_cpu_sample', sample_freq=frequency)
+    return bpf
+
+
+def read_stacks(bpf, group: str = 'pid') -> Dict[str, int]:
+    """
+    Sample counts per folded stack ('root;outer;...;inner' -> samples)
+    group: Root frame per 'pid' ("comm (pid)"), per 'cgroup' (its path) or
+           'none' (process name only)
+    """
+    traces = bpf["stack_traces"]
+    cgroups = cgroup_paths() if group == 'cgroup' else {}
+    folded: Dict[str, int] = {}
+
+    for key, count in bpf["stack_counts"].items():
+        comm = key.comm.decode(errors='replace')
+        if group == 'pid':
+            frames = [f"{comm} ({key.pid})"]
+        elif group == 'cgroup':
+            frames = [cgroups.get(key.cgroup_id, f"cgroup {key.cgroup_id}"), comm]
+        else:
+            frames = [comm]
+
+        # Stacks are walked innermost first
+        if key.user_stack_id >= 0:
+            user = [bpf.sym(addr, key.pid).decode(errors='replace')
+                    for addr in traces.walk(key.user_stack_id)]
+            frames.extend(reversed(user))
+        else:
+            frames.append('[unknown]')
+        if key.kernel_stack_id >= 0:
+            kernel = [bpf.ksym(addr).decode(errors='replace') + '_[k]'
+                      for addr in traces.walk(key.kernel_stack_id)]
+            frames.extend(reversed(kernel))
+
+        stack = ';'.join(frame.replace(';', ':') for frame in frames)
+        folded[stack] = folded.get(stack, 0) + count.value
+    return folded
+
+
+def weight_stacks(folded: Dict[str, int], frequency: int) -> Dict[str, float]:
+    """Samples per stack -> Joules, through the energy model"""
+    stacks = list(folded)
+    samples = np.fromiter((folded[s] for s in stacks), dtype=np.float64, count=len(stacks))
+    energy = estimate_energy(samples * (1_000_000_000 / frequency), 0)
+    return dict(zip(stacks, np.asarray(energy, dtype=np.float64).tolist()))
+
+
+def write_folded(folded: Dict[str, float], f, scale: float = 1_000_000):
+    """flamegraph.pl input; weights are integers, so Joules are written as microjoules"""
+    for stack, weight in sorted(folded.items(), key=lambda item: -item[1]):
+        value = int(round(weight * scale))
+        if value > 0:
+            f.write(f"{stack} {value}\n")
+
+
+def display_roots(energy: Dict[str, float], top_n: int = 10):
+    """Energy and carbon per root frame (process or cgroup)"""
+    from prettytable import PrettyTable
+
+    roots: Dict[str, float] = {}
+    for stack, joules in energy.items():
+        root = stack.split(';', 1)[0]
+        roots[root] = roots.get(root, 0.0) + joules
+
+    table = PrettyTable()
+    table.field_names = ["Process / cgroup", "CPU Energy (J)", "Carbon (g CO2)"]
+    for root, joules in sorted(roots.items(), key=lambda item: -item[1])[:top_n]:
+        table.add_row([root[:40], f"{joules:.6f}", f"{float(estimate_carbon(joules)):.6f}"])
+    print(table)
+
+
+def add_parser(subparsers):
+    """Register the `profile` subcommand"""
+    from energy_calc import add_model_arguments
+
+    parser = subparsers.add_parser('profile', help="sample stacks and weight them by energy (flame graphs)")
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="seconds to sample (default: 10)")
+    parser.add_argument('--frequency', type=int, default=DEFAULT_FREQUENCY,
+                        help=f"samples per second per CPU (default: {DEFAULT_FREQUENCY})")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--pid', type=int, help="only sample this process")
+    target.add_argument('--cgroup', metavar='PATH',
+                        help="only sample this cgroup (path under /sys/fs/cgroup)")
+    parser.add_argument('--group', choices=GROUPINGS, default='pid',
+                        help="root frame per process, per cgroup or none (default: pid)")
+    parser.add_argument('--weight', choices=('energy', 'samples'), default='energy',
+                        help="weight stacks by modelled energy or raw samples (default: energy)")
+    parser.add_argument('--output', default='carbon_flame.svg',
+                        help="flame graph .svg, or folded stacks for any other name, "
+                             "'-' for stdout (default: carbon_flame.svg)")
+    add_model_arguments(parser)
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py profile`"""
+    from energy_calc import configure_from_args
+    configure_from_args(args)
+
+    if os.geteuid() != 0:
+        print("❌ Error: profiling with eBPF requires root privileges")
+        return 1
+
+    try:
+        bpf = load_profiler(args.frequency, args.pid, args.cgroup)
+    except ImportError:
+        print("❌ Error: BCC not available")
+        print("Install with: sudo apt-get install python3-bpfcc bpfcc-tools")
+        return 1
+    except Exception as e:
+        print(f"❌ Failed to load the profiler: {e}")
+        return 1
+
+    print(f"🔬 Sampling stacks at {args.frequency} Hz for {args.duration:.0f}s (Ctrl+C to stop early)...",
+          file=sys.stderr)
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+
+    try:
+        samples = read_stacks(bpf, args.group)
+    finally:
+        bpf.cleanup()
+    if not samples:
+        print("⚠️  No samples collected")
+        return 1
+
+    energy = weight_stacks(samples, args.frequency)
+    weights = energy if args.weight == 'energy' else {s: float(n) for s, n in samples.items()}
+
+    if args.output.endswith('.svg'):
+        from visualization import flamegraph_svg
+        unit = 'J' if args.weight == 'energy' else 'samples'
+        with open(args.output, 'w') as f:
+            f.write(flamegraph_svg(weights, title='CPU Energy by Stack', unit=unit))
+    elif args.output == '-':
+        write_folded(weights, sys.stdout, 1_000_000 if args.weight == 'energy' else 1)
+    else:
+        with open(args.output, 'w') as f:
+            write_folded(weights, f, 1_000_000 if args.weight == 'energy' else 1)
+
+    if args.output != '-':
+        print(f"\n🔥 {sum(samples.values())} samples in {len(samples)} unique stacks")
+        display_roots(energy)
+        print(f"\n📈 Saved to: {args.output}")
+    return 0
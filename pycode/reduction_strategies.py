@@ -9,15 +9,23 @@ import signal
 import subprocess
 import psutil
 import time
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+from job_profiles import HEAVY_JOB_ENERGY_J, JobProfile
+from policy import Policy, get_policy, report_exclusions
+from topk import TopKTracker, top_emitters
 
 class CarbonReducer:
     """Implements various strategies to reduce carbon emissions"""
     
-    def __init__(self):
+    def __init__(self, policy: Optional[Policy] = None):
+        # Which processes each strategy may touch (see policy.py)
+        self.policy = policy if policy is not None else get_policy()
         self.paused_pids = []
         self.limited_pids = []
         self.reniced_pids = []
+        self.original_nice = {}     # pid -> niceness before the first renice
+        self.limiters = []          # cpulimit processes, stopped by restore_all()
         
     def pause_process(self, pid: int) -> bool:
         """
@@ -57,6 +65,11 @@ class CarbonReducer:
         niceness: 0-19 (higher = lower priority)
         Returns True if successful
         """
+        try:
+            original = psutil.Process(pid).nice()
+        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+            print(f"  ⚠️  Cannot renice PID {pid}: {e}")
+            return False
         try:
             subprocess.run(
                 ['renice', '-n', str(niceness), '-p', str(pid)],
@@ -64,6 +77,7 @@ class CarbonReducer:
                 capture_output=True
             )
             self.reniced_pids.append((pid, niceness))
+            self.original_nice.setdefault(pid, original)
             return True
         except (subprocess.CalledProcessError, PermissionError) as e:
             print(f"  ⚠️  Cannot renice PID {pid}: {e}")
@@ -79,12 +93,13 @@ class CarbonReducer:
             # Check if cpulimit is installed
             subprocess.run(['which', 'cpulimit'], check=True, capture_output=True)
             
-            # Start cpulimit in background
-            subprocess.Popen(
-                ['cpulimit', '-p', str(pid), '-l', str(limit_percent), '-b'],
+            # Start cpulimit in background; kept in the foreground of its own
+            # process so restore_all() can stop it
+            self.limiters.append(subprocess.Popen(
+                ['cpulimit', '-p', str(pid), '-l', str(limit_percent)],
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL
-            )
+            ))
             self.limited_pids.append(pid)
             return True
         except subprocess.CalledProcessError:
@@ -99,22 +114,48 @@ class CarbonReducer:
         Terminate a process (use with caution!)
         Returns True if successful
         """
+        # Safety check - only processes the policy allows to be killed
+        decision = self.policy.decide(pid, 'kill', created=create_time(pid))
+        if not decision.allowed:
+            print(f"  ⛔ Cannot kill {decision.describe()}")
+            return False
+        
         try:
-            proc = psutil.Process(pid)
-            proc_name = proc.name()
-            
-            # Safety check - don't kill critical processes
-            critical_processes = ['systemd', 'init', 'ssh', 'sshd']
-            if proc_name in critical_processes:
-                print(f"  ⛔ Cannot kill critical process: {proc_name}")
-                return False
-            
-            proc.terminate()
+            psutil.Process(pid).terminate()
             return True
         except (psutil.NoSuchProcess, psutil.AccessDenied, PermissionError) as e:
             print(f"  ⚠️  Cannot kill PID {pid}: {e}")
             return False
     
+    def restore_all(self):
+        """
+        Undo every pause, renice and CPU limit this reducer applied
+        (processes that exited since are skipped)
+        """
+        self.resume_all()
+        
+        # cpulimit resumes its target when terminated
+        for limiter in self.limiters:
+            if limiter.poll() is None:
+                limiter.terminate()
+                try:
+                    limiter.wait(timeout=2)
+                except subprocess.TimeoutExpired:
+                    limiter.kill()
+        self.limiters.clear()
+        self.limited_pids.clear()
+        
+        for pid, niceness in self.original_nice.items():
+            try:
+                psutil.Process(pid).nice(niceness)
+            except psutil.NoSuchProcess:
+                continue
+            except (psutil.AccessDenied, PermissionError) as e:
+                # Raising priority back needs root
+                print(f"  ⚠️  Cannot restore priority of PID {pid}: {e}")
+        self.original_nice.clear()
+        self.reniced_pids.clear()
+    
     def get_process_info(self, pid: int) -> dict:
         """Get process information"""
         try:
@@ -129,18 +170,91 @@ class CarbonReducer:
             return None
 
 
+def create_time(pid: int) -> Optional[float]:
+    """Create time of a process, so a cached policy verdict is not applied to a reused PID"""
+    try:
+        return psutil.Process(pid).create_time()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return None
+
+
+def apply_strategy(reducer: CarbonReducer, pid: int, strategy: str) -> bool:
+    """
+    Apply one reduction strategy to a process
+    strategy: 'pause', 'renice', 'limit', or 'kill'
+    Returns True if successful; False also when the reducer's policy
+    excludes the process
+    """
+    decision = reducer.policy.decide(pid, strategy, created=create_time(pid))
+    if not decision.allowed:
+        print(f"    ⛔ Skipped: {decision.reason}")
+        return False
+    rule = decision.rule
+    
+    if strategy == 'pause':
+        print(f"    Action: Pausing process...")
+        return reducer.pause_process(pid)
+    elif strategy == 'renice':
+        print(f"    Action: Lowering priority (nice +{rule.nice})...")
+        return reducer.lower_priority(pid, rule.nice)
+    elif strategy == 'limit':
+        print(f"    Action: Limiting CPU to {rule.cpu_limit_percent}%...")
+        return reducer.limit_cpu(pid, rule.cpu_limit_percent)
+    elif strategy == 'kill':
+        print(f"    Action: Terminating process...")
+        return reducer.kill_process(pid)
+    return False
+
+
+def apply_strategy_to_known_job(
+    reducer: CarbonReducer,
+    pid: int,
+    profile: Optional[JobProfile],
+    strategy: str,
+    min_energy: float = HEAVY_JOB_ENERGY_J
+) -> bool:
+    """
+    Apply a reduction strategy to a process as it starts, if its command
+    has a history of heavy runs (see job_profiles.py)
+    
+    Args:
+        reducer: CarbonReducer that keeps track of affected processes
+        pid: Process that just started
+        profile: Profile of its command (None for a job never seen before)
+        strategy: 'renice' or 'limit' ('none' does nothing)
+        min_energy: Mean J per run that makes a job heavy
+    
+    Returns:
+        True if the strategy was applied
+    """
+    if strategy == 'none' or profile is None or not profile.is_heavy(min_energy):
+        return False
+    
+    print(f"\n🔁 Known heavy job started: PID {pid} ({profile.command[:60]})")
+    print(f"    {profile.runs} runs, {profile.mean_energy:.2f} J and "
+          f"{profile.mean_duration_s:.1f} s per run, peak {profile.peak_watts:.2f} W")
+    
+    success = apply_strategy(reducer, pid, strategy)
+    if success:
+        print(f"    ✅ Applied before it ran up its usual emissions")
+    return success
+
+
 def apply_strategy_to_top_emitters(
     metrics: List[Tuple[int, int, int, float, float]], 
     strategy: str, 
-    top_n: int = 5
+    top_n: int = 5,
+    ranked: Optional[TopKTracker] = None
 ) -> List[int]:
     """
-    Apply reduction strategy to top N carbon emitters
+    Apply reduction strategy to top N carbon emitters the policy allows it
+    for; excluded processes are reported and the next ranked ones targeted
     
     Args:
         metrics: List of (pid, cpu_time_ns, packets, energy, carbon)
         strategy: 'pause', 'renice', 'limit', or 'kill'
         top_n: Number of top processes to target
+        ranked: Tracker already holding metrics, reused for ranking
     
     Returns:
         List of affected PIDs
@@ -148,12 +262,34 @@ def apply_strategy_to_top_emitters(
     reducer = CarbonReducer()
     affected_pids = []
     
-    # Sort by carbon emissions (highest first)
-    sorted_metrics = sorted(metrics, key=lambda x: x[4], reverse=True)
+    # Highest carbon first, skipping what the policy excludes; widen the
+    # ranking until top_n targets are found or every process was checked
+    sorted_metrics = []
+    excluded = []
+    checked = 0
+    wanted = top_n * 2
+    while True:
+        ranked_metrics = top_emitters(metrics, wanted, ranked)
+        candidates = ranked_metrics[checked:]
+        decisions = reducer.policy.decide_many([m[0] for m in candidates], strategy)
+        for row, decision in zip(candidates, decisions):
+            checked += 1
+            if decision.allowed:
+                sorted_metrics.append(row)
+                if len(sorted_metrics) == top_n:
+                    break
+            else:
+                excluded.append(decision)
+        if len(sorted_metrics) == top_n or len(ranked_metrics) < wanted:
+            break
+        wanted *= 4
     
     print(f"\n🎯 Applying '{strategy}' strategy to top {top_n} emitters...")
+    if excluded:
+        print(f"\n  🛡️  {len(excluded)} higher-ranked processes excluded by policy:")
+        report_exclusions(excluded)
     
-    for i, (pid, cpu_time_ns, packets, energy, carbon) in enumerate(sorted_metrics[:top_n]):
+    for i, (pid, cpu_time_ns, packets, energy, carbon) in enumerate(sorted_metrics):
         try:
             proc = psutil.Process(pid)
             proc_name = proc.name()
@@ -161,19 +297,7 @@ def apply_strategy_to_top_emitters(
             print(f"\n  Process {i+1}: PID {pid} ({proc_name})")
             print(f"    Energy: {energy:.6f} J, Carbon: {carbon:.6f} g CO2")
             
-            success = False
-            if strategy == 'pause':
-                print(f"    Action: Pausing process...")
-                success = reducer.pause_process(pid)
-            elif strategy == 'renice':
-                print(f"    Action: Lowering priority (nice +10)...")
-                success = reducer.lower_priority(pid, 10)
-            elif strategy == 'limit':
-                print(f"    Action: Limiting CPU to 30%...")
-                success = reducer.limit_cpu(pid, 30)
-            elif strategy == 'kill':
-                print(f"    Action: Terminating process...")
-                success = reducer.kill_process(pid)
+            success = apply_strategy(reducer, pid, strategy)
             
             if success:
                 print(f"    ✅ Success!")
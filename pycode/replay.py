@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Trace Record and Replay
+Runs the pipeline offline on recorded collector input
+
+A trace holds the raw input of every collection (the task_stats rows and
+frequency histogram for eBPF, the /proc columns and CPU frequencies for
+psutil), before the energy model is applied. Replaying it runs the same
+model, ranking, anomaly detection, comparison and chart code as a live
+run, without root, eBPF or the original process mix, and as fast as the
+pipeline allows. Replaying one trace under two models compares them on
+identical input.
+
+    sudo python3 pycode/main.py --record run.trace
+    python3 pycode/carbon.py replay run.trace --chart replay.html
+    python3 pycode/carbon.py replay run.trace --model-file energy_model.json
+
+File layout: MAGIC, then one frame per collection: a TICK header
+(timestamp, source, row count, extra row count, payload length) and a
+zlib-compressed payload of the rows followed by the extra rows.
+"""
+
+import os
+import struct
+import time
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ebpf_loader import TASK_ROW_DTYPE, rows_to_metrics
+from parallel_collector import SCAN_COLUMNS, columns_to_metrics
+
+# Bumped whenever a row dtype changes (2: wakeups column, 3: psutil rss column)
+MAGIC = b'CCTRACE3'
+
+TICK = struct.Struct('<dBxxxIII')   # timestamp, source, rows, extra rows, payload bytes
+
+SOURCES = ('psutil', 'ebpf')
+
+PSUTIL_ROW_DTYPE = np.dtype([(name, '<i8' if code == 'q' else '<f8') for name, code in SCAN_COLUMNS])
+FREQ_DTYPE = np.dtype([('cpu', '<i8'), ('khz', '<i8')])
+HIST_DTYPE = np.dtype([('pid', '<i8'), ('cpu', '<i8'), ('bucket', '<i8'), ('ns', '<i8')])
+
+# Source -> (process row dtype, extra row dtype)
+ROW_DTYPES = {
+    'psutil': (PSUTIL_ROW_DTYPE, FREQ_DTYPE),
+    'ebpf': (TASK_ROW_DTYPE, HIST_DTYPE),
+}
+
+
+class TraceTick(NamedTuple):
+    timestamp: float
+    source: str         # 'psutil' or 'ebpf'
+    rows: np.ndarray    # process rows, see ROW_DTYPES
+    extra: np.ndarray   # CPU frequencies (psutil) or frequency histogram (ebpf)
+
+
+class TraceWriter:
+    """Appends the raw input of each collection to a trace file"""
+
+    def __init__(self, path: str, level: int = 1):
+        """level: zlib level; 1 keeps recording cheap and still shrinks the counters well"""
+        self.path = path
+        self.level = level
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+
+    def write_psutil(self, columns, frequencies: Optional[Dict[int, int]] = None,
+                     timestamp: Optional[float] = None):
+        """
+        columns: ParallelCollector.scan() output
+        frequencies: CPU -> kHz, from read_cpu_frequencies()
+        """
+        rows = np.empty(len(columns['pid']), dtype=PSUTIL_ROW_DTYPE)
+        for name in PSUTIL_ROW_DTYPE.names:
+            rows[name] = np.asarray(columns[name])
+        extra = np.array(sorted((frequencies or {}).items()), dtype=np.int64).reshape(-1, 2)
+        self._write('psutil', rows, np.rec.fromarrays(extra.T, dtype=FREQ_DTYPE), timestamp)
+
+    def write_ebpf(self, rows: np.ndarray, freq_histogram=None, timestamp: Optional[float] = None):
+        """
+        rows: ebpf_loader.task_stats_rows() output
+        freq_histogram: read_freq_histogram() output
+        """
+        extra = np.empty(0 if freq_histogram is None else len(freq_histogram[0]), dtype=HIST_DTYPE)
+        if freq_histogram is not None:
+            for name, column in zip(HIST_DTYPE.names, freq_histogram):
+                extra[name] = column
+        self._write('ebpf', rows, extra, timestamp)
+
+    def _write(self, source: str, rows: np.ndarray, extra: np.ndarray, timestamp: Optional[float]):
+        payload = zlib.compress(rows.tobytes() + extra.tobytes(), self.level)
+        self._file.write(TICK.pack(timestamp or time.time(), SOURCES.index(source),
+                                   len(rows), len(extra), len(payload)))
+        self._file.write(payload)
+        # A trace cut short by a crash still replays up to the last tick
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _frames(f) -> Iterator[Tuple[float, str, int, int, bytes]]:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{f.name} is not a collector trace")
+    while True:
+        header = f.read(TICK.size)
+        if len(header) < TICK.size:
+            return
+        timestamp, source, count, extra_count, length = TICK.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length:
+            return      # last frame was cut short
+        yield timestamp, SOURCES[source], count, extra_count, payload
+
+
+def read_trace(path: str) -> Iterator[TraceTick]:
+    """Decode every tick of a trace, in recording order"""
+    with open(path, 'rb') as f:
+        for timestamp, source, count, extra_count, payload in _frames(f):
+            row_dtype, extra_dtype = ROW_DTYPES[source]
+            data = zlib.decompress(payload)
+            split = count * row_dtype.itemsize
+            yield TraceTick(timestamp, source,
+                            np.frombuffer(data, dtype=row_dtype, count=count),
+                            np.frombuffer(data, dtype=extra_dtype, count=extra_count, offset=split))
+
+
+def trace_span(path: str) -> Tuple[int, float, float]:
+    """(ticks, first timestamp, last timestamp), reading only the headers"""
+    ticks, first, last = 0, 0.0, 0.0
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a collector trace")
+        while True:
+            header = f.read(TICK.size)
+            if len(header) < TICK.size:
+                break
+            timestamp, _, _, _, length = TICK.unpack(header)
+            f.seek(length, os.SEEK_CUR)
+            first = timestamp if ticks == 0 else first
+            last = timestamp
+            ticks += 1
+    return ticks, first, last
+
+
+def tick_metrics(tick: TraceTick) -> List[Tuple[int, int, int, float, float]]:
+    """Apply the current energy model to a recorded tick"""
+    if tick.source == 'psutil':
+        frequencies = dict(zip(tick.extra['cpu'].tolist(), tick.extra['khz'].tolist()))
+        return columns_to_metrics(tick.rows, frequencies)
+    histogram = (tick.extra['pid'], tick.extra['cpu'], tick.extra['bucket'], tick.extra['ns'])
+    return rows_to_metrics(tick.rows, histogram)
+
+
+class TraceStartTimes:
+    """Process create times as recorded, in place of psutil lookups (see comparison.window_rates)"""
+
+    def __init__(self):
+        self.starts: Dict[int, float] = {}
+
+    def update(self, tick: TraceTick):
+        self.starts.update(zip(tick.rows['pid'].tolist(), tick.rows['start_time'].tolist()))
+
+    def lookup(self, pids: List[int]) -> List[float]:
+        return [self.starts.get(pid, 0.0) for pid in pids]
+
+
+class TraceReplayer:
+    """Collector stand-in that yields the samples of a trace"""
+
+    def __init__(self, path: str, speed: float = 0.0):
+        """speed: Multiple of real time to pace the replay at (0 = as fast as possible)"""
+        self.path = path
+        self.speed = speed
+        self.start_times = TraceStartTimes()
+
+    def samples(self):
+        """(timestamp, metrics) per recorded tick, with the recorded timestamps"""
+        from monitor_core import Sample
+
+        origin = None
+        started = time.perf_counter()
+        for tick in read_trace(self.path):
+            if origin is None:
+                origin = tick.timestamp
+            if self.speed > 0:
+                delay = (tick.timestamp - origin) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            self.start_times.update(tick)
+            yield Sample(tick.timestamp, tick_metrics(tick))
+
+
+def replay(path: str, speed: float = 0.0, window: float = 10.0, split: Optional[float] = None,
+           strategy: str = 'renice', targets: int = 5, chart: Optional[str] = None,
+           history: Optional[str] = None, verbose: bool = True) -> dict:
+    """
+    Feed a trace through ranking, dry-run mitigation and the before/after
+    comparison around a split point, as a live run would
+
+    split: Seconds from the start of the trace where the (dry-run)
+           reduction happens (default: the middle)
+    Returns: Run statistics (ticks, trace and wall seconds, anomalies, ...)
+    """
+    from anomaly import AnomalyDetector
+    from comparison import EmissionComparison
+    from display import display_table
+    from mitigation import apply_mitigation
+    from monitor_core import window_delta
+    from topk import TopKTracker, top_emitters
+
+    ticks, first, last = trace_span(path)
+    if ticks == 0:
+        raise ValueError(f"{path} has no samples")
+    split_at = first + (split if split is not None else (last - first) / 2)
+
+    replayer = TraceReplayer(path, speed)
+    tracker = TopKTracker()
+    detector = AnomalyDetector()
+    writer = None
+    if history:
+        from trends import HistoryWriter
+        writer = HistoryWriter(history)
+
+    before, after = [], []
+    anomalies = 0
+    started = time.perf_counter()
+    try:
+        for sample in replayer.samples():
+            tracker.update_many(sample.metrics)
+            # Dry run: decisions are reported, nothing is signalled
+            found = apply_mitigation(sample.metrics, detector, report=False, now=sample.timestamp)
+            anomalies += len(found)
+            if verbose:
+                for anomaly in found:
+                    print(f"   +{sample.timestamp - first:7.1f}s  🚨 PID {anomaly.pid}: {anomaly.kind} "
+                          f"{anomaly.rate_watts:.2f} W (baseline {anomaly.baseline_watts:.2f} W)")
+            if writer is not None:
+                writer.append(sample.metrics, sample.timestamp)
+
+            if split_at - window <= sample.timestamp <= split_at:
+                before.append(sample)
+            if split_at <= sample.timestamp <= split_at + window:
+                after.append(sample)
+    finally:
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - started
+
+    stats = {'ticks': ticks, 'trace_seconds': last - first, 'wall_seconds': elapsed,
+             'anomalies': anomalies, 'significant': None}
+    if not verbose:
+        return stats
+
+    print(f"\n🔥 Top emitters at the end of the trace:")
+    display_table(tracker.top(10))
+
+    if len(before) >= 3 and len(after) >= 3:
+        before_metrics = window_delta(before[0], before[-1], window)
+        after_metrics = window_delta(after[0], after[-1], window)
+        before_ranked = TopKTracker(before_metrics)
+        would_target = [m[0] for m in top_emitters(before_metrics, targets, before_ranked)]
+        print(f"\n🎯 Dry run at +{split_at - first:.0f}s: would apply '{strategy}' to PIDs "
+              f"{', '.join(map(str, would_target))}")
+
+        comparison = EmissionComparison()
+        comparison.record_before_window(before, ranked=before_ranked, metrics=before_metrics,
+                                        start_times=replayer.start_times)
+        comparison.record_after_window(after, ranked=TopKTracker(after_metrics), metrics=after_metrics,
+                                       start_times=replayer.start_times)
+        comparison.display_comparison()
+        stats['significant'] = comparison.calculate_rate_changes()['energy'].significant
+
+        if chart:
+            from visualization import comparison_data, render_comparison
+            # Names of recorded processes cannot be looked up on this machine
+            names = {m[0]: f"PID {m[0]}" for m in before_metrics + after_metrics}
+            render_comparison(comparison_data(before_metrics, after_metrics, 10, before_ranked, names), chart)
+            print(f"\n📈 Chart saved to: {chart}")
+    else:
+        print(f"\n⚠️  Fewer than 3 samples within {window:.0f}s of the split; no comparison")
+
+    return stats
+
+
+def add_parser(subparsers):
+    """Register the `replay` subcommand"""
+    from energy_calc import add_model_arguments
+
+    parser = subparsers.add_parser('replay', help="run the pipeline on a recorded collector trace")
+    parser.add_argument('trace', help="trace file written with --record by the monitors")
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help="replay at N times real time (default: 0, as fast as possible)")
+    parser.add_argument('--split', type=float,
+                        help="seconds into the trace to compare around (default: the middle)")
+    parser.add_argument('--window', type=float, default=10.0,
+                        help="length of the before/after windows in seconds (default: 10)")
+    parser.add_argument('--strategy', choices=('pause', 'renice', 'limit', 'kill'), default='renice',
+                        help="strategy reported by the dry run (default: renice)")
+    parser.add_argument('--targets', type=int, default=5,
+                        help="top emitters the dry run would target (default: 5)")
+    parser.add_argument('--chart', metavar='FILE',
+                        help="write the comparison chart (PNG, SVG or HTML)")
+    parser.add_argument('--history', metavar='PATH',
+                        help="also write an emission history file (see carbon.py trends)")
+    add_model_arguments(parser)
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py replay`"""
+    from energy_calc import configure_from_args
+    configure_from_args(args)
+
+    try:
+        stats = replay(args.trace, args.speed, args.window, args.split, args.strategy,
+                       args.targets, args.chart, args.history)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot replay {args.trace}: {e}")
+        return 1
+
+    speedup = stats['trace_seconds'] / stats['wall_seconds'] if stats['wall_seconds'] > 0 else 0
+    print(f"\n⏱️  Replayed {stats['ticks']} ticks ({stats['trace_seconds']:.0f}s of trace) in "
+          f"{stats['wall_seconds']:.2f}s, {speedup:.0f}x real time; {stats['anomalies']} anomalies")
+    return 0
+
+
+def benchmark(path: str = 'benchmark.trace', seconds: float = 5.0, interval: float = 0.5):
+    """Record a short psutil trace of this machine and time replaying it"""
+    from parallel_collector import ParallelCollector
+
+    with TraceWriter(path) as writer, ParallelCollector(min_cpu_ns=0, recorder=writer) as collector:
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            collector.collect()
+            time.sleep(interval)
+
+    size = os.path.getsize(path)
+    ticks, first, last = trace_span(path)
+    stats = replay(path, verbose=False)
+    print(f"📏 {ticks} ticks, {size / ticks / 1024:.1f} KiB per tick; replayed in "
+          f"{stats['wall_seconds'] * 1000:.0f} ms ({(last - first) / stats['wall_seconds']:.0f}x real time)")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    benchmark()
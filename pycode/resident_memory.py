@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Resident Memory Module
+Integrates per-process RSS samples over time for memory energy
+
+Memory energy is charged per byte-second, so each process's RSS is
+sampled every tick and accumulated as rss x dt, keyed by (pid, start
+time) so a reused PID starts from zero.
+"""
+
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def read_rss(pids: np.ndarray, proc_root: str = '/proc') -> np.ndarray:
+    """
+    Resident bytes of each process from /proc/<pid>/statm (0 for processes
+    that are gone or unreadable); one read per process, no psutil objects
+    """
+    rss = np.zeros(len(pids), dtype=np.int64)
+    for i, pid in enumerate(pids.tolist()):
+        try:
+            fd = os.open(f'{proc_root}/{pid}/statm', os.O_RDONLY)
+            try:
+                fields = os.read(fd, 128).split()
+            finally:
+                os.close(fd)
+            rss[i] = int(fields[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+    return rss
+
+
+class RssIntegrator:
+    """Resident memory x time per process, accumulated across ticks"""
+
+    def __init__(self, since: float = 0.0):
+        """
+        since: time.time() the accounting starts from; a process first seen
+               is charged its current RSS from max(since, its start time)
+        """
+        self.since = since
+        self._totals: Dict[Tuple[int, float], Tuple[float, float]] = {}   # -> (last sample time, byte-seconds)
+
+    def update(self, pids: np.ndarray, start_times: np.ndarray, rss: np.ndarray,
+               now: Optional[float] = None) -> np.ndarray:
+        """
+        Add rss x (time since the previous sample) for each process
+        Returns: Cumulative byte-seconds per process, in the order given.
+        Processes missing from this call are forgotten.
+        """
+        now = time.time() if now is None else now
+        previous = self._totals
+        totals: Dict[Tuple[int, float], Tuple[float, float]] = {}
+        result = np.empty(len(pids), dtype=np.float64)
+        for i, (key, resident) in enumerate(zip(zip(pids.tolist(), start_times.tolist()), rss.tolist())):
+            last = previous.get(key)
+            if last is None:
+                total = resident * max(0.0, now - max(self.since, key[1]))
+            else:
+                total = last[1] + resident * max(0.0, now - last[0])
+            totals[key] = (now, total)
+            result[i] = total
+        self._totals = totals
+        return result
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Shared Snapshot
+Publishes the latest metrics of every tick for local readers
+
+    python3 pycode/main_psutil.py --publish /dev/shm/carbon_snapshot
+    python3 pycode/carbon.py top --snapshot /dev/shm/carbon_snapshot
+
+The collector writes each tick into a memory-mapped file (on /dev/shm,
+so it never touches a disk). Any number of processes on the host can map
+it and read the newest tick as NumPy columns without collecting
+anything themselves: a terminal view, an exporter or a script.
+
+Layout: a header (magic, capacity, generation) and two slots. Each slot
+is a seqlock counter, the tick's timestamp and row count, then one
+column of `capacity` values per SNAPSHOT_COLUMNS entry. The writer
+fills the slot not being read (odd counter while it writes), then bumps
+the generation to point at it. Readers check the slot counter before
+and after reading and retry if it moved. A slot is only rewritten two
+ticks after it was published, so views returned with copy=False stay
+valid for at least one full tick (check with SnapshotReader.is_current).
+
+Single writer. The x86-64 and arm64 ports of NumPy write each aligned
+8-byte header field with one store, which is all the protocol needs.
+"""
+
+import os
+import struct
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b'CCSNAP01'
+HEADER = struct.Struct('<8sII')     # magic, capacity, reserved; generation (u64) at offset 16
+HEADER_SIZE = 64
+GENERATION_OFFSET = 16
+SLOT_HEADER_SIZE = 64               # seq (u64), timestamp (f8), count (u64)
+
+SNAPSHOT_COLUMNS = (
+    ('pid', '<i8'),
+    ('cpu_time_ns', '<i8'),
+    ('packets', '<i8'),
+    ('energy', '<f8'),
+    ('carbon', '<f8'),
+)
+
+# Rows per slot before the file is grown
+DEFAULT_CAPACITY = 1 << 15
+
+DEFAULT_SNAPSHOT_PATH = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                                     'carbon_snapshot')
+
+# Attempts before a reader gives up on a slot the writer keeps rewriting
+READ_RETRIES = 100
+
+
+def _slot_size(capacity: int) -> int:
+    return SLOT_HEADER_SIZE + capacity * sum(np.dtype(d).itemsize for _, d in SNAPSHOT_COLUMNS)
+
+
+def _file_size(capacity: int) -> int:
+    return HEADER_SIZE + 2 * _slot_size(capacity)
+
+
+class _Layout:
+    """NumPy views of the header and both slots of a mapped snapshot file"""
+
+    def __init__(self, buffer, capacity: int):
+        self.generation = np.ndarray((), dtype='<u8', buffer=buffer, offset=GENERATION_OFFSET)
+        self.slots = []
+        for index in range(2):
+            base = HEADER_SIZE + index * _slot_size(capacity)
+            header = np.ndarray((3,), dtype='<u8', buffer=buffer, offset=base)
+            columns, offset = {}, base + SLOT_HEADER_SIZE
+            for name, dtype in SNAPSHOT_COLUMNS:
+                columns[name] = np.ndarray((capacity,), dtype=dtype, buffer=buffer, offset=offset)
+                offset += capacity * np.dtype(dtype).itemsize
+            timestamp = np.ndarray((), dtype='<f8', buffer=buffer, offset=base + 8)
+            self.slots.append((header, timestamp, columns))
+
+
+class SnapshotPublisher:
+    """Writes the latest tick to a shared snapshot file (single writer)"""
+
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_PATH, capacity: int = DEFAULT_CAPACITY):
+        self.path = path
+        self._map = None
+        os.replace(self._create(capacity), self.path)
+
+    def _create(self, capacity: int) -> str:
+        """
+        Create a file of the given capacity and write to it from now on
+        Returns: Its temporary path, to be moved over self.path once it
+                 holds a tick
+        """
+        import mmap
+
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, capacity, 0))
+            f.truncate(_file_size(capacity))
+        fd = os.open(tmp, os.O_RDWR)
+        try:
+            new_map = mmap.mmap(fd, _file_size(capacity))
+        finally:
+            os.close(fd)
+
+        layout = _Layout(new_map, capacity)
+        old = self._map
+        if old is not None:
+            # Generations keep counting across files, for readers waiting on them
+            layout.generation[()] = self._layout.generation
+        self._map, self._layout, self.capacity = new_map, layout, capacity
+        if old is not None:
+            old.close()
+        return tmp
+
+    def publish(self, metrics: List[Tuple[int, int, int, float, float]], timestamp: Optional[float] = None):
+        """Publish one tick of (pid, cpu_time_ns, packets, energy, carbon) metrics"""
+        count = len(metrics)
+        grown = None
+        if count > self.capacity:
+            capacity = self.capacity
+            while capacity < count:
+                capacity *= 2
+            grown = self._create(capacity)
+
+        generation = int(self._layout.generation) + 1
+        header, stamp, columns = self._layout.slots[generation & 1]
+
+        header[0] += 1                  # odd: being written
+        if count:
+            values = list(zip(*metrics))
+            for (name, _), column in zip(SNAPSHOT_COLUMNS, values):
+                columns[name][:count] = column
+        stamp[()] = time.time() if timestamp is None else timestamp
+        header[2] = count
+        header[0] += 1                  # even: complete
+
+        self._layout.generation[()] = generation
+
+        if grown is not None:
+            # Readers of the old file keep the previous tick until they reopen
+            os.replace(grown, self.path)
+
+    def close(self):
+        """Stop publishing; readers keep the last tick until they reopen"""
+        if self._map is not None:
+            self._layout = None
+            self._map.close()
+            self._map = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class Snapshot(NamedTuple):
+    generation: int
+    timestamp: float
+    columns: Dict[str, np.ndarray]  # SNAPSHOT_COLUMNS name -> array, one row per process
+    seq: int                        # slot counter when read (see SnapshotReader.is_current)
+
+    def metrics(self) -> List[Tuple[int, int, int, float, float]]:
+        """As (pid, cpu_time_ns, packets, energy, carbon) tuples"""
+        return list(zip(*(self.columns[name].tolist() for name, _ in SNAPSHOT_COLUMNS)))
+
+
+class SnapshotReader:
+    """Maps a snapshot file and reads its newest tick"""
+
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        self._map = None
+        self._inode = None
+        self._open()
+
+    def _open(self):
+        import mmap
+
+        with open(self.path, 'rb') as f:
+            magic, capacity, _ = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a metrics snapshot")
+            new_map = mmap.mmap(f.fileno(), _file_size(capacity), access=mmap.ACCESS_READ)
+            self._inode = os.fstat(f.fileno()).st_ino
+        # The old map is not closed: views handed out with copy=False keep
+        # it alive (as their base) and it is unmapped when they are gone
+        self._map = new_map
+        self._layout = _Layout(new_map, capacity)
+
+    def _reopen_if_replaced(self):
+        """The publisher swaps in a new file when it grows or restarts"""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if inode != self._inode:
+            self._open()
+
+    @property
+    def generation(self) -> int:
+        """Ticks published so far (0 = none yet)"""
+        return int(self._layout.generation)
+
+    def latest(self, copy: bool = True) -> Optional[Snapshot]:
+        """
+        Newest complete tick, or None before the first one
+        copy: False returns views into the shared file (no copy at all);
+              they are overwritten two ticks later, see is_current()
+        Raises: TimeoutError if the slot could not be read consistently
+        """
+        self._reopen_if_replaced()
+        for _ in range(READ_RETRIES):
+            generation = int(self._layout.generation)
+            if generation == 0:
+                return None
+            header, stamp, columns = self._layout.slots[generation & 1]
+
+            seq = int(header[0])
+            if seq & 1:
+                continue
+            count = int(header[2])
+            timestamp = float(stamp)
+            data = {name: column[:count] for name, column in columns.items()}
+            if copy:
+                data = {name: column.copy() for name, column in data.items()}
+            if int(header[0]) == seq:
+                return Snapshot(generation, timestamp, data, seq)
+        raise TimeoutError(f"{self.path}: snapshot kept changing while being read")
+
+    def is_current(self, snapshot: Snapshot) -> bool:
+        """True while the slot of a copy=False snapshot has not been rewritten"""
+        header, _, _ = self._layout.slots[snapshot.generation & 1]
+        return int(header[0]) == snapshot.seq
+
+    def wait(self, after_generation: int, timeout: Optional[float] = None,
+             poll: float = 0.05) -> Optional[Snapshot]:
+        """Block until a tick newer than after_generation is published (None on timeout)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._reopen_if_replaced()
+            if self.generation > after_generation:
+                return self.latest()
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        """Drop the mapping; it is unmapped once no copy=False view refers to it"""
+        self._layout = None
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def add_parser(subparsers):
+    """Register the `top` subcommand"""
+    parser = subparsers.add_parser('top', help="live top emitters from a running monitor's snapshot")
+    parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT_PATH, metavar='PATH',
+                        help=f"snapshot published with --publish (default: {DEFAULT_SNAPSHOT_PATH})")
+    parser.add_argument('--top', type=int, default=20,
+                        help="number of processes to show (default: 20)")
+    parser.add_argument('--once', action='store_true',
+                        help="print the current tick and exit")
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py top`"""
+    from display import display_table
+
+    try:
+        reader = SnapshotReader(args.snapshot)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ No snapshot to read: {e}")
+        print("Start a monitor with --publish first")
+        return 1
+
+    with reader:
+        generation = 0
+        try:
+            while True:
+                snapshot = reader.wait(generation, timeout=10)
+                if snapshot is None:
+                    print("⚠️  No new tick for 10s; is the monitor still running?")
+                    continue
+                generation = snapshot.generation
+
+                # Highest carbon first, without sorting the whole tick
+                carbon = snapshot.columns['carbon']
+                top = min(args.top, len(carbon))
+                index = np.argpartition(-carbon, top - 1)[:top] if top else np.array([], dtype=np.int64)
+                index = index[np.argsort(-carbon[index])]
+                metrics = snapshot.metrics()
+                display_table([metrics[i] for i in index.tolist()])
+                print(f"🕒 Tick {generation} at {time.strftime('%H:%M:%S', time.localtime(snapshot.timestamp))}")
+                if args.once:
+                    return 0
+        except KeyboardInterrupt:
+            return 0
+
+
+def benchmark():
+    """Publish and read ticks of a busy host"""
+    rng = np.random.default_rng(0)
+    processes = 20_000
+    metrics = list(zip(range(processes), rng.integers(0, 10**10, processes).tolist(),
+                       rng.integers(0, 10**6, processes).tolist(), rng.random(processes).tolist(),
+                       rng.random(processes).tolist()))
+    path = os.path.join(tempfile.gettempdir(), f'carbon_snapshot_bench_{os.getpid()}')
+
+    with SnapshotPublisher(path, capacity=1024) as publisher, SnapshotReader(path) as reader:
+        ticks = 50
+        start = time.perf_counter()
+        for _ in range(ticks):
+            publisher.publish(metrics)
+        publish_ms = (time.perf_counter() - start) * 1000 / ticks
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            snapshot = reader.latest(copy=False)
+        view_us = (time.perf_counter() - start) * 1_000_000 / ticks
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            snapshot = reader.latest()
+        copy_us = (time.perf_counter() - start) * 1_000_000 / ticks
+
+        assert snapshot.generation == ticks and snapshot.metrics() == metrics
+
+    print(f"snapshot: {processes} processes, publish {publish_ms:.2f} ms/tick, "
+          f"read {view_us:.1f} us (views) / {copy_us:.1f} us (copy), capacity grown to {publisher.capacity}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Top-K Emitter Tracker
+Indexed max-heap of process metrics keyed by PID, ordered by carbon
+
+Rows are updated in place as new samples arrive (O(log n) per changed
+process) instead of re-sorting the full list every tick, and the ranked
+top rows are cached until the next change, so display, mitigation and
+charting can all read them within a tick without sorting again.
+"""
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Metric = Tuple[int, int, int, float, float]   # (pid, cpu_time_ns, packets, energy, carbon)
+
+CARBON = 4
+
+
+class TopKTracker:
+    """Indexed max-heap of metrics rows keyed by PID"""
+
+    def __init__(self, metrics: Iterable[Metric] = ()):
+        self._heap: List[int] = []            # PIDs in heap order
+        self._pos: Dict[int, int] = {}        # PID -> index in _heap
+        self._rows: Dict[int, Metric] = {}    # PID -> latest row
+        self._ranked: Optional[List[Metric]] = None
+        self.total_energy = 0.0
+        self.total_carbon = 0.0
+
+        # Bulk load in O(n)
+        for row in metrics:
+            pid = row[0]
+            if pid in self._rows:
+                self._remove_totals(self._rows[pid])
+            else:
+                self._pos[pid] = len(self._heap)
+                self._heap.append(pid)
+            self._rows[pid] = row
+            self._add_totals(row)
+        for i in reversed(range(len(self._heap) // 2)):
+            self._sift_down(i)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._rows
+
+    def get(self, pid: int) -> Optional[Metric]:
+        """Latest row for a PID, or None"""
+        return self._rows.get(pid)
+
+    def rows(self) -> List[Metric]:
+        """All tracked rows, unordered"""
+        return list(self._rows.values())
+
+    def update(self, row: Metric):
+        """Insert or update the row of one process"""
+        pid = row[0]
+        old = self._rows.get(pid)
+        if old == row:
+            return
+
+        self._ranked = None
+        self._rows[pid] = row
+        self._add_totals(row)
+
+        if old is None:
+            self._pos[pid] = len(self._heap)
+            self._heap.append(pid)
+            self._sift_up(len(self._heap) - 1)
+            return
+
+        self._remove_totals(old)
+        index = self._pos[pid]
+        if row[CARBON] > old[CARBON]:
+            self._sift_up(index)
+        else:
+            self._sift_down(index)
+
+    def remove(self, pid: int):
+        """Stop tracking a process"""
+        row = self._rows.pop(pid, None)
+        if row is None:
+            return
+
+        self._ranked = None
+        self._remove_totals(row)
+
+        index = self._pos.pop(pid)
+        last = self._heap.pop()
+        if index < len(self._heap):
+            # Move the last entry into the hole and restore heap order
+            self._heap[index] = last
+            self._pos[last] = index
+            self._sift_up(index)
+            self._sift_down(self._pos[last])
+
+    def update_many(self, metrics: Iterable[Metric], drop_missing: bool = True):
+        """
+        Apply one tick of samples; only rows that changed are re-heaped
+        drop_missing: Forget processes absent from this tick (exited)
+        """
+        seen = set()
+        for row in metrics:
+            seen.add(row[0])
+            self.update(row)
+
+        if drop_missing:
+            for pid in [pid for pid in self._rows if pid not in seen]:
+                self.remove(pid)
+
+    def top(self, k: int) -> List[Metric]:
+        """
+        The k highest-carbon rows, highest first.
+
+        Walks the heap from the root with a frontier of candidates, so it
+        costs O(k log k) and never looks at the rest of the heap. The result
+        is cached, making repeated reads in the same tick O(k).
+        """
+        if self._ranked is not None and (len(self._ranked) >= k or len(self._ranked) == len(self._heap)):
+            return self._ranked[:k]
+
+        ranked = []
+        if self._heap:
+            frontier = [(-self._key(0), 0)]
+            while frontier and len(ranked) < k:
+                _, index = heapq.heappop(frontier)
+                ranked.append(self._rows[self._heap[index]])
+                for child in (2 * index + 1, 2 * index + 2):
+                    if child < len(self._heap):
+                        heapq.heappush(frontier, (-self._key(child), child))
+
+        self._ranked = ranked
+        return ranked
+
+    # Internal helpers
+
+    def _key(self, index: int) -> float:
+        return self._rows[self._heap[index]][CARBON]
+
+    def _add_totals(self, row: Metric):
+        self.total_energy += row[3]
+        self.total_carbon += row[CARBON]
+
+    def _remove_totals(self, row: Metric):
+        self.total_energy -= row[3]
+        self.total_carbon -= row[CARBON]
+
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._pos[heap[i]] = i
+        self._pos[heap[j]] = j
+
+    def _sift_up(self, index: int):
+        while index > 0:
+            parent = (index - 1) // 2
+            if self._key(index) <= self._key(parent):
+                break
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index: int):
+        size = len(self._heap)
+        while True:
+            largest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and self._key(child) > self._key(largest):
+                    largest = child
+            if largest == index:
+                break
+            self._swap(index, largest)
+            index = largest
+
+
+def top_emitters(metrics: List[Metric], n: int, ranked: Optional[TopKTracker] = None) -> List[Metric]:
+    """
+    Top n rows by carbon, highest first.
+    Uses the tracker's cached ranking when given, otherwise a partial
+    selection over metrics (O(len(metrics) log n), no full sort).
+    """
+    if ranked is not None:
+        return ranked.top(n)
+    return heapq.nlargest(n, metrics, key=lambda x: x[CARBON])
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Emission Trends
+Persists per-tick emission rates and plots them over time
+
+The history file is a small header followed by fixed-size records
+(HISTORY_DTYPE), one per active process per tick, appended in time order.
+Readers memory-map it and walk it in chunks, so memory stays bounded by
+the chunk size and the number of pixels, not by the length of the
+history. Series are decimated before plotting:
+
+    minmax - minimum and maximum of every pixel bucket (keeps every spike)
+    lttb   - Largest-Triangle-Three-Buckets (keeps the visual shape)
+
+    python3 pycode/main_psutil.py --history history.bin
+    python3 pycode/carbon.py trends --history history.bin --output trends.png
+"""
+
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b'CCHIST01'
+HEADER_SIZE = 64
+
+HISTORY_DTYPE = np.dtype([
+    ('timestamp', '<f8'),       # seconds since epoch
+    ('pid', '<u4'),
+    ('watts', '<f4'),           # energy rate over the previous tick
+    ('carbon_rate', '<f4'),     # g CO2 per second over the previous tick
+])
+
+# Records read from the memory map at a time
+CHUNK_ROWS = 1 << 22
+
+
+class HistoryWriter:
+    """Appends per-process emission rates to a history file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'ab')
+        if new:
+            self._file.write(MAGIC.ljust(HEADER_SIZE, b'\0'))
+        else:
+            check_header(path)
+            # Drop a record cut short by a crash, so the file stays aligned
+            size = os.path.getsize(path)
+            tail = (size - HEADER_SIZE) % HISTORY_DTYPE.itemsize
+            if tail:
+                self._file.truncate(size - tail)
+        self._previous: Dict[int, Tuple[float, float, float]] = {}
+
+    def append(self, metrics, timestamp: Optional[float] = None):
+        """
+        Record one tick of cumulative metrics as rates
+        metrics: List of (pid, cpu_time_ns, packets, energy, carbon)
+        """
+        timestamp = timestamp or time.time()
+        previous = self._previous
+        current = {}
+        rows = []
+        for pid, _, _, energy, carbon in metrics:
+            current[pid] = (timestamp, energy, carbon)
+            old = previous.get(pid)
+            # New processes need a second sample before they have a rate
+            if old is None or energy <= old[1] or timestamp <= old[0]:
+                continue
+            dt = timestamp - old[0]
+            rows.append((timestamp, pid, (energy - old[1]) / dt, (carbon - old[2]) / dt))
+        self._previous = current
+
+        if rows:
+            self._file.write(np.array(rows, dtype=HISTORY_DTYPE).tobytes())
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def check_header(path: str):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an emission history file")
+
+
+def open_history(path: str) -> np.ndarray:
+    """Memory-map the complete records of a history file (read-only)"""
+    check_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // HISTORY_DTYPE.itemsize
+    if count <= 0:
+        return np.empty(0, dtype=HISTORY_DTYPE)
+    return np.memmap(path, dtype=HISTORY_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def _chunks(history: np.ndarray, start: int, end: int, chunk_rows: int = CHUNK_ROWS):
+    """
+    Slices of history[start:end], cut at tick boundaries so no tick is
+    split across two chunks
+    """
+    while start < end:
+        stop = min(start + chunk_rows, end)
+        if stop < end:
+            # Move the cut back to the first record of the tick it falls in
+            ts = history['timestamp']
+            cut = start + int(np.searchsorted(ts[start:stop], ts[stop], side='left'))
+            stop = cut if cut > start else stop
+        yield history[start:stop]
+        start = stop
+
+
+def time_range(history: np.ndarray, since: Optional[float] = None,
+               until: Optional[float] = None) -> Tuple[int, int]:
+    """Record index range covering [since, until] (records are time-sorted)"""
+    ts = history['timestamp']
+    start = int(np.searchsorted(ts, since, side='left')) if since is not None else 0
+    end = int(np.searchsorted(ts, until, side='right')) if until is not None else len(history)
+    return start, end
+
+
+def scan_totals(history: np.ndarray, start: int, end: int):
+    """
+    One pass over the range
+    Returns: (timestamps, watts, carbon_rate) of the whole machine per tick,
+             and the summed watts of every PID (indexed by PID)
+    """
+    times, watts, carbon = [], [], []
+    by_pid = np.zeros(0)
+    for chunk in _chunks(history, start, end):
+        ts = np.asarray(chunk['timestamp'])
+        # Index of the first record of every tick
+        first = np.flatnonzero(np.r_[True, ts[1:] != ts[:-1]])
+        times.append(ts[first])
+        watts.append(np.add.reduceat(chunk['watts'].astype(np.float64), first))
+        carbon.append(np.add.reduceat(chunk['carbon_rate'].astype(np.float64), first))
+
+        # PIDs are bounded by pid_max, so a dense bincount beats a hash
+        sums = np.bincount(chunk['pid'], weights=chunk['watts'])
+        if len(sums) > len(by_pid):
+            by_pid = np.pad(by_pid, (0, len(sums) - len(by_pid)))
+        by_pid[:len(sums)] += sums
+
+    if not times:
+        empty = np.empty(0)
+        return empty, empty, empty, by_pid
+    return np.concatenate(times), np.concatenate(watts), np.concatenate(carbon), by_pid
+
+
+def top_pids(by_pid: np.ndarray, n: int) -> List[int]:
+    """PIDs with the most energy, from the per-PID sums of scan_totals"""
+    order = np.argsort(by_pid)[::-1][:n]
+    return [int(pid) for pid in order if by_pid[pid] > 0]
+
+
+def pid_series(history: np.ndarray, start: int, end: int, pids: List[int],
+               buckets: int) -> Dict[int, Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Rates of the given PIDs, min/max-decimated into `buckets` equal time
+    buckets of the range while walking it, so memory is bounded by the
+    bucket count however many records the PIDs have
+    Returns: {pid: ((timestamps, watts), (timestamps, carbon_rate))}, in time order
+    """
+    # Lookup table instead of np.isin, which sorts every chunk
+    slots = np.full(max(pids, default=0) + 2, -1, dtype=np.int8 if len(pids) < 128 else np.int64)
+    slots[pids] = np.arange(len(pids))
+    ts = history['timestamp']
+    origin, span = float(ts[start]), float(ts[end - 1] - ts[start])
+    scale = buckets / span if span > 0 else 0.0
+
+    # Per (PID, bucket): minimum value and its time, maximum value and its time
+    size = len(pids) * buckets
+    extremes = {name: (np.full(size, np.inf), np.zeros(size), np.full(size, -np.inf), np.zeros(size))
+                for name in ('watts', 'carbon_rate')}
+    for chunk in _chunks(history, start, end):
+        slot = slots.take(chunk['pid'], mode='clip')
+        index = np.flatnonzero(slot >= 0)
+        if len(index) == 0:
+            continue
+        t_all = np.asarray(chunk['timestamp'][index])
+        bucket_all = np.minimum(((t_all - origin) * scale).astype(np.int64), buckets - 1)
+        values_all = {name: np.asarray(chunk[name][index]) for name in extremes}
+        slot = slot[index]
+        for i in np.unique(slot).tolist():
+            # A PID's records are in time order, so its buckets are
+            # contiguous runs: reduce each run without sorting
+            mine = np.flatnonzero(slot == i)
+            t, bucket = t_all[mine], bucket_all[mine]
+            first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            keys = i * buckets + bucket[first]
+            lengths = np.diff(np.r_[first, len(mine)])
+            for name, (low, low_t, high, high_t) in extremes.items():
+                v = values_all[name][mine]
+                for reduce, best, best_t, better in ((np.minimum, low, low_t, np.less),
+                                                     (np.maximum, high, high_t, np.greater)):
+                    extreme = reduce.reduceat(v, first)
+                    # Earliest record reaching each run's extreme
+                    hits = np.flatnonzero(v == np.repeat(extreme, lengths))
+                    hits = hits[np.searchsorted(hits, first)]
+                    extreme = extreme.astype(np.float64)
+                    update = better(extreme, best[keys])
+                    best[keys[update]] = extreme[update]
+                    best_t[keys[update]] = t[hits[update]]
+
+    series = {}
+    for i, pid in enumerate(pids):
+        own = slice(i * buckets, (i + 1) * buckets)
+        pair = []
+        for low, low_t, high, high_t in extremes.values():
+            filled = np.isfinite(low[own])
+            t = np.stack([low_t[own][filled], high_t[own][filled]], axis=1)
+            v = np.stack([low[own][filled], high[own][filled]], axis=1)
+            # Keep each bucket's pair in time order
+            swap = t[:, 0] > t[:, 1]
+            t[swap], v[swap] = t[swap][:, ::-1], v[swap][:, ::-1]
+            pair.append((t.ravel(), v.ravel()))
+        series[pid] = tuple(pair)
+    return series
+
+
+def decimate_minmax(t: np.ndarray, v: np.ndarray, buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum and maximum of each of `buckets` equal time buckets, in time
+    order, so a line through them still shows every spike and dip
+    t must be sorted
+    """
+    if len(t) <= 2 * buckets:
+        return t, v
+
+    edges = np.linspace(t[0], t[-1], buckets + 1)
+    starts = np.searchsorted(t, edges[:-1], side='left')
+    starts = np.unique(starts[starts < len(t)])
+
+    # Positions of each bucket's extremes, so every pair stays in time order
+    ends = np.r_[starts[1:], len(t)]
+    index = np.empty((len(starts), 2), dtype=np.int64)
+    for i, (lo, hi) in enumerate(zip(starts, ends)):
+        bucket = v[lo:hi]
+        a, b = lo + int(np.argmin(bucket)), lo + int(np.argmax(bucket))
+        index[i] = (a, b) if a <= b else (b, a)
+    index = index.ravel()
+    return t[index], v[index]
+
+
+def lttb(t: np.ndarray, v: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets downsampling to `threshold` points
+    (Steinarsson 2013). One pass; each bucket picks the point forming the
+    largest triangle with the previous pick and the next bucket's mean.
+    """
+    n = len(t)
+    if threshold >= n or threshold < 3:
+        return t, v
+
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # Mean of every bucket, plus the last point standing in for the bucket
+    # after the final one
+    mean_t = np.r_[np.add.reduceat(t, edges[:-1]) / counts, t[-1]]
+    mean_v = np.r_[np.add.reduceat(v, edges[:-1]) / counts, v[-1]]
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((t[previous] - mean_t[i + 1]) * (v[lo:hi] - v[previous])
+                      - (t[previous] - t[lo:hi]) * (mean_v[i + 1] - v[previous]))
+        previous = lo + int(np.argmax(area))
+        selected[i + 1] = previous
+
+    return t[selected], v[selected]
+
+
+def decimate(t: np.ndarray, v: np.ndarray, points: int, method: str = 'minmax'):
+    if method == 'lttb':
+        return lttb(t, v, points)
+    return decimate_minmax(t, v, points // 2)
+
+
+def plot_trends(path: str, output_file: str = 'carbon_trends.png', top_n: int = 5,
+                since: Optional[float] = None, until: Optional[float] = None,
+                width_px: int = 1600, method: str = 'minmax', names: Optional[Dict[int, str]] = None):
+    """
+    Plot total and top-emitter energy and carbon rates from a history file
+    Returns: Number of records read, or 0 if there was nothing to plot
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from visualization import process_names
+
+    history = open_history(path)
+    start, end = time_range(history, since, until)
+    if start >= end:
+        return 0
+
+    dpi = 100
+    # Constrained layout is solved while drawing, unlike tight_layout which
+    # renders the whole figure an extra time
+    fig = Figure(figsize=(width_px / dpi, 9), dpi=dpi, layout='constrained')
+    FigureCanvasAgg(fig)
+    ax_energy, ax_carbon = fig.subplots(2, 1, sharex=True)
+
+    t, watts, carbon, by_pid = scan_totals(history, start, end)
+    origin = t[0]
+    for ax, values in ((ax_energy, watts), (ax_carbon, carbon * 3600)):
+        dt, dv = decimate(t, values, width_px, method)
+        ax.plot((dt - origin) / 3600, dv, color='#333333', linewidth=1.2, label='Total')
+
+    pids = top_pids(by_pid, top_n)
+    names = dict(names or {})
+    names.update(process_names([pid for pid in pids if pid not in names]))
+    for pid, ((wt, pw), (ct, pc)) in pid_series(history, start, end, pids, width_px).items():
+        if len(wt) == 0:
+            continue
+        label = f"{names[pid][:15]} ({pid})"
+        for ax, pt, values in ((ax_energy, wt, pw), (ax_carbon, ct, pc * 3600)):
+            dt, dv = decimate(pt, values, width_px, method)
+            ax.plot((dt - origin) / 3600, dv, linewidth=0.8, label=label)
+
+    ax_energy.set_ylabel('Power (W)', fontsize=12, fontweight='bold')
+    ax_carbon.set_ylabel('Carbon (g CO2 / h)', fontsize=12, fontweight='bold')
+    ax_carbon.set_xlabel(f"Hours since {time.strftime('%Y-%m-%d %H:%M', time.localtime(origin))}",
+                         fontsize=12, fontweight='bold')
+    ax_energy.set_title(f'Emission Trends: Total and Top {top_n} Emitters', fontsize=14, fontweight='bold')
+    for ax in (ax_energy, ax_carbon):
+        ax.grid(alpha=0.3)
+    ax_energy.legend(loc='upper right', fontsize=8)
+
+    # Fast zlib level: the line art compresses nearly as well and encoding
+    # is a large share of the render time
+    fig.savefig(output_file, **({'pil_kwargs': {'compress_level': 1}}
+                                if output_file.lower().endswith('.png') else {}))
+    fig.clear()
+    return end - start
+
+
+def add_parser(subparsers):
+    """Register the `trends` subcommand"""
+    parser = subparsers.add_parser('trends', help="plot emission rates over time from a history file")
+    parser.add_argument('--history', required=True, metavar='PATH',
+                        help="history file written with --history by the monitors")
+    parser.add_argument('--output', default='carbon_trends.png',
+                        help="chart file, PNG or SVG (default: carbon_trends.png)")
+    parser.add_argument('--top', type=int, default=5,
+                        help="top emitters to plot besides the total (default: 5)")
+    parser.add_argument('--hours', type=float,
+                        help="only plot the last N hours")
+    parser.add_argument('--method', choices=('minmax', 'lttb'), default='minmax',
+                        help="decimation: minmax keeps spikes, lttb keeps shape (default: minmax)")
+    parser.add_argument('--width', type=int, default=1600,
+                        help="chart width in pixels, which bounds the points drawn (default: 1600)")
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    """Entry point of `carbon.py trends`"""
+    from visualization import MATPLOTLIB_AVAILABLE
+    if not MATPLOTLIB_AVAILABLE:
+        print("⚠️  Matplotlib not available. Install with: sudo apt-get install python3-matplotlib")
+        return 1
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    start = time.perf_counter()
+    records = plot_trends(args.history, args.output, args.top, since=since,
+                          width_px=args.width, method=args.method)
+    if not records:
+        print(f"No samples in {args.history} for that period")
+        return 1
+    print(f"📈 Trend chart saved to: {args.output} "
+          f"({records:,} records in {time.perf_counter() - start:.2f}s)")
+    return 0
+
+
+def benchmark(path: str = 'benchmark_history.bin', days: float = 7, processes: int = 10):
+    """Write a synthetic history at 1 s resolution and time plotting it"""
+    ticks = int(days * 86400)
+    if not os.path.exists(path):
+        print(f"✍️  Writing {ticks:,} ticks x {processes} processes to {path}...")
+        rng = np.random.default_rng(0)
+        with open(path, 'wb') as f:
+            f.write(MAGIC.ljust(HEADER_SIZE, b'\0'))
+            step = 86400
+            for first in range(0, ticks, step):
+                count = min(step, ticks - first)
+                rows = np.empty((count, processes), dtype=HISTORY_DTYPE)
+                rows['timestamp'] = (1.7e9 + np.arange(first, first + count))[:, None]
+                rows['pid'] = np.arange(1000, 1000 + processes)
+                rows['watts'] = rng.gamma(2.0, 2.0, (count, processes)) * np.arange(1, processes + 1)
+                rows['carbon_rate'] = rows['watts'] * 475 / 3_600_000
+                f.write(rows.tobytes())
+
+    # Import time is not render time
+    import matplotlib.figure  # noqa: F401
+    import visualization  # noqa: F401
+
+    for method in ('minmax', 'lttb'):
+        start = time.perf_counter()
+        records = plot_trends(path, 'benchmark_trends.png', method=method)
+        print(f"📏 {method}: {records:,} records plotted in {time.perf_counter() - start:.2f}s")
+    os.remove('benchmark_trends.png')
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -2,123 +2,233 @@
 """
 Visualization Module
 Creates charts to visualize carbon emissions before and after reduction
+
+Charts are drawn on matplotlib Figure objects (not pyplot's global state)
+from a template that is built once and only has its bar heights and
+labels updated per chart. ChartWorker renders in a background process
+so the caller never waits for matplotlib. Output files ending in .svg or
+.html are written directly, without matplotlib.
 """
 
-try:
-    import matplotlib
-    matplotlib.use('Agg')  # Non-interactive backend for WSL
-    import matplotlib.pyplot as plt
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
+import html
+import importlib.util
+import multiprocessing
+import os
+import signal
+import time
+
+# matplotlib takes ~0.5s to import, so only check that it is installed here
+# and import it the first time a chart is actually drawn
+MATPLOTLIB_AVAILABLE = importlib.util.find_spec('matplotlib') is not None
 
 import psutil
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from topk import TopKTracker, top_emitters
+
+BEFORE_COLOR = '#ff6b6b'
+AFTER_COLOR = '#51cf66'
+BAR_COLOR = '#339af0'
+
+# Formats written without matplotlib
+LIGHTWEIGHT_FORMATS = ('.svg', '.html')
+
+
+def process_names(pids: List[int]) -> Dict[int, str]:
+    """Name of each PID ('PID n' if it is gone), one lookup per process"""
+    names = {}
+    for pid in pids:
+        try:
+            names[pid] = psutil.Process(pid).name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            names[pid] = f"PID {pid}"
+    return names
+
+
+def comparison_data(
+    before_metrics: List[Tuple[int, int, int, float, float]],
+    after_metrics: List[Tuple[int, int, int, float, float]],
+    top_n: int = 10,
+    ranked_before: Optional[TopKTracker] = None,
+    names: Optional[Dict[int, str]] = None
+) -> dict:
+    """
+    Everything a comparison chart shows, as plain (picklable) data
+
+    names: PID -> process name, e.g. collected when the table was printed
+           (PIDs missing from it are looked up here)
+    """
+    before_sorted = top_emitters(before_metrics, top_n, ranked_before)
+    after_carbon_map = {pid: carbon for pid, _, _, _, carbon in after_metrics}
+
+    pids = [pid for pid, _, _, _, _ in before_sorted]
+    names = dict(names or {})
+    names.update(process_names([pid for pid in pids if pid not in names]))
+
+    carbon_before = [carbon for _, _, _, _, carbon in before_sorted]
+    carbon_after = [after_carbon_map.get(pid, 0) for pid in pids]
+    return {
+        'top_n': top_n,
+        'pids': pids,
+        'labels': [f"{names.get(pid, f'PID {pid}')[:15]}\n({pid})" for pid in pids],
+        'carbon_before': carbon_before,
+        'carbon_after': carbon_after,
+        'total_before': sum(carbon_before),
+        'total_after': sum(carbon_after),
+    }
+
+
+class ComparisonChartRenderer:
+    """
+    Reusable before/after chart: the figure, bars and static decorations
+    are created once, each render() only updates heights and labels
+    """
+
+    def __init__(self, top_n: int = 10, dpi: int = 100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.top_n = top_n
+        self.dpi = dpi
+        self.fig = Figure(figsize=(16, 8))
+        FigureCanvasAgg(self.fig)
+        self.ax1, self.ax2 = self.fig.subplots(1, 2)
+        # Fixed margins leave room for the rotated labels without a
+        # tight_layout pass per chart
+        self.fig.subplots_adjust(left=0.06, right=0.97, bottom=0.22, top=0.9, wspace=0.25)
+
+        x = list(range(top_n))
+        width = 0.35
+        zeros = [0.0] * top_n
+        self.bars_before = self.ax1.bar([i - width/2 for i in x], zeros, width, label='Before',
+                                        color=BEFORE_COLOR, alpha=0.8)
+        self.bars_after = self.ax1.bar([i + width/2 for i in x], zeros, width, label='After',
+                                       color=AFTER_COLOR, alpha=0.8)
+        self.value_labels = [
+            self.ax1.text(bar.get_x() + bar.get_width()/2., 0, '', ha='center', va='bottom', fontsize=7)
+            for bar in list(self.bars_before) + list(self.bars_after)
+        ]
+
+        self.ax1.set_xlabel('Process', fontsize=12, fontweight='bold')
+        self.ax1.set_ylabel('Carbon Emissions (g CO2)', fontsize=12, fontweight='bold')
+        self.ax1.set_xticks(x)
+        self.ax1.legend()
+        self.ax1.grid(axis='y', alpha=0.3)
+
+    def render(self, data: dict, output_file: str):
+        """Draw comparison_data() output into output_file"""
+        n = min(len(data['labels']), self.top_n)
+        before = data['carbon_before'][:n] + [0.0] * (self.top_n - n)
+        after = data['carbon_after'][:n] + [0.0] * (self.top_n - n)
+
+        bars = list(self.bars_before) + list(self.bars_after)
+        for bar, height, label, slot in zip(bars, before + after, self.value_labels,
+                                            list(range(self.top_n)) * 2):
+            visible = slot < n
+            bar.set_height(height)
+            bar.set_visible(visible)
+            label.set_visible(visible and height > 0)
+            label.set_y(height)
+            label.set_text(f'{height:.4f}')
+
+        self.ax1.set_xticklabels(data['labels'][:n] + [''] * (self.top_n - n),
+                                 rotation=45, ha='right', fontsize=9)
+        self.ax1.set_xlim(-0.5, max(n, 1) - 0.5)
+        self.ax1.set_ylim(0, max(before + after + [0.0]) * 1.15 or 1.0)
+        self.ax1.set_title(f"Top {data['top_n']} Carbon Emitters: Before vs After Reduction",
+                           fontsize=14, fontweight='bold')
+
+        # The pie has no cheap in-place update; it is small, redraw it
+        self._draw_pie(data['total_before'], data['total_after'])
+
+        self.fig.savefig(output_file, dpi=self.dpi)
+
+    def _draw_pie(self, total_before: float, total_after: float):
+        ax2 = self.ax2
+        ax2.clear()
+
+        savings = total_before - total_after
+        reduction_percent = (savings / total_before) * 100 if total_before > 0 else 0
+
+        if savings > 0:
+            ax2.pie([total_after, savings], explode=(0.05, 0.1),
+                    labels=['Remaining Emissions', 'Saved Emissions'], colors=[BEFORE_COLOR, AFTER_COLOR],
+                    autopct='%1.1f%%', shadow=True, startangle=90, textprops={'fontsize': 11})
+        elif total_before > 0:
+            ax2.pie([total_before], explode=(0,), labels=['Total Emissions'], colors=[BEFORE_COLOR],
+                    autopct='%1.1f%%', shadow=True, startangle=90, textprops={'fontsize': 11})
+        ax2.set_title(f'Carbon Emission Reduction\nTotal Saved: {savings:.6f} g CO2 ({reduction_percent:.1f}%)',
+                      fontsize=14, fontweight='bold')
+
+        summary_text = f'Before: {total_before:.6f} g CO2\nAfter: {total_after:.6f} g CO2'
+        ax2.text(0, -1.3, summary_text, ha='center', fontsize=11,
+                 bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+
+    def close(self):
+        """Release the figure"""
+        if self.fig is not None:
+            self.fig.clear()
+            self.fig = None
+
+
+# Renderers built so far in this process, by (top_n, dpi)
+_renderers: Dict[Tuple[int, int], ComparisonChartRenderer] = {}
+
+
+def render_comparison(data: dict, output_file: str, dpi: int = 100):
+    """Write a comparison chart; the format follows the file extension"""
+    extension = os.path.splitext(output_file)[1].lower()
+    if extension == '.svg':
+        with open(output_file, 'w') as f:
+            f.write(comparison_svg(data))
+    elif extension == '.html':
+        with open(output_file, 'w') as f:
+            f.write(comparison_html(data))
+    else:
+        key = (data['top_n'], dpi)
+        if key not in _renderers:
+            _renderers[key] = ComparisonChartRenderer(*key)
+        _renderers[key].render(data, output_file)
+
+
+def close_renderers():
+    """Release every cached figure"""
+    for renderer in _renderers.values():
+        renderer.close()
+    _renderers.clear()
 
 
 def create_comparison_chart(
     before_metrics: List[Tuple[int, int, int, float, float]],
     after_metrics: List[Tuple[int, int, int, float, float]],
     output_file: str = 'carbon_comparison.png',
-    top_n: int = 10
+    top_n: int = 10,
+    ranked_before: Optional[TopKTracker] = None,
+    names: Optional[Dict[int, str]] = None,
+    dpi: int = 100
 ):
     """
     Create a bar chart comparing carbon emissions before and after reduction
-    
+
     Args:
         before_metrics: List of (pid, cpu_time_ns, packets, energy, carbon) before
         after_metrics: List of (pid, cpu_time_ns, packets, energy, carbon) after
-        output_file: Path to save the chart
+        output_file: Path to save the chart (.svg/.html skip matplotlib)
         top_n: Number of top processes to display
+        ranked_before: Tracker already holding before_metrics, reused for ranking
+        names: PID -> process name, if already known
+        dpi: Resolution of raster output
     """
-    if not MATPLOTLIB_AVAILABLE:
+    lightweight = output_file.lower().endswith(LIGHTWEIGHT_FORMATS)
+    if not MATPLOTLIB_AVAILABLE and not lightweight:
         print("\n⚠️  Matplotlib not available. Skipping visualization.")
         print("   Install with: sudo apt-get install python3-matplotlib")
         return False
-    
-    # Sort by carbon emissions
-    before_sorted = sorted(before_metrics, key=lambda x: x[4], reverse=True)[:top_n]
-    
-    # Create mapping of PID to carbon
-    before_carbon = {pid: carbon for pid, _, _, _, carbon in before_sorted}
-    after_carbon_map = {pid: carbon for pid, _, _, _, carbon in after_metrics}
-    
-    # Prepare data
-    pids = []
-    process_names = []
-    carbon_before = []
-    carbon_after = []
-    
-    for pid, _, _, _, carbon in before_sorted:
-        pids.append(pid)
-        
-        try:
-            proc = psutil.Process(pid)
-            name = proc.name()[:15]  # Truncate name
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            name = f"PID {pid}"
-        
-        process_names.append(f"{name}\n({pid})")
-        carbon_before.append(carbon)
-        carbon_after.append(after_carbon_map.get(pid, 0))
-    
-    # Create figure
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
-    
-    # Plot 1: Side-by-side comparison
-    x = range(len(process_names))
-    width = 0.35
-    
-    bars1 = ax1.bar([i - width/2 for i in x], carbon_before, width, label='Before', color='#ff6b6b', alpha=0.8)
-    bars2 = ax1.bar([i + width/2 for i in x], carbon_after, width, label='After', color='#51cf66', alpha=0.8)
-    
-    ax1.set_xlabel('Process', fontsize=12, fontweight='bold')
-    ax1.set_ylabel('Carbon Emissions (g CO2)', fontsize=12, fontweight='bold')
-    ax1.set_title(f'Top {top_n} Carbon Emitters: Before vs After Reduction', fontsize=14, fontweight='bold')
-    ax1.set_xticks(x)
-    ax1.set_xticklabels(process_names, rotation=45, ha='right', fontsize=9)
-    ax1.legend()
-    ax1.grid(axis='y', alpha=0.3)
-    
-    # Add value labels on bars
-    for bars in [bars1, bars2]:
-        for bar in bars:
-            height = bar.get_height()
-            if height > 0:
-                ax1.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.4f}',
-                        ha='center', va='bottom', fontsize=7)
-    
-    # Plot 2: Total emissions pie chart
-    total_before = sum(carbon_before)
-    total_after = sum(carbon_after)
-    savings = total_before - total_after
-    
-    if total_before > 0:
-        reduction_percent = (savings / total_before) * 100
-    else:
-        reduction_percent = 0
-    
-    # Pie chart data
-    sizes = [total_after, savings] if savings > 0 else [total_before]
-    labels = ['Remaining Emissions', 'Saved Emissions'] if savings > 0 else ['Total Emissions']
-    colors = ['#ff6b6b', '#51cf66'] if savings > 0 else ['#ff6b6b']
-    explode = (0.05, 0.1) if savings > 0 else (0,)
-    
-    ax2.pie(sizes, explode=explode, labels=labels, colors=colors, autopct='%1.1f%%',
-            shadow=True, startangle=90, textprops={'fontsize': 11})
-    ax2.set_title(f'Carbon Emission Reduction\nTotal Saved: {savings:.6f} g CO2 ({reduction_percent:.1f}%)',
-                  fontsize=14, fontweight='bold')
-    
-    # Add summary text
-    summary_text = f'Before: {total_before:.6f} g CO2\nAfter: {total_after:.6f} g CO2'
-    ax2.text(0, -1.3, summary_text, ha='center', fontsize=11, 
-             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-    
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=150, bbox_inches='tight')
+
+    render_comparison(comparison_data(before_metrics, after_metrics, top_n, ranked_before, names),
+                      output_file, dpi)
     print(f"\n📈 Chart saved to: {output_file}")
-    
+
     return True
 
 
@@ -126,52 +236,267 @@ def create_simple_bar_chart(
     metrics: List[Tuple[int, int, int, float, float]],
     output_file: str = 'carbon_emissions.png',
     title: str = 'Carbon Emissions by Process',
-    top_n: int = 15
+    top_n: int = 15,
+    ranked: Optional[TopKTracker] = None,
+    names: Optional[Dict[int, str]] = None,
+    dpi: int = 100
 ):
     """
     Create a simple bar chart of carbon emissions
-    
+
     Args:
         metrics: List of (pid, cpu_time_ns, packets, energy, carbon)
         output_file: Path to save the chart
         title: Chart title
         top_n: Number of processes to display
+        ranked: Tracker already holding metrics, reused for ranking
+        names: PID -> process name, if already known
+        dpi: Resolution of raster output
     """
     if not MATPLOTLIB_AVAILABLE:
         return False
-    
-    sorted_metrics = sorted(metrics, key=lambda x: x[4], reverse=True)[:top_n]
-    
-    process_labels = []
-    carbon_values = []
-    
-    for pid, _, _, _, carbon in sorted_metrics:
-        try:
-            proc = psutil.Process(pid)
-            name = proc.name()[:12]
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            name = f"PID {pid}"
-        
-        process_labels.append(f"{name}\n({pid})")
-        carbon_values.append(carbon)
-    
-    # Create figure
-    fig, ax = plt.subplots(figsize=(12, 8))
-    
-    bars = ax.barh(range(len(process_labels)), carbon_values, color='#339af0', alpha=0.8)
-    
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    sorted_metrics = top_emitters(metrics, top_n, ranked)
+    names = dict(names or {})
+    names.update(process_names([m[0] for m in sorted_metrics if m[0] not in names]))
+
+    process_labels = [f"{names.get(pid, f'PID {pid}')[:12]}\n({pid})" for pid, _, _, _, _ in sorted_metrics]
+    carbon_values = [carbon for _, _, _, _, carbon in sorted_metrics]
+
+    fig = Figure(figsize=(12, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    bars = ax.barh(range(len(process_labels)), carbon_values, color=BAR_COLOR, alpha=0.8)
+
     ax.set_yticks(range(len(process_labels)))
     ax.set_yticklabels(process_labels, fontsize=9)
     ax.set_xlabel('Carbon Emissions (g CO2)', fontsize=12, fontweight='bold')
     ax.set_title(title, fontsize=14, fontweight='bold')
     ax.grid(axis='x', alpha=0.3)
-    
+
     # Add value labels
     for i, (bar, value) in enumerate(zip(bars, carbon_values)):
         ax.text(value, i, f' {value:.4f}', va='center', fontsize=8)
-    
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=150, bbox_inches='tight')
+
+    fig.tight_layout()
+    fig.savefig(output_file, dpi=dpi)
+    fig.clear()
     print(f"\n📊 Chart saved to: {output_file}")
-    
+
     return True
+
+
+def comparison_svg(data: dict, width: int = 900, height: int = 420) -> str:
+    """Grouped before/after bars as a standalone SVG document"""
+    n = len(data['labels'])
+    left, right, top, bottom = 70, 20, 40, 110
+    plot_w, plot_h = width - left - right, height - top - bottom
+    peak = max(data['carbon_before'] + data['carbon_after'] + [0.0]) or 1.0
+    slot = plot_w / max(n, 1)
+    bar_w = slot * 0.35
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="sans-serif" font-size="11">',
+        f'<text x="{width / 2}" y="22" text-anchor="middle" font-size="15" font-weight="bold">'
+        f'Top {data["top_n"]} Carbon Emitters: Before vs After Reduction</text>',
+        f'<line x1="{left}" y1="{top + plot_h}" x2="{left + plot_w}" y2="{top + plot_h}" stroke="#333"/>',
+        f'<line x1="{left}" y1="{top}" x2="{left}" y2="{top + plot_h}" stroke="#333"/>',
+    ]
+    for tick in range(5):
+        value = peak * tick / 4
+        y = top + plot_h - plot_h * tick / 4
+        parts.append(f'<line x1="{left}" y1="{y:.1f}" x2="{left + plot_w}" y2="{y:.1f}" stroke="#ddd"/>')
+        parts.append(f'<text x="{left - 5}" y="{y + 4:.1f}" text-anchor="end">{value:.4f}</text>')
+
+    for i, (label, before, after) in enumerate(zip(data['labels'], data['carbon_before'], data['carbon_after'])):
+        center = left + slot * (i + 0.5)
+        for offset, value, color in ((-bar_w, before, BEFORE_COLOR), (0, after, AFTER_COLOR)):
+            bar_h = plot_h * value / peak
+            parts.append(f'<rect x="{center + offset:.1f}" y="{top + plot_h - bar_h:.1f}" '
+                         f'width="{bar_w:.1f}" height="{bar_h:.1f}" fill="{color}">'
+                         f'<title>{value:.6f} g CO2</title></rect>')
+        text = html.escape(label.replace('\n', ' '))
+        parts.append(f'<text transform="translate({center:.1f},{top + plot_h + 12}) rotate(40)">{text}</text>')
+
+    parts.append(f'<rect x="{width - 150}" y="{top}" width="10" height="10" fill="{BEFORE_COLOR}"/>'
+                 f'<text x="{width - 135}" y="{top + 9}">Before</text>'
+                 f'<rect x="{width - 80}" y="{top}" width="10" height="10" fill="{AFTER_COLOR}"/>'
+                 f'<text x="{width - 65}" y="{top + 9}">After</text>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def comparison_html(data: dict) -> str:
+    """Self-contained HTML report: summary, SVG chart and table"""
+    total_before, total_after = data['total_before'], data['total_after']
+    savings = total_before - total_after
+    reduction_percent = (savings / total_before) * 100 if total_before > 0 else 0
+
+    rows = '\n'.join(
+        f'<tr><td>{html.escape(label.split(chr(10))[0])}</td><td>{pid}</td>'
+        f'<td>{before:.6f}</td><td>{after:.6f}</td></tr>'
+        for label, pid, before, after in zip(data['labels'], data['pids'],
+                                             data['carbon_before'], data['carbon_after'])
+    )
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Carbon Emission Comparison</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+</style></head><body>
+<h1>Carbon Emission Comparison</h1>
+<p>Before: {total_before:.6f} g CO2 &middot; After: {total_after:.6f} g CO2 &middot;
+Saved: {savings:.6f} g CO2 ({reduction_percent:.1f}%)</p>
+{comparison_svg(data)}
+<table>
+<tr><th>Process</th><th>PID</th><th>Before (g CO2)</th><th>After (g CO2)</th></tr>
+{rows}
+</table>
+<p><small>Generated {time.strftime('%Y-%m-%d %H:%M:%S')}</small></p>
+</body></html>
+"""
+
+
+def flamegraph_svg(folded: Dict[str, float], title: str = 'Carbon Flame Graph', unit: str = 'J',
+                   width: int = 1200, frame_height: int = 16) -> str:
+    """
+    Flame graph of folded stacks ('root;caller;callee' -> weight) as a
+    standalone SVG document. Frames ending in '_[k]' are kernel frames.
+    """
+    # Merge the stacks into a tree: name -> [weight, children]
+    root = [0.0, {}]
+    for stack, weight in folded.items():
+        node = root
+        node[0] += weight
+        for frame in stack.split(';'):
+            node = node[1].setdefault(frame, [0.0, {}])
+            node[0] += weight
+    total = root[0] or 1.0
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node[1].values()), default=0)
+
+    top = 40
+    height = top + (depth(root) - 1) * frame_height + 10
+    scale = (width - 20) / total
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="{width / 2}" y="22" text-anchor="middle" font-family="sans-serif" font-size="15" '
+        f'font-weight="bold">{html.escape(title)} ({root[0]:.4f} {unit})</text>',
+    ]
+
+    def draw(node, x, level):
+        for name, child in sorted(node[1].items()):
+            w = child[0] * scale
+            # Frames narrower than a pixel cannot be seen or hovered
+            if w >= 1.0:
+                y = height - 10 - (level + 1) * frame_height
+                # Stable warm colour per frame name; kernel frames in orange
+                shade = sum(name.encode()) % 80
+                color = f'rgb(230,{120 + shade},50)' if name.endswith('_[k]') else f'rgb(220,{60 + shade},60)'
+                label = html.escape(name)
+                parts.append(f'<g><title>{label} ({child[0]:.6f} {unit}, {child[0] / total * 100:.2f}%)</title>'
+                             f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" '
+                             f'fill="{color}" rx="2"/>')
+                chars = int(w / 7)
+                if chars >= 3:
+                    text = name if len(name) <= chars else name[:chars - 2] + '..'
+                    parts.append(f'<text x="{x + 3:.1f}" y="{y + frame_height - 4}">{html.escape(text)}</text>')
+                parts.append('</g>')
+                draw(child, x, level + 1)
+            x += w
+
+    draw(root, 10.0, 0)
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def _init_worker():
+    """Leave Ctrl+C handling to the parent process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _render_job(data: dict, output_file: str, dpi: int) -> str:
+    render_comparison(data, output_file, dpi)
+    return output_file
+
+
+class ChartWorker:
+    """
+    Renders comparison charts in a background process.
+
+    The worker keeps its chart templates between jobs, and matplotlib is
+    only ever imported there, so the monitor process pays neither the
+    import nor the drawing time.
+    """
+
+    def __init__(self):
+        # Start before any threads (e.g. MonitorCore's executor) exist;
+        # fork keeps script-style entry points from being re-executed
+        context = multiprocessing.get_context('fork')
+        self.pool = context.Pool(processes=1, initializer=_init_worker)
+
+    def submit(self, data: dict, output_file: str, dpi: int = 100, callback=None):
+        """
+        Queue a chart (comparison_data() output); returns immediately
+        callback: Called with output_file once it is written
+        Returns: multiprocessing AsyncResult
+        """
+        return self.pool.apply_async(_render_job, (data, output_file, dpi), callback=callback)
+
+    def close(self):
+        """Finish queued charts and stop the worker"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def benchmark(charts: int = 10):
+    """Print the time per chart for a fresh figure vs the reused template"""
+    import random
+
+    before = [(pid, 0, 0, 0.0, random.random()) for pid in range(1, 200)]
+    after = [(pid, cpu, packets, energy, carbon * 0.7) for pid, cpu, packets, energy, carbon in before]
+    names = {pid: f"proc{pid}" for pid, _, _, _, _ in before}
+    data = comparison_data(before, after, names=names)
+    output = 'benchmark_chart.png'
+
+    print(f"📏 Chart rendering ({charts} charts)")
+    if MATPLOTLIB_AVAILABLE:
+        start = time.perf_counter()
+        for _ in range(charts):
+            renderer = ComparisonChartRenderer()
+            renderer.render(data, output)
+            renderer.close()
+        print(f"   New figure per chart:  {(time.perf_counter() - start) / charts * 1000:8.1f} ms")
+
+        renderer = ComparisonChartRenderer()
+        start = time.perf_counter()
+        for _ in range(charts):
+            renderer.render(data, output)
+        print(f"   Reused template:       {(time.perf_counter() - start) / charts * 1000:8.1f} ms")
+        renderer.close()
+        os.remove(output)
+
+    start = time.perf_counter()
+    for _ in range(charts):
+        comparison_html(data)
+    print(f"   HTML/SVG (no matplotlib): {(time.perf_counter() - start) / charts * 1000:5.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -119,6 +119,14 @@ else
     exit 1
 fi
 
+if python3 -c "import numpy" 2>/dev/null; then
+    echo -e "${GREEN}✓${NC} python3-numpy installed"
+else
+    echo -e "${RED}✗${NC} python3-numpy not found"
+    echo "  Install with: sudo apt-get install python3-numpy"
+    exit 1
+fi
+
 # Check optional dependencies
 if command -v cpulimit &> /dev/null; then
     echo -e "${GREEN}✓${NC} cpulimit installed (optional)"
@@ -51,6 +51,15 @@ else
     exit 1
 fi
 
+# Check numpy
+if python3 -c "import numpy" 2>/dev/null; then
+    echo -e "${GREEN}✓${NC} python3-numpy installed"
+else
+    echo -e "${RED}✗${NC} python3-numpy not found"
+    echo "  Install with: sudo apt-get install python3-numpy"
+    exit 1
+fi
+
 # Check cpulimit (optional)
 if command -v cpulimit &> /dev/null; then
     echo -e "${GREEN}✓${NC} cpulimit installed (optional)"
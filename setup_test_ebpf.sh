@@ -162,20 +162,16 @@ echo ""
 
 # Step 8: Check eBPF Files
 echo -e "${YELLOW}Step 8: Checking eBPF Source Files...${NC}"
-if [ -f "eBPF/cpu_monitor.c" ]; then
-    echo -e "${GREEN}✓ eBPF/cpu_monitor.c found${NC}"
-else
-    echo -e "${RED}✗ eBPF/cpu_monitor.c not found${NC}"
-    echo "Make sure you're in the project directory"
-    exit 1
-fi
-
-if [ -f "eBPF/net_monitor.c" ]; then
-    echo -e "${GREEN}✓ eBPF/net_monitor.c found${NC}"
-else
-    echo -e "${RED}✗ eBPF/net_monitor.c not found${NC}"
-    exit 1
-fi
+# Compiled together as one program (see pycode/ebpf_loader.py)
+for source in task_stats.h cpu_monitor.c net_monitor.c io_monitor.c; do
+    if [ -f "eBPF/$source" ]; then
+        echo -e "${GREEN}✓ eBPF/$source found${NC}"
+    else
+        echo -e "${RED}✗ eBPF/$source not found${NC}"
+        echo "Make sure you're in the project directory"
+        exit 1
+    fi
+done
 echo ""
 
 # Step 9: Test eBPF Compilation
@@ -185,10 +181,11 @@ echo "  This may take a few seconds..."
 if python3 << 'EOF' 2>&1 | grep -q "SUCCESS"
 import sys
 sys.path.insert(0, '/usr/lib/python3/dist-packages')
+sys.path.insert(0, 'pycode')
 try:
-    from bcc import BPF
-    bpf_cpu = BPF(src_file="eBPF/cpu_monitor.c")
-    bpf_net = BPF(src_file="eBPF/net_monitor.c")
+    # The probes share task_stats.h, so they only compile as one program
+    from ebpf_loader import load_carbon_monitor
+    bpf = load_carbon_monitor()
     print("SUCCESS")
 except Exception as e:
     print(f"ERROR: {e}")